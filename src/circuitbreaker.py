@@ -0,0 +1,183 @@
+"""
+circuitbreaker.py
+-----------------
+Latency-aware circuit breaker for the consumer's dependencies.
+
+CLOSED     every call is admitted; outcomes land in a rolling window of the
+           last `window_size` calls. The circuit opens when the window (with at
+           least `min_calls` entries) exceeds `failure_rate_threshold` failures
+           or `slow_call_rate_threshold` slow calls (latency above
+           `slow_call_sec`), or after `fail_threshold` consecutive failures.
+OPEN       calls are rejected for `open_duration_sec`.
+HALF_OPEN  up to `half_open_probes` probe calls are admitted; all of them
+           succeeding quickly closes the circuit, any failure re-opens it.
+
+Each breaker also keeps recent latencies for p50/p95/p99 reporting.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        fail_threshold: int = 5,
+        window_size: int = 20,
+        min_calls: int = 10,
+        failure_rate_threshold: float = 0.5,
+        slow_call_sec: float = 0.0,
+        slow_call_rate_threshold: float = 0.5,
+        open_duration_sec: float = 60,
+        half_open_probes: int = 3,
+        latency_samples: int = 500,
+    ):
+        self.name = name
+        self.fail_threshold = fail_threshold
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_sec = slow_call_sec
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_duration_sec = open_duration_sec
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        # (failed, slow) per call
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._latencies: Deque[float] = deque(maxlen=latency_samples)
+        self._probes_started = 0
+        self._probes_succeeded = 0
+
+    # ---- state ----
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected (does not consume a half-open probe)."""
+        return self.state == OPEN
+
+    def allow_request(self) -> bool:
+        """Admit a call; in HALF_OPEN only the first `half_open_probes` calls get through."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes_started < self.half_open_probes:
+                self._probes_started += 1
+                return True
+            return False
+
+    # ---- outcomes ----
+
+    def record_success(self, latency_sec: Optional[float] = None):
+        slow = bool(self.slow_call_sec and latency_sec is not None and latency_sec > self.slow_call_sec)
+        with self._lock:
+            self._record(False, slow, latency_sec)
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                if slow:
+                    self._open(f"slow probe ({latency_sec:.2f}s)")
+                    return
+                self._probes_succeeded += 1
+                if self._probes_succeeded >= self.half_open_probes:
+                    self._close()
+                return
+            self._evaluate()
+
+    def record_failure(self, latency_sec: Optional[float] = None):
+        with self._lock:
+            self._record(True, False, latency_sec)
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN:
+                self._open("probe failed")
+                return
+            self._evaluate()
+
+    # ---- statistics ----
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._window)
+            failures = sum(1 for failed, _ in self._window if failed)
+            slow = sum(1 for _, is_slow in self._window if is_slow)
+            latencies = sorted(self._latencies)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "calls": calls,
+                "failure_rate": failures / calls if calls else 0.0,
+                "slow_call_rate": slow / calls if calls else 0.0,
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "p99": _percentile(latencies, 99),
+            }
+
+    # ---- internals (lock held) ----
+
+    def _record(self, failed: bool, slow: bool, latency_sec: Optional[float]):
+        self._window.append((failed, slow))
+        if latency_sec is not None:
+            self._latencies.append(latency_sec)
+
+    def _evaluate(self):
+        if self._state != CLOSED:
+            return
+        if self.fail_threshold and self._consecutive_failures >= self.fail_threshold:
+            self._open(f"{self._consecutive_failures} consecutive failures")
+            return
+        calls = len(self._window)
+        if calls < self.min_calls:
+            return
+        failure_rate = sum(1 for failed, _ in self._window if failed) / calls
+        slow_rate = sum(1 for _, slow in self._window if slow) / calls
+        if failure_rate >= self.failure_rate_threshold:
+            self._open(f"failure rate {failure_rate:.0%} over last {calls} calls")
+        elif self.slow_call_sec and slow_rate >= self.slow_call_rate_threshold:
+            self._open(f"slow-call rate {slow_rate:.0%} (> {self.slow_call_sec}s) over last {calls} calls")
+
+    def _open(self, reason: str):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        latencies = sorted(self._latencies)
+        logger.error(
+            f"Circuit breaker [{self.name}] OPEN for {self.open_duration_sec}s: {reason} "
+            f"(p50={_percentile(latencies, 50)} p95={_percentile(latencies, 95)} p99={_percentile(latencies, 99)})"
+        )
+
+    def _close(self):
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._window.clear()
+        logger.info(f"Circuit breaker [{self.name}] CLOSED after {self.half_open_probes} successful probe(s)")
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_duration_sec:
+            self._state = HALF_OPEN
+            self._probes_started = 0
+            self._probes_succeeded = 0
+            logger.info(f"Circuit breaker [{self.name}] HALF-OPEN: admitting {self.half_open_probes} probe(s)")
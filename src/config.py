@@ -37,6 +37,22 @@ class Config:
     DLQ_ENABLED=os.getenv("DLQ_ENABLED")
     DLX_EXCHANGE=os.getenv("DLX_EXCHANGE")
     DLQ_ROUTING_KEY=os.getenv("DLQ_ROUTING_KEY")
+    QUEUE_MAX_PRIORITY = int(os.getenv("QUEUE_MAX_PRIORITY", "0"))  # >0 declares QUEUE as a priority queue
+    APP_PRIORITY_WEIGHTS = os.getenv("APP_PRIORITY_WEIGHTS", "")  # e.g. "orders-api=3,billing=2"
+    # Per-application fair scheduling (0 = single shared QUEUE)
+    APP_QUEUE_SHARDS = int(os.getenv("APP_QUEUE_SHARDS", "0"))
+    APP_SHARD_MAP = os.getenv("APP_SHARD_MAP", "")  # pin apps to shards, e.g. "orders-api=0,billing=1"
+    SHARD_WEIGHTS = os.getenv("SHARD_WEIGHTS", "")  # DRR weight per shard, e.g. "0=2,1=1" (default 1)
+    SHARD_MAX_INFLIGHT = int(os.getenv("SHARD_MAX_INFLIGHT", "0"))  # unacked deliveries per shard (0 = no cap)
+    # Message envelope: compression and claim check for oversized descriptions
+    MESSAGE_COMPRESSION = os.getenv("MESSAGE_COMPRESSION", "none").lower()  # none | gzip | zstd
+    MESSAGE_COMPRESS_MIN_BYTES = int(os.getenv("MESSAGE_COMPRESS_MIN_BYTES", "4096"))
+    CLAIM_CHECK_THRESHOLD_BYTES = int(os.getenv("CLAIM_CHECK_THRESHOLD_BYTES", "0"))  # 0 = always inline
+    CLAIM_CHECK_RETENTION_HOURS = int(os.getenv("CLAIM_CHECK_RETENTION_HOURS", "72"))
+    # Consistent-hash routing by error fingerprint (requires the rabbitmq_consistent_hash_exchange plugin)
+    CONSISTENT_HASH_EXCHANGE = os.getenv("CONSISTENT_HASH_EXCHANGE", "")  # exchange name; empty = off
+    CONSUMER_REPLICA_QUEUE = os.getenv("CONSUMER_REPLICA_QUEUE", "")  # stable per replica; required with the exchange
+    CONSUMER_HASH_WEIGHT = int(os.getenv("CONSUMER_HASH_WEIGHT", "10"))  # share of the hash ring
     # ELK (legacy — kept for backward compatibility)
     ELK_SEARCH_URL = os.getenv("ELK_SEARCH_URL")
     ELK_APIKEY = os.getenv("ELK_APIKEY")
@@ -72,6 +88,17 @@ class Config:
     # Configurable Limits
     GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "models/embedding-001")
     PRESIDIO_SCORE_THRESHOLD = float(os.getenv("PRESIDIO_SCORE_THRESHOLD", "0.8"))
+    SANITIZER_NER_POLICY = os.getenv("SANITIZER_NER_POLICY", "always").lower()  # always | auto (regex prefilter first)
+    SANITIZER_BATCH_SIZE = int(os.getenv("SANITIZER_BATCH_SIZE", "32"))  # texts per spaCy nlp.pipe batch
+    SANITIZER_POOL_PROCESSES = int(os.getenv("SANITIZER_POOL_PROCESSES", "0"))  # >0: batch masking in a process pool
+    SANITIZER_CACHE_ENABLED = os.getenv("SANITIZER_CACHE_ENABLED", "true").lower() == "true"  # false for audit runs
+    SANITIZER_CACHE_MAX_BYTES = int(os.getenv("SANITIZER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    SANITIZER_TEMPLATE_CACHE = os.getenv("SANITIZER_TEMPLATE_CACHE", "false").lower() == "true"  # reuse spans per log template
+    SANITIZER_MAX_INPUT_BYTES = int(os.getenv("SANITIZER_MAX_INPUT_BYTES", "65536"))  # collapse stack frames / truncate above (0 = off)
+    SANITIZER_CHUNK_SIZE = int(os.getenv("SANITIZER_CHUNK_SIZE", "10000"))  # analyze longer texts in windows (0 = off)
+    SANITIZER_CHUNK_OVERLAP = int(os.getenv("SANITIZER_CHUNK_OVERLAP", "500"))
+    SANITIZER_TIME_BUDGET_SECONDS = float(os.getenv("SANITIZER_TIME_BUDGET_SECONDS", "5"))  # per message, chunked mode (0 = off)
+    SANITIZER_RECOGNIZER_TIMEOUT_MS = int(os.getenv("SANITIZER_RECOGNIZER_TIMEOUT_MS", "250"))  # per custom recognizer call (0 = off)
     HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
     HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
     RABBIT_RETRIES = int(os.getenv("RABBIT_RETRIES", "3"))
@@ -79,7 +106,86 @@ class Config:
     RABBIT_CONNECTION_TIMEOUT = int(os.getenv("RABBIT_CONNECTION_TIMEOUT", "10"))
     MAX_RETRIES_PER_MESSAGE = int(os.getenv("MAX_RETRIES_PER_MESSAGE", "2"))
     RATE_LIMIT_DELAY = int(os.getenv("RATE_LIMIT_DELAY", "60"))
-    
+
+    # Request timeouts and per-message time budget (MESSAGE_DEADLINE_SECONDS=0 = unbounded)
+    GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "120"))
+    GEMINI_PROMPT_CACHE = os.getenv("GEMINI_PROMPT_CACHE", "false").lower() == "true"  # cache the static system prompt provider-side
+    GEMINI_PROMPT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_PROMPT_CACHE_TTL_SECONDS", "3600"))
+    GEMINI_RESPONSE_SCHEMA = os.getenv("GEMINI_RESPONSE_SCHEMA", "true").lower() == "true"  # schema-constrained JSON output
+    GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "false").lower() == "true"  # stream and stop once the JSON closes
+    GEMINI_FIRST_TOKEN_TIMEOUT_SECONDS = float(os.getenv("GEMINI_FIRST_TOKEN_TIMEOUT_SECONDS", "30"))  # streaming only (0 = total timeout)
+    QDRANT_TIMEOUT_SECONDS = int(os.getenv("QDRANT_TIMEOUT_SECONDS", "10"))
+    MESSAGE_DEADLINE_SECONDS = int(os.getenv("MESSAGE_DEADLINE_SECONDS", "0"))  # carried across retries
+    STAGE_TIMEOUTS = os.getenv("STAGE_TIMEOUTS", "qdrant=10,llm=90,email=30")  # per-call slice of the budget
+    MIN_STAGE_SECONDS = float(os.getenv("MIN_STAGE_SECONDS", "1"))  # fail fast below this much budget left
+
+    # Circuit breakers (per dependency: db, qdrant, llm, email)
+    CB_WINDOW_SIZE = int(os.getenv("CB_WINDOW_SIZE", "20"))  # rolling window of recent calls
+    CB_MIN_CALLS = int(os.getenv("CB_MIN_CALLS", "10"))  # calls needed before rates are evaluated
+    CB_FAILURE_RATE = float(os.getenv("CB_FAILURE_RATE", "0.5"))
+    CB_SLOW_CALL_SECONDS = os.getenv("CB_SLOW_CALL_SECONDS", "db=2,qdrant=2,llm=45,email=15")
+    CB_SLOW_CALL_RATE = float(os.getenv("CB_SLOW_CALL_RATE", "0.5"))
+    CB_OPEN_SECONDS = float(os.getenv("CB_OPEN_SECONDS", "30"))
+    CB_HALF_OPEN_PROBES = int(os.getenv("CB_HALF_OPEN_PROBES", "3"))
+    CB_STATS_LOG_SECONDS = int(os.getenv("CB_STATS_LOG_SECONDS", "300"))  # 0 = don't log latency stats
+
+    # Retry budgets: retries per dependency capped at a fraction of recent successes
+    RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+    RETRY_BUDGET_MIN_RETRIES = int(os.getenv("RETRY_BUDGET_MIN_RETRIES", "3"))  # always allowed per window
+    RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("RETRY_BUDGET_WINDOW_SECONDS", "10"))
+    RETRY_BACKOFF_BASE_SECONDS = float(os.getenv("RETRY_BACKOFF_BASE_SECONDS", "1"))  # in-call retries
+    RETRY_BACKOFF_CAP_SECONDS = float(os.getenv("RETRY_BACKOFF_CAP_SECONDS", "10"))
+    MESSAGE_RETRY_BACKOFF_BASE_SECONDS = float(os.getenv("MESSAGE_RETRY_BACKOFF_BASE_SECONDS", "10"))  # republish
+    MESSAGE_RETRY_BACKOFF_CAP_SECONDS = float(os.getenv("MESSAGE_RETRY_BACKOFF_CAP_SECONDS", "60"))
+
+    # Consumer micro-batching (CONSUMER_BATCH_SIZE=1 keeps one-message-at-a-time mode)
+    CONSUMER_BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", "1"))
+    CONSUMER_BATCH_WAIT_MS = int(os.getenv("CONSUMER_BATCH_WAIT_MS", "200"))
+    LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+    # Consumer topology: "single" callback or "staged" sanitize/retrieve/generate/persist/notify pipeline
+    CONSUMER_TOPOLOGY = os.getenv("CONSUMER_TOPOLOGY", "single").lower()
+    CONSUMER_STAGES = os.getenv("CONSUMER_STAGES", "sanitize,retrieve,generate,persist,notify")  # stages run by this process
+    CONSUMER_STAGE_WORKERS = os.getenv("CONSUMER_STAGE_WORKERS", "")  # e.g. "retrieve=2,generate=8"
+    SANITIZE_WORKER_PROCESSES = int(os.getenv("SANITIZE_WORKER_PROCESSES", "0"))
+    CONSUMER_PREFORK_WORKERS = int(os.getenv("CONSUMER_PREFORK_WORKERS", "0"))  # >0: fork consumers sharing one preloaded sanitizer
+
+    # Fast path: use an ops-verified vector match directly above this score (0 = always call the LLM; e.g. 0.97 to opt in)
+    LLM_SKIP_SCORE_THRESHOLD = float(os.getenv("LLM_SKIP_SCORE_THRESHOLD", "0"))
+    LLM_FAST_PATH_ENRICH = os.getenv("LLM_FAST_PATH_ENRICH", "false").lower() == "true"  # background LLM pass afterwards
+
+    # Load shedding: answer from cache (no LLM) when the backlog is deep (0 = trigger disabled)
+    OVERLOAD_QUEUE_DEPTH = int(os.getenv("OVERLOAD_QUEUE_DEPTH", "0"))
+    OVERLOAD_MESSAGE_AGE_SECONDS = int(os.getenv("OVERLOAD_MESSAGE_AGE_SECONDS", "0"))
+    OVERLOAD_CHECK_INTERVAL_SECONDS = int(os.getenv("OVERLOAD_CHECK_INTERVAL_SECONDS", "10"))
+    OVERLOAD_REQUEUE_FULL_ANALYSIS = os.getenv("OVERLOAD_REQUEUE_FULL_ANALYSIS", "true").lower() == "true"
+
+    # Single-flight coalescing of identical in-flight errors
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    SINGLE_FLIGHT_CROSS_PROCESS = os.getenv("SINGLE_FLIGHT_CROSS_PROCESS", "false").lower() == "true"  # Postgres advisory lock
+    SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS = int(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS", "120"))
+
+    # Consumer-side idempotency: claim (app, code, fingerprint, time bucket) before any LLM work
+    IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "false").lower() == "true"  # needs the README migration
+    IDEMPOTENCY_BUCKET_MINUTES = int(os.getenv("IDEMPOTENCY_BUCKET_MINUTES", os.getenv("DB_DUPLICATE_WINDOW_MINUTES", "10")))
+    IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS = int(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS", "900"))  # unfinished claims older than this are taken over
+
+    # Batched persistence: group-commit row writes from concurrent workers (1 = one statement per row)
+    DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "1"))
+    DB_WRITE_FLUSH_MS = int(os.getenv("DB_WRITE_FLUSH_MS", "5"))
+
+    # Proactive Gemini rate limiting (0 = unlimited for that budget)
+    GEMINI_RATE_LIMIT_MODE = os.getenv("GEMINI_RATE_LIMIT_MODE", "off").lower()  # off | local | postgres
+    GEMINI_GEN_RPM = int(os.getenv("GEMINI_GEN_RPM", "0"))
+    GEMINI_GEN_TPM = int(os.getenv("GEMINI_GEN_TPM", "0"))
+    GEMINI_EMBED_RPM = int(os.getenv("GEMINI_EMBED_RPM", "0"))
+    GEMINI_EMBED_TPM = int(os.getenv("GEMINI_EMBED_TPM", "0"))
+    RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "60"))
+
+    # Prompt token budgets for the variable parts of the Gemini prompt (0 = no limit)
+    LLM_CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "2000"))
+    LLM_DESCRIPTION_TOKEN_BUDGET = int(os.getenv("LLM_DESCRIPTION_TOKEN_BUDGET", "1500"))
+
     # Email sender filter - only process emails from this address
     EMAIL_SENDER_FILTER = os.getenv("EMAIL_SENDER_FILTER", "veerlapatisaivishwanadh@prowesssoft.com")
 
@@ -0,0 +1,154 @@
+"""
+dbwriter.py
+-----------
+Group-commit writer for the consumer's hot-path row writes.
+
+Worker threads hand their row to a BatchWriter and block; a single writer
+thread collects rows for up to `flush_interval_ms` (or `max_rows`) and writes
+them with ONE multi-row statement (psycopg2 execute_values) and one commit on
+a persistent connection. Each row's generated id is mapped back to its caller
+through a per-row key column (the message sessionid), so ordering of the
+RETURNING rows doesn't matter.
+
+The statement must contain a single `VALUES %s` and return `id` and
+`batch_key` columns, e.g.
+
+    INSERT INTO t (a, b, sessionid) VALUES %s RETURNING id, sessionid AS batch_key
+
+A failed batch is retried row by row, so one bad row only fails its own
+caller. A caller that times out before its row was sent gets a plain
+TimeoutError and the row is dropped (safe to resend); once the batch is in
+flight it gets BatchWriteTimeout, because the row may still commit.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from psycopg2.extras import RealDictCursor, execute_values
+
+from src.structuraldb import DB
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriteTimeout(TimeoutError):
+    """The row's batch was sent but not confirmed in time; it may still commit, so don't resend it."""
+
+
+class _PendingRow:
+    def __init__(self, params: Tuple):
+        self.params = params
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.sent = False  # handed to the database; set under BatchWriter._lock
+        self.cancelled = False  # caller gave up before it was sent
+
+
+class BatchWriter:
+    """Buffers rows from concurrent callers and flushes them as one statement."""
+
+    def __init__(self, name: str, sql: str, key_index: int, max_rows: int = 100, flush_interval_ms: int = 5):
+        self.name = name
+        self.sql = sql
+        self.key_index = key_index
+        self.max_rows = max_rows
+        self.flush_interval_sec = flush_interval_ms / 1000.0
+        self._queue: "queue.Queue[_PendingRow]" = queue.Queue()
+        self._db: Optional[DB] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def write(self, params: Tuple, timeout_sec: float = 30.0) -> Any:
+        """Queue one row and block until its batch is committed; returns the row's id."""
+        self._ensure_started()
+        row = _PendingRow(params)
+        self._queue.put(row)
+        if not row.done.wait(timeout_sec):
+            with self._lock:
+                if not row.sent:
+                    row.cancelled = True
+                    raise TimeoutError(f"{self.name}: batched write not started within {timeout_sec}s")
+            if not row.done.is_set():
+                raise BatchWriteTimeout(
+                    f"{self.name}: batched write sent but not committed within {timeout_sec}s; it may still commit"
+                )
+        if row.error is not None:
+            raise row.error
+        return row.result
+
+    def _ensure_started(self):
+        # started lazily so forked worker processes get their own thread and connection
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch: List[_PendingRow] = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval_sec
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self._lock:
+                batch = [pending for pending in batch if not pending.cancelled]
+                for pending in batch:
+                    pending.sent = True
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch: List[_PendingRow]):
+        try:
+            self._write_rows(batch)
+            logger.debug(f"{self.name}: flushed {len(batch)} row(s)")
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"{self.name}: batched write failed: {e}")
+                batch[0].error = e
+                return
+            # one bad row rolls back the whole statement: write the rows one by one so it only fails its caller
+            logger.warning(f"{self.name}: batched write of {len(batch)} row(s) failed ({e}) - retrying row by row")
+            for pending in batch:
+                try:
+                    self._write_rows([pending])
+                except Exception as row_error:
+                    logger.error(f"{self.name}: row write failed: {row_error}")
+                    pending.error = row_error
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def _write_rows(self, rows: List[_PendingRow]):
+        """One multi-row statement and commit; sets each row's id."""
+        if self._db is None or self._db.conn is None or self._db.conn.closed:
+            self._db = DB()
+        conn = self._db.conn
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                returned = execute_values(
+                    cur, self.sql, [r.params for r in rows], page_size=len(rows), fetch=True
+                )
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                # connection is gone: reconnect on the next write
+                self._db.close()
+                self._db = None
+            raise
+        ids = {r['batch_key']: r['id'] for r in returned}
+        for pending in rows:
+            pending.result = ids.get(pending.params[self.key_index])
@@ -0,0 +1,83 @@
+"""
+deadline.py
+-----------
+Per-message deadline shared by every stage of the consumer pipeline.
+
+A message gets an absolute deadline (epoch seconds) on first delivery —
+MESSAGE_DEADLINE_SECONDS from then — carried in the `x-deadline` header
+across retries and in the message state between staged workers. Before
+calling a dependency the consumer asks for that stage's timeout: its slice
+from STAGE_TIMEOUTS capped by what is left of the deadline. When the rest of
+the budget can't cover even MIN_STAGE_SECONDS the stage fails fast with
+DeadlineExceeded instead of starting work that will be too late anyway.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = "x-deadline"
+
+
+class DeadlineExceeded(Exception):
+    """The message's time budget can't cover the next stage."""
+
+
+def _parse_budgets(spec: str) -> Dict[str, float]:
+    budgets: Dict[str, float] = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            try:
+                budgets[name.strip()] = float(value)
+            except ValueError:
+                logger.warning(f"Ignoring invalid stage timeout '{item}'")
+    return budgets
+
+
+STAGE_BUDGETS = _parse_budgets(Config.STAGE_TIMEOUTS)
+
+_local = threading.local()
+
+
+def message_deadline(properties=None, now: Optional[float] = None) -> Optional[float]:
+    """Deadline carried by a delivery, or a fresh one starting now (None when disabled)."""
+    headers = getattr(properties, "headers", None) or {}
+    if headers.get(DEADLINE_HEADER):
+        return float(headers[DEADLINE_HEADER])
+    if Config.MESSAGE_DEADLINE_SECONDS <= 0:
+        return None
+    return (now or time.time()) + Config.MESSAGE_DEADLINE_SECONDS
+
+
+def start(deadline_at: Optional[float]):
+    """Make `deadline_at` the current thread's deadline (None = unbounded)."""
+    _local.deadline_at = deadline_at
+
+
+def current() -> Optional[float]:
+    return getattr(_local, "deadline_at", None)
+
+
+def remaining() -> Optional[float]:
+    deadline_at = current()
+    return None if deadline_at is None else deadline_at - time.time()
+
+
+def stage_timeout(stage: str) -> Optional[float]:
+    """
+    Timeout for the next call to `stage` ("qdrant", "llm", "email", ...):
+    its configured slice, capped by the remaining message budget.
+    """
+    budget = STAGE_BUDGETS.get(stage)
+    left = remaining()
+    if left is None:
+        return budget
+    if left < Config.MIN_STAGE_SECONDS:
+        raise DeadlineExceeded(f"{stage}: {max(left, 0):.1f}s left of the message budget")
+    return min(budget, left) if budget else left
@@ -4,6 +4,7 @@ from langchain_core.embeddings import Embeddings
 from google import genai
 from google.genai import types
 from src.config import Config
+from src.ratelimit import get_rate_limiter, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -16,21 +17,28 @@ class GoogleGenAIEmbeddings(Embeddings):
         self.client = genai.Client(api_key=api_key)
         self.model = model
         self.output_dimensionality = output_dimensionality
+        self.rate_limiter = get_rate_limiter("embedding")
+
+    # Gemini batchEmbedContents accepts at most 100 inputs per request
+    MAX_BATCH_SIZE = 100
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        # Batch embedding not straightforward in simple client usage without loop or batch calls
-        # For simplicity and correctness with the new SDK:
+        # One embed_content request per chunk of texts instead of one per text
         embeddings = []
-        for text in texts:
+        for start in range(0, len(texts), self.MAX_BATCH_SIZE):
+            chunk = texts[start:start + self.MAX_BATCH_SIZE]
+            # every input of a batch counts as one request against the RPM quota
+            self.rate_limiter.acquire(sum(estimate_tokens(t) for t in chunk), requests=len(chunk))
             result = self.client.models.embed_content(
                 model=self.model,
-                contents=text,
+                contents=chunk,
                 config=types.EmbedContentConfig(output_dimensionality=self.output_dimensionality)
             )
-            embeddings.append(result.embeddings[0].values)
+            embeddings.extend(e.values for e in result.embeddings)
         return embeddings
 
     def embed_query(self, text: str) -> List[float]:
+        self.rate_limiter.acquire(estimate_tokens(text))
         result = self.client.models.embed_content(
             model=self.model,
             contents=text,
@@ -60,3 +68,13 @@ class EmbeddingGenerator:
         except Exception as e:
             logger.error(f"Failed to generate embedding: {e}")
             raise
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts in batched requests"""
+        if not texts:
+            return []
+        try:
+            return self.embeddings.embed_documents(texts)
+        except Exception as e:
+            logger.error(f"Failed to generate batch embeddings: {e}")
+            raise
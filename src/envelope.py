@@ -0,0 +1,148 @@
+"""
+envelope.py
+-----------
+Wire format of error messages between the extractor and the consumer.
+
+Version 1 envelope
+  - body is compact JSON (no whitespace)
+  - optionally compressed (MESSAGE_COMPRESSION=gzip|zstd) once it reaches
+    MESSAGE_COMPRESS_MIN_BYTES; the codec is named in `content_encoding`
+  - header x-envelope-version: 1
+  - descriptions above CLAIM_CHECK_THRESHOLD_BYTES are parked in the
+    `message_blobs` table and replaced by `descriptionRef` (claim check)
+
+Messages without the header or content_encoding are the legacy plain JSON
+format and decode unchanged, so old and new publishers can share the queue.
+The consumer's staged topology uses the same envelope for its hand-offs.
+"""
+
+import gzip
+import json
+import logging
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import Config
+from src.structuraldb import DB
+
+try:
+    import zstandard
+except ImportError:  # optional codec
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = "x-envelope-version"
+
+_blob_table_ready = False
+
+
+# ---- compression ----
+
+def compress(body: bytes, codec: str) -> Tuple[bytes, Optional[str]]:
+    """Compress `body` with `codec`; returns (body, content_encoding)."""
+    if codec == "zstd":
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+        logger.warning("zstandard not installed - falling back to gzip")
+        codec = "gzip"
+    if codec == "gzip":
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+def decompress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    if not content_encoding:
+        return body
+    if content_encoding == "gzip":
+        return gzip.decompress(body)
+    if content_encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd-encoded message but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    raise ValueError(f"Unsupported content_encoding '{content_encoding}'")
+
+
+# ---- claim check ----
+
+def _ensure_blob_table(db: DB):
+    global _blob_table_ready
+    if _blob_table_ready:
+        return
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS message_blobs (
+            id TEXT PRIMARY KEY,
+            body TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    _blob_table_ready = True
+
+
+def store_blob(text: str) -> str:
+    """Park `text` in Postgres and return its claim-check id."""
+    blob_id = str(uuid.uuid4())
+    with DB() as db:
+        _ensure_blob_table(db)
+        db.execute("INSERT INTO message_blobs (id, body) VALUES (%s, %s)", (blob_id, text))
+    return blob_id
+
+
+def load_blob(blob_id: str) -> str:
+    with DB() as db:
+        rows = db.execute("SELECT body FROM message_blobs WHERE id = %s", (blob_id,), fetch=True)
+    if not rows:
+        raise LookupError(f"Claim-check blob {blob_id} not found (expired?)")
+    return rows[0]["body"]
+
+
+def purge_expired_blobs(retention_hours: int) -> int:
+    """Delete claim-check blobs older than `retention_hours`; returns the number removed."""
+    with DB() as db:
+        _ensure_blob_table(db)
+        rows = db.execute(
+            "DELETE FROM message_blobs WHERE created_at < CURRENT_TIMESTAMP - INTERVAL '1 hour' * %s RETURNING id",
+            (retention_hours,),
+            fetch=True
+        )
+    return len(rows or [])
+
+
+# ---- envelope ----
+
+def check_in(payload: Dict[str, Any], field: str = "description") -> Dict[str, Any]:
+    """
+    Copy of `payload` with `field` parked in Postgres and replaced by
+    `<field>Ref` when it exceeds CLAIM_CHECK_THRESHOLD_BYTES.
+    """
+    payload = dict(payload)
+    text = payload.get(field) or ""
+    threshold = Config.CLAIM_CHECK_THRESHOLD_BYTES
+    if threshold and len(text.encode("utf-8")) > threshold:
+        payload[f"{field}Ref"] = store_blob(text)
+        payload[field] = ""
+    return payload
+
+
+def encode(payload: Dict[str, Any]) -> Tuple[bytes, Optional[str], Dict[str, Any]]:
+    """Build a v1 message: returns (body, content_encoding, headers)."""
+    payload = check_in(payload)
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    content_encoding = None
+    if Config.MESSAGE_COMPRESSION != "none" and len(body) >= Config.MESSAGE_COMPRESS_MIN_BYTES:
+        body, content_encoding = compress(body, Config.MESSAGE_COMPRESSION)
+    return body, content_encoding, {ENVELOPE_HEADER: ENVELOPE_VERSION}
+
+
+def decode(body: bytes, content_encoding: Optional[str] = None) -> Dict[str, Any]:
+    """Parse a legacy or v1 message body. Claim checks are resolved separately."""
+    return json.loads(decompress(body, content_encoding).decode("utf-8"))
+
+
+def resolve_claim_check(payload: Dict[str, Any], field: str = "description") -> Dict[str, Any]:
+    """Swap a `<field>Ref` (e.g. `descriptionRef`) back for the stored text (in place)."""
+    blob_id = payload.pop(f"{field}Ref", None)
+    if blob_id:
+        payload[field] = load_blob(blob_id)
+    return payload
@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import math
 import signal
 import sys
 import psycopg2
@@ -15,6 +16,12 @@ import pika
 
 from src.config import Config
 from src.service_alert import ServiceAlertNotifier
+from src.fairqueue import (
+    sharding_enabled, all_shard_queues, shard_binding_key, app_routing_key, check_shard_exchange,
+    consistent_hash_enabled, CONSISTENT_HASH_EXCHANGE_TYPE
+)
+from src.fingerprint import error_fingerprint
+from src import envelope
 
 # Setup logging
 logging.basicConfig(
@@ -76,6 +83,80 @@ def get_persistent_db() -> psycopg2.extensions.connection:
 # RabbitMQ connection helpers
 # ---------------------------------------------------------------------------
 
+def queue_arguments() -> Optional[Dict[str, Any]]:
+    """Queue declare arguments; enables a priority queue when QUEUE_MAX_PRIORITY > 0."""
+    if Config.QUEUE_MAX_PRIORITY > 0:
+        return {"x-max-priority": Config.QUEUE_MAX_PRIORITY}
+    return None
+
+
+def parse_app_priority_weights(spec: str) -> Dict[str, int]:
+    """'orders-api=3,billing=2' -> {'orders-api': 3, 'billing': 2}"""
+    weights: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, weight = item.rsplit("=", 1)
+            try:
+                weights[name.strip()] = int(weight)
+            except ValueError:
+                logger.warning(f"Ignoring invalid APP_PRIORITY_WEIGHTS entry: {item}")
+    return weights
+
+
+_app_priority_weights: Dict[str, int] = parse_app_priority_weights(Config.APP_PRIORITY_WEIGHTS)
+
+
+def compute_message_priority(app_name: str, batch_count: int) -> Optional[int]:
+    """
+    Message priority for the priority queue (None when disabled):
+      - escalation-level errors (batch_count >= HIGH_PRIORITY_THRESHOLD) get the max priority
+      - otherwise 1 + per-application weight + log2(batch_count), capped below the max
+    Priority 0 is left for the consumer's low-priority re-analysis messages.
+    """
+    max_priority = Config.QUEUE_MAX_PRIORITY
+    if max_priority <= 0:
+        return None
+    if batch_count >= Config.HIGH_PRIORITY_THRESHOLD:
+        return max_priority
+    priority = 1 + _app_priority_weights.get(app_name, 0) + int(math.log2(max(batch_count, 1)))
+    return max(1, min(priority, max_priority - 1))
+
+
+def declare_topology(channel):
+    """Declare the exchange and the error queue(s) the consumer reads from."""
+    check_shard_exchange()
+    channel.exchange_declare(
+        exchange=Config.EXCHANGE,
+        exchange_type=Config.EXCHANGE_TYPE,
+        durable=True
+    )
+    channel.queue_declare(queue=Config.QUEUE, durable=True, arguments=queue_arguments())
+    channel.queue_bind(Config.QUEUE, Config.EXCHANGE, Config.ROUTING_KEY)
+    if sharding_enabled():
+        # one queue per application shard so the consumer can schedule apps fairly
+        for i, queue in enumerate(all_shard_queues()):
+            channel.queue_declare(queue=queue, durable=True, arguments=queue_arguments())
+            channel.queue_bind(queue, Config.EXCHANGE, shard_binding_key(i))
+    if consistent_hash_enabled():
+        # consumer replicas declare and bind their own queues to this exchange
+        channel.exchange_declare(
+            exchange=Config.CONSISTENT_HASH_EXCHANGE,
+            exchange_type=CONSISTENT_HASH_EXCHANGE_TYPE,
+            durable=True
+        )
+
+
+def publish_target(payload: Dict[str, Any]) -> Tuple[str, str]:
+    """(exchange, routing_key) for a new error message."""
+    if consistent_hash_enabled():
+        # same fingerprint -> same consumer replica, so its in-process caches stay warm
+        fingerprint = error_fingerprint(payload['applicationName'], payload['code'], payload['description'])
+        return Config.CONSISTENT_HASH_EXCHANGE, fingerprint
+    if sharding_enabled():
+        return Config.EXCHANGE, app_routing_key(payload['applicationName'])
+    return Config.EXCHANGE, Config.ROUTING_KEY
+
+
 def setup_rabbitmq_connection():
     """
     Setup persistent RabbitMQ connection with heartbeat.
@@ -103,13 +184,7 @@ def setup_rabbitmq_connection():
             # Connection alive but channel dead — recreate channel only
             logger.info("RabbitMQ: connection alive, recreating channel...")
             rabbitmq_channel = rabbitmq_connection.channel()
-            rabbitmq_channel.exchange_declare(
-                exchange=Config.EXCHANGE,
-                exchange_type=Config.EXCHANGE_TYPE,
-                durable=True
-            )
-            rabbitmq_channel.queue_declare(queue=Config.QUEUE, durable=True)
-            rabbitmq_channel.queue_bind(Config.QUEUE, Config.EXCHANGE, Config.ROUTING_KEY)
+            declare_topology(rabbitmq_channel)
             logger.info("RabbitMQ channel restored")
             return
 
@@ -125,13 +200,7 @@ def setup_rabbitmq_connection():
         rabbitmq_connection = pika.BlockingConnection(params)
         rabbitmq_channel = rabbitmq_connection.channel()
 
-        rabbitmq_channel.exchange_declare(
-            exchange=Config.EXCHANGE,
-            exchange_type=Config.EXCHANGE_TYPE,
-            durable=True
-        )
-        rabbitmq_channel.queue_declare(queue=Config.QUEUE, durable=True)
-        rabbitmq_channel.queue_bind(Config.QUEUE, Config.EXCHANGE, Config.ROUTING_KEY)
+        declare_topology(rabbitmq_channel)
         logger.info("✅ RabbitMQ connection established (heartbeat=120s)")
 
     except Exception as e:
@@ -738,13 +807,19 @@ def process_cycle():
                     f"(source=elk, doc_id={doc_id}, batch_count={batch_count})"
                 )
                 if rabbitmq_channel:
+                    exchange, routing_key = publish_target(payload)
+                    body, content_encoding, headers = envelope.encode(publish_payload)
                     rabbitmq_channel.basic_publish(
-                        exchange=Config.EXCHANGE,
-                        routing_key=Config.ROUTING_KEY,
-                        body=json.dumps(publish_payload),
+                        exchange=exchange,
+                        routing_key=routing_key,
+                        body=body,
                         properties=pika.BasicProperties(
                             delivery_mode=2,
-                            content_type="application/json"
+                            content_type="application/json",
+                            content_encoding=content_encoding,
+                            headers=headers,
+                            timestamp=int(now_utc.timestamp()),  # enqueue time, used for consumer load shedding
+                            priority=compute_message_priority(payload['applicationName'], batch_count)
                         )
                     )
                     mark_elk_doc_seen(doc_id)
@@ -832,6 +907,16 @@ def process_cycle():
 # Graceful shutdown helpers
 # ---------------------------------------------------------------------------
 
+def purge_claim_check_blobs():
+    """Drop claim-check blobs the consumer can no longer need."""
+    try:
+        removed = envelope.purge_expired_blobs(Config.CLAIM_CHECK_RETENTION_HOURS)
+        if removed:
+            logger.info(f"🧹 Purged {removed} expired claim-check blob(s)")
+    except Exception as e:
+        logger.error(f"Claim-check blob purge failed: {e}")
+
+
 def cleanup_and_exit():
     """Gracefully shut down the scheduler and connections before exiting."""
     logger.info("🛑 Shutting down ELK extractor...")
@@ -904,6 +989,15 @@ if __name__ == "__main__":
         coalesce=True       # Collapse missed executions into a single run
     )
 
+    if Config.CLAIM_CHECK_THRESHOLD_BYTES:
+        scheduler.add_job(
+            purge_claim_check_blobs,
+            "interval",
+            hours=1,
+            max_instances=1,
+            coalesce=True
+        )
+
     logger.info(
         f"⏱️  Scheduler configured — running every {Config.POLL_INTERVAL_SECONDS}s. "
         f"Press CTRL+C to stop."
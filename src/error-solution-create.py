@@ -7,7 +7,13 @@ import sys
 import time
 import datetime
 import re
-from typing import Dict, Any, Optional, Callable, Tuple
+import threading
+import multiprocessing
+import gc
+import weakref
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, Optional, Callable, Tuple, List
 
 import pika
 import requests
@@ -18,8 +24,22 @@ from src.embeddingmodel import EmbeddingGenerator
 from src.structuraldb import DB
 from src.geminicall import GeminiClient
 from src.sendemail import EmailService
-from src.maskdata import LogSanitizer
+from src.maskdata import LogSanitizer, SanitizerPool
 from src.service_alert import ServiceAlertNotifier
+from src.fingerprint import error_fingerprint
+from src.singleflight import SingleFlight, advisory_lock
+from src.loadshed import BacklogMonitor
+from src.dbwriter import BatchWriter, BatchWriteTimeout
+from src import envelope
+from src import deadline
+from src.deadline import DeadlineExceeded
+from src.circuitbreaker import CircuitBreaker
+from src.retrybudget import get_retry_budget, decorrelated_jitter
+from src.fairqueue import (
+    DeficitRoundRobin, sharding_enabled, all_shard_queues, shard_queue,
+    shard_for_app, shard_binding_key, shard_from_routing_key, check_shard_exchange,
+    consistent_hash_enabled, replica_queue, check_replica_queue, CONSISTENT_HASH_EXCHANGE_TYPE
+)
 from src.config import Config
 
 # ---- Logging ----
@@ -37,23 +57,101 @@ EXP_BACKOFF_BASE = 1
 DLX_EXCHANGE = getattr(Config, "DLX_EXCHANGE", None)
 DLQ_ROUTING_KEY = getattr(Config, "DLQ_ROUTING_KEY", None)
 DLQ_ENABLED = bool(DLX_EXCHANGE and DLQ_ROUTING_KEY)
+CONSUMER_BATCH_SIZE = int(getattr(Config, "CONSUMER_BATCH_SIZE", 1) or 1)
+CONSUMER_BATCH_WAIT_MS = int(getattr(Config, "CONSUMER_BATCH_WAIT_MS", 200) or 200)
+LLM_CONCURRENCY = int(getattr(Config, "LLM_CONCURRENCY", 4) or 4)
+BATCH_MODE = CONSUMER_BATCH_SIZE > 1
+CONSUMER_TOPOLOGY = str(getattr(Config, "CONSUMER_TOPOLOGY", "single") or "single").lower()
+CONSUMER_STAGES = getattr(Config, "CONSUMER_STAGES", None) or "sanitize,retrieve,generate,persist,notify"
+CONSUMER_STAGE_WORKERS = getattr(Config, "CONSUMER_STAGE_WORKERS", "") or ""
+SANITIZE_WORKER_PROCESSES = int(getattr(Config, "SANITIZE_WORKER_PROCESSES", 0) or 0)
+SANITIZER_POOL_PROCESSES = int(getattr(Config, "SANITIZER_POOL_PROCESSES", 0) or 0)
+CONSUMER_PREFORK_WORKERS = int(getattr(Config, "CONSUMER_PREFORK_WORKERS", 0) or 0)
+PREFORK_POLL_SECONDS = 1
+# a crashing worker is restarted after a jittered delay that grows up to the max;
+# once it has stayed up PREFORK_HEALTHY_UPTIME_SECONDS its next crash starts over
+PREFORK_RESTART_DELAY_SECONDS = 2
+PREFORK_RESTART_MAX_DELAY_SECONDS = 300
+PREFORK_HEALTHY_UPTIME_SECONDS = 60
+OVERLOAD_QUEUE_DEPTH = int(getattr(Config, "OVERLOAD_QUEUE_DEPTH", 0) or 0)
+OVERLOAD_MESSAGE_AGE_SECONDS = int(getattr(Config, "OVERLOAD_MESSAGE_AGE_SECONDS", 0) or 0)
+OVERLOAD_REQUEUE_FULL_ANALYSIS = bool(getattr(Config, "OVERLOAD_REQUEUE_FULL_ANALYSIS", True))
+LLM_SKIP_SCORE_THRESHOLD = float(getattr(Config, "LLM_SKIP_SCORE_THRESHOLD", 0) or 0)
+LLM_FAST_PATH_ENRICH = bool(getattr(Config, "LLM_FAST_PATH_ENRICH", False))
+SINGLE_FLIGHT_ENABLED = bool(getattr(Config, "SINGLE_FLIGHT_ENABLED", True))
+SINGLE_FLIGHT_CROSS_PROCESS = bool(getattr(Config, "SINGLE_FLIGHT_CROSS_PROCESS", False))
+SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS = int(getattr(Config, "SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS", 120) or 120)
+IDEMPOTENCY_ENABLED = bool(getattr(Config, "IDEMPOTENCY_ENABLED", False))
+IDEMPOTENCY_BUCKET_MINUTES = int(getattr(Config, "IDEMPOTENCY_BUCKET_MINUTES", 10) or 10)
+IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS = int(getattr(Config, "IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS", 900) or 900)
+DB_WRITE_BATCH_SIZE = int(getattr(Config, "DB_WRITE_BATCH_SIZE", 1) or 1)
+DB_WRITE_FLUSH_MS = int(getattr(Config, "DB_WRITE_FLUSH_MS", 5) or 5)
+CB_STATS_LOG_SECONDS = int(getattr(Config, "CB_STATS_LOG_SECONDS", 300) or 0)
+RETRY_BACKOFF_BASE_SECONDS = float(getattr(Config, "RETRY_BACKOFF_BASE_SECONDS", 1) or 1)
+RETRY_BACKOFF_CAP_SECONDS = float(getattr(Config, "RETRY_BACKOFF_CAP_SECONDS", 10) or 10)
+MESSAGE_RETRY_BACKOFF_BASE_SECONDS = float(getattr(Config, "MESSAGE_RETRY_BACKOFF_BASE_SECONDS", 10) or 10)
+MESSAGE_RETRY_BACKOFF_CAP_SECONDS = float(getattr(Config, "MESSAGE_RETRY_BACKOFF_CAP_SECONDS", 60) or 60)
+
+
+def parse_slow_call_thresholds(spec: str) -> Dict[str, float]:
+    """'llm=30,qdrant=2' -> {'llm': 30.0, 'qdrant': 2.0}"""
+    thresholds: Dict[str, float] = {}
+    for item in (spec or "").split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            try:
+                thresholds[name.strip()] = float(value)
+            except ValueError:
+                logger.warning(f"Ignoring invalid CB_SLOW_CALL_SECONDS entry '{item}'")
+    return thresholds
+
+
+def make_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name=name,
+        fail_threshold=3,
+        window_size=Config.CB_WINDOW_SIZE,
+        min_calls=Config.CB_MIN_CALLS,
+        failure_rate_threshold=Config.CB_FAILURE_RATE,
+        slow_call_sec=parse_slow_call_thresholds(Config.CB_SLOW_CALL_SECONDS).get(name, 0.0),
+        slow_call_rate_threshold=Config.CB_SLOW_CALL_RATE,
+        open_duration_sec=Config.CB_OPEN_SECONDS,
+        half_open_probes=Config.CB_HALF_OPEN_PROBES
+    )
 
 # ---- Utility: retry decorator ----
 
 def retry(
     exceptions: Tuple[Exception, ...] = (Exception,),
     max_attempts: int = 3,
-    backoff_base: int = 2,
-    backoff_jitter: float = 0.1,
-    allowed_status_for_retry: Tuple[int, ...] = (429,)
+    dependency: Optional[str] = None,
+    allowed_status_for_retry: Tuple[int, ...] = (429,),
+    no_retry: Tuple[type, ...] = ()
 ) -> Callable:
-    """Generic retry decorator with exponential backoff and small jitter."""
+    """
+    Generic retry decorator with decorrelated-jitter backoff.
+    Retries draw from the `dependency` retry budget, never run past the
+    message deadline, and DeadlineExceeded (or anything in `no_retry`) is
+    never retried.
+    """
+    budget = get_retry_budget(dependency) if dependency else None
+
+    def _can_retry(delay: float) -> bool:
+        left = deadline.remaining()
+        if left is not None and left < delay + Config.MIN_STAGE_SECONDS:
+            return False
+        return budget is None or budget.try_acquire()
+
     def _decorator(fn: Callable):
         def _wrapped(*args, **kwargs):
             attempt = 0
+            delay = RETRY_BACKOFF_BASE_SECONDS
             while True:
                 try:
-                    return fn(*args, **kwargs)
+                    result = fn(*args, **kwargs)
+                    if budget:
+                        budget.record_success()
+                    return result
                 except requests.exceptions.HTTPError as e:
                     status = None
                     try:
@@ -63,77 +161,85 @@ def retry(
 
                     # Only retry for allowed_status_for_retry if present
                     if status and status in allowed_status_for_retry and attempt < max_attempts - 1:
-                        delay = (backoff_base ** attempt) + (backoff_jitter * attempt)
-                        logger.warning(f"Retryable HTTP error {status} on {fn.__name__}, sleeping {delay}s (attempt {attempt+1})")
+                        delay = decorrelated_jitter(delay, RETRY_BACKOFF_BASE_SECONDS, RETRY_BACKOFF_CAP_SECONDS)
+                        if not _can_retry(delay):
+                            raise
+                        logger.warning(f"Retryable HTTP error {status} on {fn.__name__}, sleeping {delay:.2f}s (attempt {attempt+1})")
                         time.sleep(delay)
                         attempt += 1
                         continue
                     raise
 
                 except exceptions as e:
-                    if attempt >= max_attempts - 1:
+                    if attempt >= max_attempts - 1 or isinstance(e, (DeadlineExceeded,) + no_retry):
+                        raise
+                    delay = decorrelated_jitter(delay, RETRY_BACKOFF_BASE_SECONDS, RETRY_BACKOFF_CAP_SECONDS)
+                    if not _can_retry(delay):
+                        logger.warning(f"Not retrying {fn.__name__}: deadline too close or retry budget spent")
                         raise
-                    delay = (backoff_base ** attempt) + (backoff_jitter * attempt)
-                    logger.warning(f"Retrying {fn.__name__} after {delay}s due to {type(e).__name__}: {e} (attempt {attempt+1})")
+                    logger.warning(f"Retrying {fn.__name__} after {delay:.2f}s due to {type(e).__name__}: {e} (attempt {attempt+1})")
                     time.sleep(delay)
                     attempt += 1
         return _wrapped
     return _decorator
 
 
-# ---- Simple circuit breaker ----
-class CircuitBreaker:
-    def __init__(self, fail_threshold: int = 5, reset_timeout_sec: int = 60):
-        self.fail_threshold = fail_threshold
-        self.reset_timeout = reset_timeout_sec
-        self.fail_count = 0
-        self.last_fail_ts: Optional[float] = None
-        self.opened_until: Optional[float] = None
-
-    def record_success(self):
-        self.fail_count = 0
-        self.last_fail_ts = None
-        self.opened_until = None
-
-    def record_failure(self):
-        self.fail_count += 1
-        self.last_fail_ts = time.time()
-        if self.fail_count >= self.fail_threshold:
-            self.opened_until = time.time() + self.reset_timeout
-            logger.error(f"Circuit breaker OPEN for {self.reset_timeout}s after {self.fail_count} failures")
-
-    def is_open(self) -> bool:
-        if self.opened_until and time.time() < self.opened_until:
-            return True
-        if self.opened_until and time.time() >= self.opened_until:
-            # reset after timeout
-            self.fail_count = 0
-            self.opened_until = None
-            return False
-        return False
+# ---- Service container ----
+
+def _message_state(name: str) -> property:
+    """Per-message attribute kept thread-local so batch workers don't clobber each other."""
+    def _get(self):
+        return getattr(self._local, name, None)
+
+    def _set(self, value):
+        setattr(self._local, name, value)
+
+    return property(_get, _set)
 
 
-# ---- Service container ----
 class ServiceContainer:
+    # current message being processed by this thread
+    incoming_payload = _message_state("incoming_payload")
+    masked_errordescription = _message_state("masked_errordescription")
+    sessionid = _message_state("sessionid")
+    error_ts_str = _message_state("error_ts_str")
+    enqueued_at = _message_state("enqueued_at")
+    full_analysis = _message_state("full_analysis")
+    degraded = _message_state("degraded")
+    fast_path = _message_state("fast_path")
+    redelivered = _message_state("redelivered")
+    claimed_id = _message_state("claimed_id")
+
     def __init__(self):
+        self._local = threading.local()
         self.store: Optional[QdrantStore] = None
         self.client: Optional[GeminiClient] = None
         self.embed_gen: Optional[EmbeddingGenerator] = None
         self.sanitizer: Optional[LogSanitizer] = None
+        self.sanitizer_pool: Optional[SanitizerPool] = None
         self._db = None
 
         self.connection: Optional[pika.BlockingConnection] = None
         self.channel: Optional[pika.channel.Channel] = None
 
+        # worker pool for the LLM fan-out in batch mode
+        self.llm_pool: Optional[ThreadPoolExecutor] = None
+        # background LLM enrichment of fast-path answers
+        self.enrich_pool: Optional[ThreadPoolExecutor] = None
+
         # circuit-breakers per dependency
-        self.cb_db = CircuitBreaker(fail_threshold=3, reset_timeout_sec=30)
-        self.cb_llm = CircuitBreaker(fail_threshold=3, reset_timeout_sec=30)
-        self.cb_qdrant = CircuitBreaker(fail_threshold=3, reset_timeout_sec=30)
-        self.cb_email = CircuitBreaker(fail_threshold=3, reset_timeout_sec=30)
+        self.cb_db = make_breaker("db")
+        self.cb_llm = make_breaker("llm")
+        self.cb_qdrant = make_breaker("qdrant")
+        self.cb_email = make_breaker("email")
 
         # Service health alert notifier (shared, cooldown-aware)
         self.alert = ServiceAlertNotifier()
 
+    def breaker_stats(self) -> List[Dict[str, Any]]:
+        """State, error/slow-call rates and latency percentiles per dependency."""
+        return [cb.stats() for cb in (self.cb_db, self.cb_qdrant, self.cb_llm, self.cb_email)]
+
     # ---- initialization ----
     def initialize(self):
         logger.info("Initializing services...")
@@ -174,7 +280,8 @@ class ServiceContainer:
 
         # Sanitizer
         try:
-            self.sanitizer = LogSanitizer()
+            # prefork workers inherit the parent's preloaded sanitizer
+            self.sanitizer = self.sanitizer or LogSanitizer()
             logger.info("Sanitizer initialized")
         except Exception as e:
             logger.exception("Failed to init sanitizer")
@@ -192,82 +299,152 @@ class ServiceContainer:
             )
             raise
 
-    def initialize_rabbitmq(self):
+    def connection_params(self) -> pika.URLParameters:
         params = pika.URLParameters(Config.RABBIT_URL)
         params.connection_attempts = 3
         params.retry_delay = 2
         params.socket_timeout = 10
         params.heartbeat = 600
         params.blocked_connection_timeout = 300
+        return params
 
-        self.connection = pika.BlockingConnection(params)
+    def initialize_rabbitmq(self):
+        self.connection = pika.BlockingConnection(self.connection_params())
         self.channel = self.connection.channel()
-        self.channel.basic_qos(prefetch_count=PREFETCH_COUNT)
-        # declare passive ensures queue exists
-        self.channel.queue_declare(queue=Config.QUEUE, passive=True)
+        # batch mode needs at least a full batch of unacked deliveries in flight
+        prefetch = max(PREFETCH_COUNT, CONSUMER_BATCH_SIZE) if BATCH_MODE else PREFETCH_COUNT
+        self.channel.basic_qos(prefetch_count=prefetch)
+        if consistent_hash_enabled():
+            check_replica_queue()
+            # this replica's own queue; the binding key is its weight on the hash ring
+            self.channel.exchange_declare(
+                exchange=Config.CONSISTENT_HASH_EXCHANGE,
+                exchange_type=CONSISTENT_HASH_EXCHANGE_TYPE,
+                durable=True
+            )
+            self.channel.queue_declare(queue=replica_queue(), durable=True, arguments=queue_arguments())
+            self.channel.queue_bind(replica_queue(), Config.CONSISTENT_HASH_EXCHANGE, str(Config.CONSUMER_HASH_WEIGHT))
+        elif Config.QUEUE_MAX_PRIORITY > 0:
+            # priority queue: declare with the same arguments as the extractor (idempotent)
+            self.channel.queue_declare(queue=Config.QUEUE, durable=True, arguments=queue_arguments())
+        else:
+            # declare passive ensures queue exists
+            self.channel.queue_declare(queue=Config.QUEUE, passive=True)
+        if sharding_enabled():
+            check_shard_exchange()
+            # per-application shard queues (idempotent; the extractor declares the same)
+            for i, queue in enumerate(all_shard_queues()):
+                self.channel.queue_declare(queue=queue, durable=True, arguments=queue_arguments())
+                self.channel.queue_bind(queue, Config.EXCHANGE, shard_binding_key(i))
         logger.info("RabbitMQ connected")
 
     # DB execute with retry and circuit breaker
-    @retry(exceptions=(Exception,), max_attempts=3)
+    @retry(exceptions=(Exception,), max_attempts=3, dependency="db")
     def db_execute(self, sql: str, params: tuple = (), fetch: bool = False):
-        if self.cb_db.is_open():
+        if not self.cb_db.allow_request():
             raise Exception("DB circuit open")
+        started = time.monotonic()
         try:
             with DB() as db:
                 result = db.execute(sql, params, fetch=fetch)
-            self.cb_db.record_success()
+            self.cb_db.record_success(time.monotonic() - started)
             return result
         except Exception as e:
-            self.cb_db.record_failure()
+            self.cb_db.record_failure(time.monotonic() - started)
             logger.exception("DB operation failed")
             self.alert.notify_service_down(
                 "PostgreSQL/DB", str(e), context="db_execute"
             )
             raise
 
+    # batched row write (group commit) with retry and circuit breaker; a row whose
+    # batch was sent but not confirmed may still commit, so it is never resent
+    @retry(exceptions=(Exception,), max_attempts=3, dependency="db", no_retry=(BatchWriteTimeout,))
+    def db_write_batched(self, writer: BatchWriter, params: tuple):
+        if not self.cb_db.allow_request():
+            raise Exception("DB circuit open")
+        started = time.monotonic()
+        try:
+            result = writer.write(params)
+            self.cb_db.record_success(time.monotonic() - started)
+            return result
+        except Exception as e:
+            self.cb_db.record_failure(time.monotonic() - started)
+            logger.exception("Batched DB write failed")
+            self.alert.notify_service_down(
+                "PostgreSQL/DB", str(e), context="db_write_batched"
+            )
+            raise
+
     # qdrant search wrapper
-    @retry(exceptions=(Exception,), max_attempts=3)
+    @retry(exceptions=(Exception,), max_attempts=3, dependency="qdrant")
     def qdrant_search(self, collection: str, vector, limit: int = 3, query_filter=None):
-        if self.cb_qdrant.is_open():
+        timeout = deadline.stage_timeout("qdrant")
+        if not self.cb_qdrant.allow_request():
             raise Exception("Qdrant circuit open")
+        started = time.monotonic()
         try:
-            res = self.store.search(collection=collection, vector=vector, limit=limit, query_filter=query_filter)
-            self.cb_qdrant.record_success()
+            res = self.store.search(collection=collection, vector=vector, limit=limit, query_filter=query_filter, timeout=timeout)
+            self.cb_qdrant.record_success(time.monotonic() - started)
             return res
         except Exception as e:
-            self.cb_qdrant.record_failure()
+            self.cb_qdrant.record_failure(time.monotonic() - started)
             logger.exception("Qdrant search failed")
             self.alert.notify_service_down(
                 "Qdrant/VectorDB", str(e), context="qdrant_search"
             )
             raise
 
-    @retry(exceptions=(Exception,), max_attempts=3, allowed_status_for_retry=(429,))
+    @retry(exceptions=(Exception,), max_attempts=3, dependency="qdrant")
+    def qdrant_search_batch(self, collection: str, vectors, limit: int = 3, query_filters=None):
+        timeout = deadline.stage_timeout("qdrant")
+        if not self.cb_qdrant.allow_request():
+            raise Exception("Qdrant circuit open")
+        started = time.monotonic()
+        try:
+            res = self.store.search_batch(
+                collection=collection, vectors=vectors, limit=limit, query_filters=query_filters, timeout=timeout
+            )
+            self.cb_qdrant.record_success(time.monotonic() - started)
+            return res
+        except Exception as e:
+            self.cb_qdrant.record_failure(time.monotonic() - started)
+            logger.exception("Qdrant batch search failed")
+            self.alert.notify_service_down(
+                "Qdrant/VectorDB", str(e), context="qdrant_search_batch"
+            )
+            raise
+
+    @retry(exceptions=(Exception,), max_attempts=3, dependency="llm", allowed_status_for_retry=(429,))
     def call_llm(self, error_code: str, description: str, context: str = ""):
-        if self.cb_llm.is_open():
+        timeout = deadline.stage_timeout("llm")
+        if not self.cb_llm.allow_request():
             raise Exception("LLM circuit open")
+        started = time.monotonic()
         try:
-            res = self.client.analyze_error(error_code, description, context=context)
-            self.cb_llm.record_success()
+            res = self.client.analyze_error(error_code, description, context=context, timeout=timeout)
+            self.cb_llm.record_success(time.monotonic() - started)
             return res
         except requests.exceptions.HTTPError as e:
-            self.cb_llm.record_failure()
+            self.cb_llm.record_failure(time.monotonic() - started)
             self.alert.notify_service_down(
                 "Gemini/LLM", str(e), context="call_llm:HTTPError"
             )
             raise
         except Exception as e:
-            self.cb_llm.record_failure()
+            self.cb_llm.record_failure(time.monotonic() - started)
             logger.exception("LLM call failed")
             self.alert.notify_service_down(
                 "Gemini/LLM", str(e), context="call_llm"
             )
             raise
 
-    @retry(exceptions=(Exception,), max_attempts=3)
+    @retry(exceptions=(Exception,), max_attempts=3, dependency="email")
     def send_email(self, template_name: str, payload: Dict[str, Any]):
-        if self.cb_email.is_open():
+        timeout = deadline.stage_timeout("email")
+        if not self.cb_email.allow_request():
             raise Exception("Email circuit open")
+        started = time.monotonic()
         try:
             svc = EmailService(template_name)
             if template_name == "databasesol-main-ui.html":
@@ -276,19 +453,22 @@ class ServiceContainer:
                 html = svc.populate_template_llm(payload)
 
             subject = f"Error Notification: {payload.get('errorType')} in {payload.get('serviceName')}"
-            svc.send_email(html, subject, Config.TO_EMAIL)
-            self.cb_email.record_success()
+            if payload.get('degraded'):
+                subject = f"[Degraded] {subject}"
+            svc.send_email(html, subject, Config.TO_EMAIL, timeout=timeout)
+            self.cb_email.record_success(time.monotonic() - started)
             return True
         except Exception:
-            self.cb_email.record_failure()
+            self.cb_email.record_failure(time.monotonic() - started)
             logger.exception("Send email failed")
             raise
 
-    @retry(exceptions=(Exception,), max_attempts=3)
+    @retry(exceptions=(Exception,), max_attempts=3, dependency="qdrant")
     def qdrant_upsert(self, collection: str, vector_id: int, vector, payload: dict):
-        if self.cb_qdrant.is_open():
+        if not self.cb_qdrant.allow_request():
             raise Exception("Qdrant circuit open")
 
+        started = time.monotonic()
         try:
             self.store.upsert_vector(
                 collection=collection,
@@ -296,11 +476,11 @@ class ServiceContainer:
                 vector=vector,
                 payload=payload
             )
-            self.cb_qdrant.record_success()
+            self.cb_qdrant.record_success(time.monotonic() - started)
             return True
 
         except Exception as e:
-            self.cb_qdrant.record_failure()
+            self.cb_qdrant.record_failure(time.monotonic() - started)
             logger.exception("Qdrant upsert failed")
             self.alert.notify_service_down(
                 "Qdrant/VectorDB", str(e), context="qdrant_upsert"
@@ -350,16 +530,45 @@ def format_confirmed_solutions(solutions_text: str) -> str:
 
 # ---- core pipeline functions (use service wrappers) ----
 
+def consumer_queue() -> str:
+    """Queue this consumer reads new errors from (when not sharded)."""
+    return replica_queue() if consistent_hash_enabled() else Config.QUEUE
+
+
 services = ServiceContainer()
+single_flight = SingleFlight()
+message_retry_budget = get_retry_budget("message")
+backlog_monitor = BacklogMonitor(
+    queues=all_shard_queues() if sharding_enabled() else [consumer_queue()],
+    depth_threshold=OVERLOAD_QUEUE_DEPTH,
+    age_threshold_sec=OVERLOAD_MESSAGE_AGE_SECONDS,
+    check_interval_sec=int(getattr(Config, "OVERLOAD_CHECK_INTERVAL_SECONDS", 10) or 10)
+)
 
 
-def store_incoming_payload_and_set_uuid(payload: Dict[str, Any]):
-    services.incoming_payload = payload
-    services.sanitizer = services.sanitizer or LogSanitizer()
-    services.masked_errordescription = services.sanitizer.sanitize(payload.get('description', ''))
+def store_incoming_payload_and_set_uuid(
+    payload: Dict[str, Any], masked_description: Optional[str] = None, properties=None, deadline_at: Optional[float] = None
+):
+    # the time budget starts at first delivery and survives retries via the x-deadline header
+    deadline.start(deadline_at if deadline_at is not None else deadline.message_deadline(properties))
+    # oversized descriptions travel as a claim check; fetch them before anything reads the payload
+    services.incoming_payload = envelope.resolve_claim_check(payload)
+    # enqueue time stamped by the extractor; older messages fall back to the error time
+    services.enqueued_at = getattr(properties, 'timestamp', None) or payload.get('timestamp')
+    services.full_analysis = bool(properties and (properties.headers or {}).get('x-full-analysis'))
+    services.degraded = False
+    services.fast_path = False
+    services.redelivered = get_retry_count(properties) > 0 if properties else False
+    services.claimed_id = None
+    if masked_description is None:
+        services.sanitizer = services.sanitizer or LogSanitizer()
+        masked_description = services.sanitizer.sanitize(payload.get('description', ''))
+    services.masked_errordescription = masked_description
     logger.info(f"Masked Data: {services.masked_errordescription}")
     services.sessionid = str(uuid.uuid4())
     logger.info(f"Processing: App={payload.get('applicationName')} Code={payload.get('code')} Session={services.sessionid}")
+    epoch = payload.get('timestamp')
+    services.error_ts_str = str(datetime.datetime.fromtimestamp(epoch)) if epoch else str(datetime.datetime.now())
 
 
 def clean_error_description(text: str) -> dict:
@@ -373,9 +582,162 @@ def clean_error_description(text: str) -> dict:
     return {"cleanText": s.strip().strip('"').strip("'")}
 
 
+def build_embed_input(error_code: str, masked_description: str) -> str:
+    cleanErr = clean_error_description(masked_description)
+    return f"Error:{error_code} Description:{cleanErr.get('cleanText','')}"
+
+
+def error_code_filter(error_code: str) -> models.Filter:
+    return models.Filter(must=[models.FieldCondition(key='error_code', match=models.MatchValue(value=error_code))])
+
+
+# ---- consumer-side idempotency ----
+
+def claim_message() -> bool:
+    """
+    Claim this error before any expensive work by inserting its row under the
+    unique key (application_name, error_code, fingerprint, time_bucket).
+
+    Returns False when another message already owns the key: ON CONFLICT has
+    added this message's occurrence_count to that row and the caller just acks.
+    A claim released as 'failed', or left in 'processing' for longer than
+    IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS (its consumer died), is taken over in the
+    same statement. A redelivery may take over a claim its earlier attempt left
+    in 'processing', and a full-analysis pass always proceeds (it upgrades the
+    degraded row).
+    """
+    if not IDEMPOTENCY_ENABLED:
+        return True
+
+    payload = services.incoming_payload
+    fingerprint = error_fingerprint(payload.get('applicationName'), payload.get('code'), payload.get('description'))
+    epoch = payload.get('timestamp') or time.time()
+    time_bucket = int(epoch // (IDEMPOTENCY_BUCKET_MINUTES * 60))
+    second_pass = services.redelivered or services.full_analysis
+    occurrences = payload.get('occurrence_count', 1)
+
+    # SET expressions see the old row, so both CASEs test the claim as it was
+    abandoned = """(errorsolutiontable.sessionid_status = 'failed'
+                    OR (errorsolutiontable.sessionid_status = 'processing'
+                        AND errorsolutiontable.claimed_at < now() - %s * INTERVAL '1 second'))"""
+    claim_sql = f"""
+        INSERT INTO errorsolutiontable (
+            application_name, error_code, error_description, sessionID,
+            error_timestamp, sessionid_status, occurrence_count, fingerprint, time_bucket, claimed_at
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, now())
+        ON CONFLICT (application_name, error_code, fingerprint, time_bucket)
+        DO UPDATE SET
+            occurrence_count = errorsolutiontable.occurrence_count + %s,
+            sessionid_status = CASE WHEN {abandoned} THEN 'processing' ELSE errorsolutiontable.sessionid_status END,
+            claimed_at = CASE WHEN {abandoned} THEN now() ELSE errorsolutiontable.claimed_at END
+        RETURNING id, sessionid_status, (xmax = 0) AS inserted, (claimed_at = now()) AS claimed;
+    """
+    params = (
+        payload.get('applicationName'),
+        payload.get('code'),
+        payload.get('description', ''),
+        services.sessionid,
+        services.error_ts_str,
+        'processing',
+        occurrences,
+        fingerprint,
+        time_bucket,
+        0 if second_pass else occurrences,  # a second pass of the same message isn't a new occurrence
+        IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS,
+        IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS
+    )
+    row = services.db_execute(claim_sql, params, fetch=True)[0]
+
+    if row['inserted']:
+        services.claimed_id = row['id']
+        return True
+    if row['claimed']:
+        logger.info(f"Took over abandoned idempotency claim id={row['id']}")
+        services.claimed_id = row['id']
+        return True
+    if services.full_analysis or (services.redelivered and row['sessionid_status'] == 'processing'):
+        logger.info(f"Taking over idempotency claim id={row['id']}")
+        services.claimed_id = row['id']
+        return True
+
+    logger.info(
+        f"Duplicate of claimed error id={row['id']} "
+        f"({payload.get('applicationName')}/{payload.get('code')}) - counted, skipping"
+    )
+    return False
+
+
+def release_claim():
+    """
+    Mark this message's unfinished claim 'failed' so its retry, or a later
+    duplicate, takes it over instead of being counted against a claim that
+    will never be answered.
+    """
+    claim_id, services.claimed_id = services.claimed_id, None
+    if not claim_id:
+        return
+    try:
+        services.db_execute(
+            "UPDATE errorsolutiontable SET sessionid_status = 'failed' "
+            "WHERE id = %s AND sessionid_status = 'processing';",
+            (claim_id,)
+        )
+        logger.info(f"Released idempotency claim id={claim_id}")
+    except Exception:
+        # the claim goes stale and is taken over after IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS
+        logger.exception(f"Failed to release idempotency claim id={claim_id}")
+
+
+# ---- batched persistence ----
+# With DB_WRITE_BATCH_SIZE > 1 concurrent workers' rows are group-committed by
+# one writer thread per process instead of a connect/INSERT/commit/close each.
+
+insert_writer = BatchWriter(
+    name="errorsolution-insert",
+    sql="""
+        INSERT INTO errorsolutiontable (
+            application_name, error_code, error_description, sessionID,
+            llm_solution, error_timestamp, sessionid_status, occurrence_count
+        ) VALUES %s RETURNING id, sessionid AS batch_key;
+    """,
+    key_index=3,
+    max_rows=DB_WRITE_BATCH_SIZE,
+    flush_interval_ms=DB_WRITE_FLUSH_MS
+)
+finalize_writer = BatchWriter(
+    name="errorsolution-finalize",
+    sql="""
+        UPDATE errorsolutiontable AS t
+           SET llm_solution = v.llm_solution, sessionid = v.sessionid, sessionid_status = v.status
+          FROM (VALUES %s) AS v (id, llm_solution, sessionid, status)
+         WHERE t.id = v.id
+        RETURNING t.id, v.sessionid AS batch_key;
+    """,
+    key_index=2,
+    max_rows=DB_WRITE_BATCH_SIZE,
+    flush_interval_ms=DB_WRITE_FLUSH_MS
+)
+
+
 # safe db insert uses services.db_execute
 
 def db_insert(llmresponse: dict):
+    if services.claimed_id and DB_WRITE_BATCH_SIZE > 1:
+        params = (services.claimed_id, json.dumps(llmresponse), services.sessionid, 'active')
+        new_id = services.db_write_batched(finalize_writer, params) or services.claimed_id
+        logger.info(f"Finalized claimed structural DB row id={new_id} (batched)")
+        return new_id
+    if services.claimed_id:
+        # finalize the idempotency claim row instead of inserting another one
+        rows = services.db_execute(
+            "UPDATE errorsolutiontable SET llm_solution = %s, sessionID = %s, sessionid_status = %s "
+            "WHERE id = %s RETURNING id;",
+            (json.dumps(llmresponse), services.sessionid, 'active', services.claimed_id),
+            fetch=True
+        )
+        logger.info(f"Finalized claimed structural DB row id={services.claimed_id}")
+        return rows[0].get('id') if rows else services.claimed_id
+
     cleanErr = clean_error_description(services.masked_errordescription)
     insert_sql = """
         INSERT INTO errorsolutiontable (
@@ -394,6 +756,11 @@ def db_insert(llmresponse: dict):
         services.incoming_payload.get('occurrence_count', 1)  # Use batch-counted value from extractor
     )
 
+    if DB_WRITE_BATCH_SIZE > 1:
+        new_id = services.db_write_batched(insert_writer, params)
+        logger.info(f"Inserted structural DB row id={new_id} (batched)")
+        return new_id
+
     inserted_rows = services.db_execute(insert_sql, params, fetch=True)
     logger.info("Inserted structural DB row")
     if inserted_rows and len(inserted_rows) > 0:
@@ -435,13 +802,195 @@ def send_formatted_email(email_payload: Dict[str, Any], template_name: str):
 
 # main processing flow with guarded calls
 
-def main():
-    # structural DB check
+def build_email_payload(llmresponse: dict, new_id, solutions: Optional[str] = None) -> Dict[str, Any]:
+    email_payload = {
+        'serviceName': services.incoming_payload.get('applicationName'),
+        'environment': 'Non Prod',
+        'timestamp': services.error_ts_str,
+        'errorType': services.incoming_payload.get('code'),
+        'errorMessage': services.incoming_payload.get('description'),
+        'errorId': str(new_id),
+        'sessionId': services.sessionid,
+        'rootCause': llmresponse.get('rootCause','N/A'),
+        'solution1': {'instructions': llmresponse.get('solution1',{}).get('instructions','')},
+        'solution2': {'instructions': llmresponse.get('solution2',{}).get('instructions','')},
+        'solution3': {'instructions': llmresponse.get('solution3',{}).get('instructions','')}
+    }
+    if solutions is not None:
+        email_payload['confirmedSolutions'] = solutions
+    if llmresponse.get('degraded'):
+        email_payload['degraded'] = True
+    return email_payload
+
+
+def search_vectors() -> list:
+    """Embed the masked description and search Qdrant for solutions to the same error code."""
+    embed_input = build_embed_input(services.incoming_payload.get('code',''), services.masked_errordescription)
+    raw_embedding = services.embed_gen.get_embedding(embed_input)
+
+    qfilter = error_code_filter(services.incoming_payload.get('code'))
+    return services.qdrant_search(collection='error_solutions', vector=raw_embedding, limit=3, query_filter=qfilter)
+
+
+def fast_path_response(point) -> dict:
+    """Response in the LLM's rootCause/solution1-3 schema built from an ops-verified Qdrant solution."""
+    solution = point.payload.get('solution')
+    return {
+        'rootCause': (
+            f"Matches an ops-verified solution for this error (similarity {point.score:.2f}); "
+            f"see the confirmed solution below."
+        ),
+        'solution1': {'instructions': solution if isinstance(solution, str) else json.dumps(solution)},
+        'solution2': {'instructions': ''},
+        'solution3': {'instructions': ''}
+    }
+
+
+def schedule_enrichment(new_id, llmresponse: dict, context_text: Optional[str]):
+    """
+    For fast-path answers, optionally run the LLM in the background and
+    replace the stored llm_solution once it returns. The email is already sent.
+    """
+    if not (LLM_FAST_PATH_ENRICH and services.fast_path and new_id):
+        return
+    code = services.incoming_payload.get('code', '')
+    masked = services.masked_errordescription
+
+    def _enrich():
+        try:
+            enriched = services.call_llm(code, masked, context=context_text or "")
+            services.db_execute(
+                "UPDATE errorsolutiontable SET llm_solution = %s WHERE id = %s",
+                (json.dumps(enriched), new_id)
+            )
+            logger.info(f"Background LLM enrichment stored for id={new_id}")
+        except Exception:
+            logger.exception(f"Background LLM enrichment failed for id={new_id}")
+
+    services.enrich_pool = services.enrich_pool or ThreadPoolExecutor(max_workers=1, thread_name_prefix='enrich')
+    services.enrich_pool.submit(_enrich)
+
+
+def matching_points(vector_points: Optional[list] = None) -> list:
+    """Qdrant hits close enough to the current error to count as confirmed solutions."""
+    if vector_points is None:
+        vector_points = search_vectors()
+    return [r for r in vector_points if getattr(r, 'score', 0) >= 0.85]
+
+
+def generate_solution(vector_points: Optional[list] = None) -> Tuple[dict, Optional[str]]:
+    """
+    Vector-assisted LLM analysis, falling back to LLM only.
+    Returns (llmresponse, confirmed solutions text or None when no vector match).
+    """
+    # vector path
+    logger.info("Checking vector DB")
+    try:
+        points = matching_points(vector_points)
+
+        if len(points) > 0:
+            logger.info(f"Found {len(points)} matching vectors")
+
+            # Restoration: Extract context and pass to LLM
+            context_text = extract_solutions_from_points(points)
+
+            # Near-exact match on an ops-verified solution: use it directly, no LLM call
+            top = max(points, key=lambda p: getattr(p, 'score', 0))
+            top_payload = getattr(top, 'payload', None) or {}
+            if (LLM_SKIP_SCORE_THRESHOLD and top.score >= LLM_SKIP_SCORE_THRESHOLD
+                    and top_payload.get('solution')
+                    and top_payload.get('error_code') == services.incoming_payload.get('code')):
+                logger.info(f"Fast path: verified solution score={top.score:.3f} >= {LLM_SKIP_SCORE_THRESHOLD}; skipping LLM")
+                services.fast_path = True
+                return fast_path_response(top), context_text
+
+            logger.info(f"Injecting context (len={len(context_text)}) into LLM prompt")
+
+            llmresponse = services.call_llm(
+                services.incoming_payload.get('code',''),
+                services.masked_errordescription,
+                context=context_text
+            )
+            return llmresponse, context_text
+
+    except Exception:
+        logger.exception('Vector DB path failed - falling back to LLM only')
+
+    # LLM only path
+    logger.info('Using LLM only')
+    llmresponse = services.call_llm(services.incoming_payload.get('code',''), services.masked_errordescription)
+    return llmresponse, None
+
+
+def find_recent_llm_solution() -> Optional[dict]:
+    """Latest LLM answer stored by another process for this exact error within the duplicate window."""
+    sql = """
+        SELECT llm_solution
+        FROM errorsolutiontable
+        WHERE application_name = %s
+        AND error_code = %s
+        AND error_description = %s
+        AND llm_solution IS NOT NULL
+        AND error_timestamp >= %s::timestamp - %s * INTERVAL '1 minute'
+        ORDER BY id DESC
+        LIMIT 1;
+    """
+    params = (
+        services.incoming_payload.get('applicationName'),
+        services.incoming_payload.get('code'),
+        services.incoming_payload.get('description'),
+        services.error_ts_str,
+        Config.DB_DUPLICATE_WINDOW_MINUTES
+    )
+    rows = services.db_execute(sql, params, fetch=True)
+    if rows and rows[0].get('llm_solution'):
+        return json.loads(rows[0]['llm_solution'])
+    return None
+
+
+def reused_solutions(vector_points: Optional[list] = None) -> Optional[str]:
+    """Confirmed solutions for an answer reused from another consumer (same lookup as generate_solution)."""
+    try:
+        return extract_solutions_from_points(matching_points(vector_points)) or None
+    except Exception:
+        logger.exception('Vector lookup for a reused answer failed - sending it without confirmed solutions')
+        return None
+
+
+def generate_and_store(vector_points: Optional[list] = None) -> Tuple[dict, Optional[str], Any]:
+    """
+    Leader body of the single-flight: generate (or reuse another replica's
+    answer) and insert this message's row, under the cross-process lock when enabled.
+    """
+    if not SINGLE_FLIGHT_CROSS_PROCESS:
+        llmresponse, solutions = generate_solution(vector_points)
+        return llmresponse, solutions, db_insert(llmresponse)
+
+    fingerprint = error_fingerprint(
+        services.incoming_payload.get('applicationName'),
+        services.incoming_payload.get('code'),
+        services.incoming_payload.get('description')
+    )
+    with advisory_lock(fingerprint, timeout_sec=SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS):
+        reused = find_recent_llm_solution()
+        if reused:
+            logger.info("Reusing LLM answer stored by another consumer for the same error")
+            llmresponse, solutions = reused, reused_solutions(vector_points)
+        else:
+            llmresponse, solutions = generate_solution(vector_points)
+        return llmresponse, solutions, db_insert(llmresponse)
+
+
+def find_verified_solution() -> Optional[Tuple[dict, str]]:
+    """Structural DB check: (stored LLM response, ops solution) when ops already verified this error."""
+    # idempotency claims ('processing' / 'failed') aren't answers; prefer the latest verified row
     sql = """
         SELECT id, ops_solution, llm_solution
         FROM errorsolutiontable
         WHERE error_description = %s
         AND application_name = %s
+        AND COALESCE(sessionid_status, '') NOT IN ('processing', 'failed')
+        ORDER BY ops_solution IS NULL, ops_solution_timestamp DESC NULLS LAST, id DESC
         LIMIT 1;
     """
     params = (services.incoming_payload.get('description'), services.incoming_payload.get('applicationName'))
@@ -451,128 +1000,265 @@ def main():
         solutions = rows[0].get('ops_solution')
         if solutions:
             logger.info("Found verified solution in structural DB")
-            # If we have a verified solution, use it.
-            # We don't need to re-insert into DB or call LLM.
-            # Just send the email.
-            
             # Note: We need to load the ORIGINAL LLM response to populate the template fully,
             # or we can pass empty LLM fields if we only care about the confirmed solution.
-            # The original code re-inserted a new row for every occurrence, which is good for tracking freq.
-            
             llm_str = rows[0].get('llm_solution')
             llmresponse = json.loads(llm_str) if llm_str else {}
-            
-            new_id = db_insert(llmresponse)
-            
-            email_payload = {
-                'serviceName': services.incoming_payload.get('applicationName'),
-                'environment': 'Non Prod',
-                'timestamp': services.error_ts_str,
-                'errorType': services.incoming_payload.get('code'),
-                'errorMessage': services.incoming_payload.get('description'),
-                'errorId': str(new_id),
-                'sessionId': services.sessionid,
-                'rootCause': llmresponse.get('rootCause','N/A'),
-                'solution1': {'instructions': llmresponse.get('solution1',{}).get('instructions','')},
-                'solution2': {'instructions': llmresponse.get('solution2',{}).get('instructions','')},
-                'solution3': {'instructions': llmresponse.get('solution3',{}).get('instructions','')},
-                'confirmedSolutions': solutions
-            }
-            send_formatted_email(email_payload, 'databasesol-main-ui.html')
-            return
+            return llmresponse, solutions
         else:
              logger.info("Found record in structural DB but NO verified solution - falling through to Vector DB")
+    return None
+
+
+def find_degraded_solution(vector_points: Optional[list] = None) -> Optional[Tuple[dict, Optional[str]]]:
+    """
+    Best cached answer without calling the LLM, used while shedding load:
+    exact structural match, then top Qdrant hit, then the last LLM answer for the same application and code.
+    The returned response is tagged `degraded`.
+    """
+    app_name = services.incoming_payload.get('applicationName')
+    code = services.incoming_payload.get('code')
+
+    rows = services.db_execute("""
+        SELECT llm_solution, ops_solution
+        FROM errorsolutiontable
+        WHERE error_description = %s
+        AND application_name = %s
+        AND (llm_solution IS NOT NULL OR ops_solution IS NOT NULL)
+        ORDER BY id DESC
+        LIMIT 1;
+    """, (services.incoming_payload.get('description'), app_name), fetch=True)
+    if rows:
+        llm_str = rows[0].get('llm_solution')
+        llmresponse = json.loads(llm_str) if llm_str else {}
+        llmresponse['degraded'] = True
+        logger.info("Degraded answer: exact structural match")
+        return llmresponse, rows[0].get('ops_solution')
 
-    # vector path
-    logger.info("Checking vector DB")
     try:
-        cleanErr = clean_error_description(services.masked_errordescription)
-        embed_input = f"Error:{services.incoming_payload.get('code','')} Description:{cleanErr.get('cleanText','')}"
-        raw_embedding = services.embed_gen.get_embedding(embed_input)
+        if vector_points is None:
+            vector_points = search_vectors()
+        if vector_points:
+            top = max(vector_points, key=lambda p: getattr(p, 'score', 0))
+            solution = (getattr(top, 'payload', None) or {}).get('solution')
+            if solution:
+                logger.info(f"Degraded answer: top vector hit (score={getattr(top, 'score', 0):.3f})")
+                llmresponse = {
+                    'rootCause': 'Degraded mode: closest verified solution from the knowledge base (no LLM analysis).',
+                    'solution1': {'instructions': solution if isinstance(solution, str) else json.dumps(solution)},
+                    'degraded': True
+                }
+                return llmresponse, extract_solutions_from_points([top])
+    except Exception:
+        logger.exception('Degraded vector lookup failed')
 
-        qfilter = models.Filter(must=[models.FieldCondition(key='error_code', match=models.MatchValue(value=services.incoming_payload.get('code')))])
-        result = services.qdrant_search(collection='error_solutions', vector=raw_embedding, limit=3, query_filter=qfilter)
-        points = [r for r in result if getattr(r, 'score', 0) >= 0.85]
+    rows = services.db_execute("""
+        SELECT llm_solution
+        FROM errorsolutiontable
+        WHERE error_code = %s
+        AND application_name = %s
+        AND llm_solution IS NOT NULL
+        ORDER BY id DESC
+        LIMIT 1;
+    """, (code, app_name), fetch=True)
+    if rows and rows[0].get('llm_solution'):
+        llmresponse = json.loads(rows[0]['llm_solution'])
+        llmresponse['degraded'] = True
+        logger.info("Degraded answer: last LLM answer for the same application and error code")
+        return llmresponse, None
 
-        if len(points) > 0:
-            logger.info(f"Found {len(points)} matching vectors")
-            
-            # Restoration: Extract context and pass to LLM
-            context_text = extract_solutions_from_points(points)
-            logger.info(f"Injecting context (len={len(context_text)}) into LLM prompt")
-            
-            llmresponse = services.call_llm(
-                services.incoming_payload.get('code',''), 
-                services.masked_errordescription,
-                context=context_text
-            )
-            new_id = db_insert(llmresponse)
-            solutions = extract_solutions_from_points(points)
-            email_payload = {
-                'serviceName': services.incoming_payload.get('applicationName'),
-                'environment': 'Non Prod',
-                'timestamp': services.error_ts_str,
-                'errorType': services.incoming_payload.get('code'),
-                'errorMessage': services.incoming_payload.get('description'),
-                'errorId': str(new_id),
-                'sessionId': services.sessionid,
-                'rootCause': llmresponse.get('rootCause','N/A'),
-                'solution1': {'instructions': llmresponse.get('solution1',{}).get('instructions','')},
-                'solution2': {'instructions': llmresponse.get('solution2',{}).get('instructions','')},
-                'solution3': {'instructions': llmresponse.get('solution3',{}).get('instructions','')},
-                'confirmedSolutions': solutions
-            }
-            send_formatted_email(email_payload, 'databasesol-main-ui.html')
-            return
+    return None
 
+
+def main(vector_points: Optional[list] = None):
+    """
+    Resolve, persist and email a solution for the current message.
+    `vector_points` carries Qdrant hits precomputed by batch mode; when None
+    the embedding and search are done here.
+    """
+    if not claim_message():
+        return
+    try:
+        answer_message(vector_points)
     except Exception:
-        logger.exception('Vector DB path failed - falling back to LLM only')
+        release_claim()
+        raise
+
+
+def answer_message(vector_points: Optional[list] = None):
+    """Body of main() once this message owns its idempotency claim."""
+    verified = find_verified_solution()
+    if verified:
+        # If we have a verified solution, use it - no LLM call, just record and email.
+        # The original code re-inserted a new row for every occurrence, which is good for tracking freq.
+        llmresponse, solutions = verified
+        new_id = db_insert(llmresponse)
+        send_formatted_email(build_email_payload(llmresponse, new_id, solutions), 'databasesol-main-ui.html')
+        return
 
-    # LLM only path
-    logger.info('Using LLM only')
-    llmresponse = services.call_llm(services.incoming_payload.get('code',''), services.masked_errordescription)
-    new_id = db_insert(llmresponse)
-    email_payload = {
-        'serviceName': services.incoming_payload.get('applicationName'),
-        'environment': 'Non Prod',
-        'timestamp': services.error_ts_str,
-        'errorType': services.incoming_payload.get('code'),
-        'errorMessage': services.incoming_payload.get('description'),
-        'errorId': str(new_id),
-        'sessionId': services.sessionid,
-        'rootCause': llmresponse.get('rootCause','N/A'),
-        'solution1': {'instructions': llmresponse.get('solution1',{}).get('instructions','')},
-        'solution2': {'instructions': llmresponse.get('solution2',{}).get('instructions','')},
-        'solution3': {'instructions': llmresponse.get('solution3',{}).get('instructions','')}
-    }
-    send_formatted_email(email_payload, 'email-main-ui.html')
+    # Under a deep backlog answer from cache so notification latency stays bounded
+    if not services.full_analysis and backlog_monitor.enabled and backlog_monitor.is_overloaded(services.enqueued_at):
+        degraded = find_degraded_solution(vector_points)
+        if degraded:
+            llmresponse, solutions = degraded
+            services.degraded = True
+            new_id = db_insert(llmresponse)
+            template_name = 'databasesol-main-ui.html' if solutions is not None else 'email-main-ui.html'
+            send_formatted_email(build_email_payload(llmresponse, new_id, solutions), template_name)
+            return
+        logger.info("Overloaded but no cached answer available - using full path")
+
+    # Identical errors in flight at the same time share one embedding/LLM round;
+    # followers reuse the leader's answer for their own row and email.
+    if SINGLE_FLIGHT_ENABLED:
+        fingerprint = error_fingerprint(
+            services.incoming_payload.get('applicationName'),
+            services.incoming_payload.get('code'),
+            services.incoming_payload.get('description')
+        )
+        (llmresponse, solutions, new_id), shared = single_flight.do(fingerprint, lambda: generate_and_store(vector_points))
+        if shared:
+            logger.info("Coalesced with in-flight duplicate; reusing its LLM answer")
+            new_id = db_insert(llmresponse)
+    else:
+        llmresponse, solutions = generate_solution(vector_points)
+        new_id = db_insert(llmresponse)
+
+    template_name = 'databasesol-main-ui.html' if solutions is not None else 'email-main-ui.html'
+    send_formatted_email(build_email_payload(llmresponse, new_id, solutions), template_name)
+    schedule_enrichment(new_id, llmresponse, solutions)
 
 
 # ---- DLQ helper ----
 
-def publish_to_dlx(ch: pika.channel.Channel, body: bytes, headers: dict):
+def queue_arguments() -> Optional[Dict[str, Any]]:
+    """Queue declare arguments shared with the extractor (priority queue when enabled)."""
+    if Config.QUEUE_MAX_PRIORITY > 0:
+        return {'x-max-priority': Config.QUEUE_MAX_PRIORITY}
+    return None
+
+
+def publish_to_dlx(ch: pika.channel.Channel, body: bytes, headers: dict, content_encoding: Optional[str] = None):
     try:
         if DLQ_ENABLED:
-            props = pika.BasicProperties(headers=headers, delivery_mode=2)
+            props = pika.BasicProperties(headers=headers, delivery_mode=2, content_encoding=content_encoding)
             ch.basic_publish(exchange=DLX_EXCHANGE, routing_key=DLQ_ROUTING_KEY, body=body, properties=props)
             logger.info(f"Published to DLX {DLX_EXCHANGE}:{DLQ_ROUTING_KEY}")
         else:
-            logger.warning("DLQ not configured; discarding message")
+            logger.error("DLQ not configured; discarding message")
     except Exception:
         logger.exception("Failed to publish to DLX")
 
 
 # ---- retry / failure handling for messages ----
 
-def handle_retry(ch, method, properties, body: bytes, retry_count: int, error: Exception):
-    # If retry_count exceeded, send to DLQ
-    if retry_count >= MAX_RETRIES_PER_MESSAGE:
-        logger.error(f"Max retries reached for message; moving to DLQ: {error}")
+def source_queue(method) -> str:
+    """Queue a delivery came from, so retries go back to the same (shard) queue."""
+    exchange = getattr(method, 'exchange', None)
+    routing_key = getattr(method, 'routing_key', None)
+    if exchange == '' and routing_key:
+        # published straight to a queue (retries, stage hand-offs)
+        return routing_key
+    if sharding_enabled():
+        shard = shard_from_routing_key(routing_key)
+        if shard is not None:
+            return shard_queue(shard)
+    return consumer_queue()
+
+
+def intake_queue(app_name: str) -> str:
+    """Queue new work for `app_name` enters through."""
+    return shard_queue(shard_for_app(app_name)) if sharding_enabled() else consumer_queue()
+
+
+# Retries wait in per-delay queues: a message expires after the queue's TTL and is
+# dead-lettered back to its work queue, so no consumer thread ever sleeps on it.
+# Delays are rounded up to one of these tiers to keep the number of queues small.
+RETRY_DELAY_TIERS_SECONDS = (1, 2, 5, 10, 15, 30, 60, 120, 300, 600)
+# delay queues already declared, per channel: a new channel (reconnect, another
+# worker thread or a forked process) declares them again
+_declared_delay_queues: "weakref.WeakKeyDictionary[Any, set]" = weakref.WeakKeyDictionary()
+_declared_delay_queues_lock = threading.Lock()
+
+
+def retry_delay_tier(delay: float) -> int:
+    """Smallest delay tier >= `delay` (the largest tier for anything longer)."""
+    for tier in RETRY_DELAY_TIERS_SECONDS:
+        if tier >= delay:
+            return tier
+    return RETRY_DELAY_TIERS_SECONDS[-1]
+
+
+def delay_queue(ch, target: str, delay: int) -> str:
+    """Declare (once) the queue holding messages for `delay` seconds before they return to `target`."""
+    name = f"{target}.delay.{delay}s"
+    with _declared_delay_queues_lock:
+        declared = _declared_delay_queues.setdefault(ch, set())
+        if name in declared:
+            return name
+    ch.queue_declare(queue=name, durable=True, arguments={
+        'x-message-ttl': delay * 1000,
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': target,
+    })
+    with _declared_delay_queues_lock:
+        declared.add(name)
+    return name
+
+
+def publish_delayed(ch, body: bytes, properties, target: str, delay: int, headers: dict):
+    """Publish `body` to come back to `target` after `delay` seconds, keeping priority and encoding."""
+    props = pika.BasicProperties(
+        headers=headers, delivery_mode=2,
+        priority=getattr(properties, 'priority', None) if properties else None,
+        content_encoding=getattr(properties, 'content_encoding', None)
+    )
+    ch.basic_publish(exchange='', routing_key=delay_queue(ch, target, delay), body=body, properties=props)
+
+
+def handle_retry(
+    ch, method, properties, body: bytes, retry_count: int, error: Exception,
+    routing_key: Optional[str] = None, deadline_at: Optional[float] = None
+):
+    headers_in = (properties.headers or {}) if properties else {}
+    backoff = retry_delay_tier(decorrelated_jitter(
+        float(headers_in.get('x-retry-delay', 0) or 0),
+        MESSAGE_RETRY_BACKOFF_BASE_SECONDS,
+        MESSAGE_RETRY_BACKOFF_CAP_SECONDS
+    ))
+    deadline_at = deadline_at or deadline.current()
+    # during an outage failures aren't the message's fault: don't spend its retries
+    outage = any_circuit_open()
+
+    # Max retries or a spent time budget send the message to the DLQ
+    if retry_count >= MAX_RETRIES_PER_MESSAGE and not outage:
+        reason = 'Max retries reached'
+    elif deadline_at and time.time() + backoff >= deadline_at:
+        reason = 'Message deadline exceeded'
+    elif outage or not message_retry_budget.try_acquire():
+        # a spent retry budget or an open circuit means a dependency is down: park the
+        # message at the longest delay with its retry count unchanged instead of losing it
+        park_for = retry_delay_tier(MESSAGE_RETRY_BACKOFF_CAP_SECONDS)
+        logger.warning(f"{'Circuit open' if outage else 'Message retry budget exhausted'}; parking message for {park_for}s: {error}")
+        headers = {'x-retry-count': retry_count, 'x-retry-delay': park_for}
+        if deadline_at:
+            headers[deadline.DEADLINE_HEADER] = deadline_at
+        publish_delayed(ch, body, properties, routing_key or source_queue(method), park_for, headers)
+        try:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception:
+            logger.exception('Failed to ack after parking')
+        return
+    else:
+        reason = None
+
+    if reason:
+        logger.error(f"{reason} for message; moving to DLQ: {error}")
         headers = (properties.headers or {}).copy() if properties else {}
         headers.update({'x-retry-count': retry_count, 'x-error': str(type(error).__name__)})
 
         # Prefer publishing to DLX (explicit) so DLX metadata is present
-        publish_to_dlx(ch, body, headers)
+        publish_to_dlx(ch, body, headers, content_encoding=getattr(properties, 'content_encoding', None))
 
         # ACK original so it doesn't remain in queue
         try:
@@ -581,14 +1267,13 @@ def handle_retry(ch, method, properties, body: bytes, retry_count: int, error: E
             logger.exception('Failed to ack after DLQ publish')
         return
 
-    # otherwise republish with increased retry and exponential backoff
+    # otherwise republish through the delay queue with increased retry count
     new_retry = retry_count + 1
-    backoff = 10
-    logger.warning(f"Retrying message {new_retry}/{MAX_RETRIES_PER_MESSAGE} after sleep {backoff}s")
-    time.sleep(backoff)
-
-    props = pika.BasicProperties(headers={'x-retry-count': new_retry}, delivery_mode=2)
-    ch.basic_publish(exchange='', routing_key=Config.QUEUE, body=body, properties=props)
+    logger.warning(f"Retrying message {new_retry}/{MAX_RETRIES_PER_MESSAGE} after {backoff}s delay")
+    headers = {'x-retry-count': new_retry, 'x-retry-delay': backoff}
+    if deadline_at:
+        headers[deadline.DEADLINE_HEADER] = deadline_at
+    publish_delayed(ch, body, properties, routing_key or source_queue(method), backoff, headers)
 
     try:
         ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -596,22 +1281,45 @@ def handle_retry(ch, method, properties, body: bytes, retry_count: int, error: E
         logger.exception('Failed to ack after republish')
 
 
-# ---- RabbitMQ callback ----
+def requeue_for_full_analysis(ch, body: bytes, properties, app_name: Optional[str] = None):
+    """Send a degraded message back through the full LLM path at the lowest priority."""
+    if not OVERLOAD_REQUEUE_FULL_ANALYSIS:
+        return
+    try:
+        headers = (properties.headers or {}).copy() if properties else {}
+        # a fresh message: the degraded pass already spent its deadline and retries
+        for name in (deadline.DEADLINE_HEADER, 'x-retry-count', 'x-retry-delay'):
+            headers.pop(name, None)
+        headers['x-full-analysis'] = True
+        props = pika.BasicProperties(
+            headers=headers, delivery_mode=2, priority=0, timestamp=int(time.time()),
+            content_encoding=getattr(properties, 'content_encoding', None)
+        )
+        ch.basic_publish(exchange='', routing_key=intake_queue(app_name), body=body, properties=props)
+        logger.info("Degraded message re-queued for full analysis")
+    except Exception:
+        logger.exception('Failed to re-queue degraded message')
 
-def callback(ch, method, properties, body):
-    delivery_tag = method.delivery_tag
-    logger.info(f"Message received tag={delivery_tag}")
 
-    retry_count = 0
+# ---- RabbitMQ callback ----
+
+def get_retry_count(properties) -> int:
     if properties and getattr(properties, 'headers', None):
-        retry_count = properties.headers.get('x-retry-count', 0)
+        return properties.headers.get('x-retry-count', 0)
+    return 0
+
 
+def decode_message(ch, delivery_tag, body: bytes, properties=None) -> Optional[Dict[str, Any]]:
+    """
+    Parse and validate a delivery (legacy plain JSON or a compressed v1 envelope);
+    invalid messages are acked and dropped (returns None).
+    """
     try:
-        payload = json.loads(body.decode('utf-8'))
+        payload = envelope.decode(body, getattr(properties, 'content_encoding', None))
     except Exception:
-        logger.exception('Invalid JSON - acking and dropping')
+        logger.exception('Invalid message body - acking and dropping')
         ch.basic_ack(delivery_tag=delivery_tag)
-        return
+        return None
 
     # Basic validation
     required = ['applicationName', 'code', 'description', 'timestamp']
@@ -619,22 +1327,40 @@ def callback(ch, method, properties, body):
     if missing:
         logger.error(f"Missing fields {missing} - acking")
         ch.basic_ack(delivery_tag=delivery_tag)
+        return None
+
+    return payload
+
+
+def any_circuit_open() -> bool:
+    return services.cb_db.is_open() or services.cb_llm.is_open() or services.cb_qdrant.is_open()
+
+
+def callback(ch, method, properties, body):
+    delivery_tag = method.delivery_tag
+    logger.info(f"Message received tag={delivery_tag}")
+
+    retry_count = get_retry_count(properties)
+
+    payload = decode_message(ch, delivery_tag, body, properties)
+    if payload is None:
         return
 
     try:
-        store_incoming_payload_and_set_uuid(payload)
-        epoch = payload.get('timestamp')
-        services.error_ts_str = str(datetime.datetime.fromtimestamp(epoch)) if epoch else str(datetime.datetime.now())
+        store_incoming_payload_and_set_uuid(payload, properties=properties)
 
         # If any circuit is open, fail-fast: republish with retry increment to slow things down
-        if services.cb_db.is_open() or services.cb_llm.is_open() or services.cb_qdrant.is_open():
+        if any_circuit_open():
             logger.warning('One or more circuits open; performing retry/backoff')
             raise Exception('Downstream service circuit open')
 
         # main pipeline
         main()
+        if services.degraded:
+            requeue_for_full_analysis(ch, body, properties, payload.get('applicationName'))
 
         ch.basic_ack(delivery_tag=delivery_tag)
+        message_retry_budget.record_success()
         logger.info('Message processed and acknowledged')
 
     except Exception as e:
@@ -642,15 +1368,494 @@ def callback(ch, method, properties, body):
         handle_retry(ch, method, properties, body, retry_count, e)
 
 
+# ---- micro-batch mode ----
+
+def process_prepared_message(
+    payload: Dict[str, Any], masked_description: str, vector_points: Optional[list],
+    properties=None, deadline_at: Optional[float] = None
+) -> bool:
+    """
+    Worker-thread body for one message of a batch: runs the normal pipeline with
+    precomputed search hits. Returns True when the message was answered in degraded mode.
+    """
+    store_incoming_payload_and_set_uuid(
+        payload, masked_description=masked_description, properties=properties, deadline_at=deadline_at
+    )
+    main(vector_points=vector_points)
+    return bool(services.degraded)
+
+
+def process_batch(ch, deliveries: List[Tuple[Any, Any, bytes]]):
+    """
+    Process a batch of deliveries: sanitize, embed and search them together,
+    then fan the LLM/persist/email work out to the worker pool.
+    Ack/retry decisions stay per message and run on the connection thread.
+    """
+    logger.info(f"Processing batch of {len(deliveries)} messages")
+
+    batch = []
+    for method, properties, body in deliveries:
+        payload = decode_message(ch, method.delivery_tag, body, properties)
+        if payload is not None:
+            batch.append((method, properties, body, payload))
+    if not batch:
+        return
+    # budgets start at delivery, not when a worker thread picks the message up
+    deadlines = [deadline.message_deadline(properties) for _, properties, _, _ in batch]
+
+    if any_circuit_open():
+        logger.warning('One or more circuits open; performing retry/backoff for batch')
+        for i, (method, properties, body, _) in enumerate(batch):
+            handle_retry(
+                ch, method, properties, body, get_retry_count(properties),
+                Exception('Downstream service circuit open'), deadline_at=deadlines[i]
+            )
+        return
+
+    # Stage 1: sanitize (one batched Presidio pass; per-message fallback on failure)
+    masked: List[Optional[str]] = [None] * len(batch)
+    failed: Dict[int, Exception] = {}
+    for i, (_, _, _, payload) in enumerate(batch):
+        try:
+            envelope.resolve_claim_check(payload)
+        except Exception as e:
+            logger.exception('Claim-check lookup failed')
+            failed[i] = e
+    pending = [i for i in range(len(batch)) if i not in failed]
+    texts = [batch[i][3].get('description', '') for i in pending]
+    try:
+        if SANITIZER_POOL_PROCESSES > 0:
+            services.sanitizer_pool = services.sanitizer_pool or SanitizerPool(SANITIZER_POOL_PROCESSES)
+            sanitized = services.sanitizer_pool.sanitize_many(texts)
+        else:
+            services.sanitizer = services.sanitizer or LogSanitizer()
+            sanitized = services.sanitizer.sanitize_many(texts)
+        for i, text in zip(pending, sanitized):
+            masked[i] = text
+    except Exception:
+        logger.exception('Batch sanitization failed - sanitizing messages one by one')
+        services.sanitizer = services.sanitizer or LogSanitizer()
+        for i, text in zip(pending, texts):
+            try:
+                masked[i] = services.sanitizer.sanitize(text)
+            except Exception as e:
+                logger.exception('Sanitization failed')
+                failed[i] = e
+
+    # Stage 2 + 3: one embedding call and one Qdrant batch query for the whole batch
+    searchable = [i for i in range(len(batch)) if i not in failed]
+    points_by_index: Dict[int, Optional[list]] = {}
+    try:
+        vectors = services.embed_gen.get_embeddings([
+            build_embed_input(batch[i][3].get('code', ''), masked[i]) for i in searchable
+        ])
+        results = services.qdrant_search_batch(
+            collection='error_solutions',
+            vectors=vectors,
+            limit=3,
+            query_filters=[error_code_filter(batch[i][3].get('code')) for i in searchable]
+        )
+        points_by_index = dict(zip(searchable, results))
+    except Exception:
+        # workers fall back to the per-message vector lookup
+        logger.exception('Batch vector lookup failed - falling back to per-message search')
+
+    # Stage 4: fan out LLM + persist + email
+    services.llm_pool = services.llm_pool or ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix='llm')
+    futures = {
+        i: services.llm_pool.submit(
+            process_prepared_message, batch[i][3], masked[i], points_by_index.get(i), batch[i][1], deadlines[i]
+        )
+        for i in searchable
+    }
+    pending = set(futures.values())
+    while pending:
+        _, pending = wait(pending, timeout=1.0)
+        # keep heartbeats flowing while workers run
+        services.connection.process_data_events(time_limit=0)
+
+    for i, (method, properties, body, _) in enumerate(batch):
+        error = failed.get(i)
+        if error is None:
+            error = futures[i].exception()
+        if error is None:
+            if futures[i].result():
+                requeue_for_full_analysis(ch, body, properties, batch[i][3].get('applicationName'))
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            message_retry_budget.record_success()
+            logger.info(f"Message processed and acknowledged tag={method.delivery_tag}")
+        else:
+            logger.error(f"Processing failed tag={method.delivery_tag}: {error}")
+            handle_retry(ch, method, properties, body, get_retry_count(properties), error, deadline_at=deadlines[i])
+
+
+def consume_fair(ch, connection, on_delivery: Callable):
+    """One-at-a-time deficit-round-robin loop over the per-application shard queues."""
+    scheduler = DeficitRoundRobin.from_config()
+    while True:
+        delivery = scheduler.next_delivery(ch)
+        if delivery is None:
+            # all shards idle or capped; sleep keeps heartbeats flowing
+            connection.sleep(0.2)
+            continue
+        queue, method, properties, body = delivery
+        try:
+            on_delivery(ch, method, properties, body)
+        finally:
+            scheduler.release(queue)
+
+
+def consume_batches_fair():
+    """Batch mode over shard queues: each batch is filled in DRR order, capped per shard."""
+    scheduler = DeficitRoundRobin.from_config()
+    wait_sec = CONSUMER_BATCH_WAIT_MS / 1000.0
+    while True:
+        batch: List[Tuple[Any, Any, bytes]] = []
+        queues: List[str] = []
+        started = time.monotonic()
+        while len(batch) < CONSUMER_BATCH_SIZE:
+            if batch and time.monotonic() - started >= wait_sec:
+                break
+            delivery = scheduler.next_delivery(services.channel)
+            if delivery is None:
+                services.connection.sleep(0.05)
+                if not batch:
+                    started = time.monotonic()
+                continue
+            queue, method, properties, body = delivery
+            batch.append((method, properties, body))
+            queues.append(queue)
+
+        try:
+            process_batch(services.channel, batch)
+        finally:
+            for queue in queues:
+                scheduler.release(queue)
+
+
+def consume_batches():
+    """Drain up to CONSUMER_BATCH_SIZE deliveries, or whatever arrived within CONSUMER_BATCH_WAIT_MS, per batch."""
+    wait_sec = CONSUMER_BATCH_WAIT_MS / 1000.0
+    batch: List[Tuple[Any, Any, bytes]] = []
+    batch_started = 0.0
+
+    for method, properties, body in services.channel.consume(
+        queue=consumer_queue(), auto_ack=False, inactivity_timeout=max(wait_sec / 2, 0.01)
+    ):
+        if method is not None:
+            if not batch:
+                batch_started = time.monotonic()
+            batch.append((method, properties, body))
+
+        if batch and (len(batch) >= CONSUMER_BATCH_SIZE or time.monotonic() - batch_started >= wait_sec):
+            process_batch(services.channel, batch)
+            batch = []
+
+
+# ---- staged topology ----
+# sanitize -> retrieve -> generate -> persist -> notify, connected by internal
+# durable queues so each stage can run its own worker pool (or its own containers).
+
+STAGES = ('sanitize', 'retrieve', 'generate', 'persist', 'notify')
+
+
+def stage_queue(stage: str) -> str:
+    """Input queue of a stage; sanitize reads the public queue fed by the extractor."""
+    return consumer_queue() if stage == 'sanitize' else f"{Config.QUEUE}.stage.{stage}"
+
+
+def parse_stage_workers(spec: str) -> Dict[str, int]:
+    """'sanitize=2,generate=8' -> {'sanitize': 2, 'generate': 8, ...} with 1 as the default."""
+    workers = {stage: 1 for stage in STAGES}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, count = item.split('=', 1)
+            if name.strip() in workers:
+                workers[name.strip()] = max(0, int(count))
+    return workers
+
+
+def capture_message_state() -> Dict[str, Any]:
+    return {
+        'payload': services.incoming_payload,
+        'masked': services.masked_errordescription,
+        'sessionId': services.sessionid,
+        'errorTs': services.error_ts_str,
+        'enqueuedAt': services.enqueued_at,
+        'fullAnalysis': services.full_analysis,
+        'deadline': deadline.current(),
+    }
+
+
+def encode_stage_message(msg: Dict[str, Any]) -> Tuple[bytes, Optional[str], Dict[str, Any]]:
+    """
+    Stage hand-offs use the v1 envelope: the raw and masked descriptions are
+    parked as claim checks above CLAIM_CHECK_THRESHOLD_BYTES and the body is
+    compressed per MESSAGE_COMPRESSION.
+    """
+    msg = envelope.check_in(dict(msg, payload=envelope.check_in(msg['payload'])), 'masked')
+    return envelope.encode(msg)
+
+
+def restore_message_state(msg: Dict[str, Any]):
+    # resolved on copies: msg keeps its claim checks for the next hand-off
+    services.incoming_payload = envelope.resolve_claim_check(dict(msg['payload']))
+    services.masked_errordescription = envelope.resolve_claim_check(dict(msg), 'masked')['masked']
+    services.sessionid = msg['sessionId']
+    services.error_ts_str = msg['errorTs']
+    services.enqueued_at = msg.get('enqueuedAt')
+    services.full_analysis = msg.get('fullAnalysis', False)
+    services.degraded = msg.get('degraded', False)
+    services.fast_path = msg.get('fastPath', False)
+    services.claimed_id = msg.get('claimedId')
+    deadline.start(msg.get('deadline'))
+
+
+def stage_sanitize(msg: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    store_incoming_payload_and_set_uuid(msg['payload'], properties=msg.pop('properties', None))
+    return 'retrieve', capture_message_state()
+
+
+def stage_retrieve(msg: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    if not claim_message():
+        return None, msg
+    msg['claimedId'] = services.claimed_id
+
+    verified = find_verified_solution()
+    if verified:
+        msg['llmresponse'], msg['solutions'] = verified
+        msg['template'] = 'databasesol-main-ui.html'
+        return 'persist', msg
+
+    try:
+        points = search_vectors()
+    except Exception:
+        logger.exception('Vector DB path failed - falling back to LLM only')
+        points = []
+
+    if not services.full_analysis and backlog_monitor.enabled and backlog_monitor.is_overloaded(services.enqueued_at):
+        degraded = find_degraded_solution(points)
+        if degraded:
+            msg['llmresponse'], msg['solutions'] = degraded
+            msg['template'] = 'databasesol-main-ui.html' if msg['solutions'] is not None else 'email-main-ui.html'
+            msg['degraded'] = True
+            return 'persist', msg
+    msg['points'] = [{'score': p.score, 'payload': p.payload} for p in points]
+    return 'generate', msg
+
+
+def stage_generate(msg: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    points = [SimpleNamespace(**p) for p in msg.get('points', [])]
+    if SINGLE_FLIGHT_ENABLED:
+        fingerprint = error_fingerprint(
+            services.incoming_payload.get('applicationName'),
+            services.incoming_payload.get('code'),
+            services.incoming_payload.get('description')
+        )
+        (llmresponse, solutions), _ = single_flight.do(fingerprint, lambda: generate_solution(points))
+    else:
+        llmresponse, solutions = generate_solution(points)
+    msg['llmresponse'], msg['solutions'] = llmresponse, solutions
+    msg['fastPath'] = bool(services.fast_path)
+    msg['template'] = 'databasesol-main-ui.html' if solutions is not None else 'email-main-ui.html'
+    return 'persist', msg
+
+
+def stage_persist(msg: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    msg['newId'] = db_insert(msg['llmresponse'])
+    schedule_enrichment(msg['newId'], msg['llmresponse'], msg.get('solutions'))
+    return 'notify', msg
+
+
+def stage_notify(msg: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    send_formatted_email(build_email_payload(msg['llmresponse'], msg['newId'], msg.get('solutions')), msg['template'])
+    return None, msg
+
+
+STAGE_HANDLERS = {
+    'sanitize': stage_sanitize,
+    'retrieve': stage_retrieve,
+    'generate': stage_generate,
+    'persist': stage_persist,
+    'notify': stage_notify,
+}
+
+
+def stage_callback(stage: str, ch, method, properties, body):
+    delivery_tag = method.delivery_tag
+    retry_count = get_retry_count(properties)
+
+    if stage == 'sanitize':
+        payload = decode_message(ch, delivery_tag, body, properties)
+        if payload is None:
+            return
+        msg = {'payload': payload, 'properties': properties}
+    else:
+        try:
+            msg = envelope.decode(body, getattr(properties, 'content_encoding', None))
+            restore_message_state(msg)
+            services.redelivered = retry_count > 0
+        except Exception:
+            logger.exception(f'[{stage}] Invalid stage message - acking and dropping')
+            ch.basic_ack(delivery_tag=delivery_tag)
+            return
+
+    try:
+        if stage != 'sanitize' and any_circuit_open():
+            logger.warning(f'[{stage}] One or more circuits open; performing retry/backoff')
+            raise Exception('Downstream service circuit open')
+
+        next_stage, msg = STAGE_HANDLERS[stage](msg)
+        if stage == 'retrieve' and msg.get('degraded'):
+            payload_body, content_encoding, headers = envelope.encode(msg['payload'])
+            requeue_for_full_analysis(
+                ch, payload_body, pika.BasicProperties(headers=headers, content_encoding=content_encoding),
+                msg['payload'].get('applicationName')
+            )
+        if next_stage:
+            stage_body, content_encoding, headers = encode_stage_message(msg)
+            ch.basic_publish(
+                exchange='',
+                routing_key=stage_queue(next_stage),
+                body=stage_body,
+                properties=pika.BasicProperties(
+                    headers=headers,
+                    delivery_mode=2,
+                    content_type='application/json',
+                    content_encoding=content_encoding,
+                    priority=getattr(properties, 'priority', None)
+                )
+            )
+        ch.basic_ack(delivery_tag=delivery_tag)
+        message_retry_budget.record_success()
+        logger.info(f"[{stage}] Message done tag={delivery_tag} -> {next_stage or 'finished'}")
+
+    except Exception as e:
+        logger.exception(f'[{stage}] Processing failed')
+        release_claim()
+        handle_retry(ch, method, properties, body, retry_count, e)
+
+
+def run_stage_worker(stage: str):
+    """One worker: its own connection/channel consuming a stage queue, reconnecting on failure."""
+    services.sanitizer = services.sanitizer or (LogSanitizer() if stage == 'sanitize' else None)
+    while True:
+        connection = None
+        try:
+            connection = pika.BlockingConnection(services.connection_params())
+            ch = connection.channel()
+            ch.basic_qos(prefetch_count=PREFETCH_COUNT)
+            if stage == 'sanitize' and sharding_enabled():
+                logger.info(f"[{stage}] Worker pulling fairly from {len(all_shard_queues())} shard queues")
+                consume_fair(ch, connection, lambda c, m, p, b: stage_callback(stage, c, m, p, b))
+                return
+            ch.basic_consume(
+                queue=stage_queue(stage),
+                on_message_callback=lambda c, m, p, b: stage_callback(stage, c, m, p, b),
+                auto_ack=False
+            )
+            logger.info(f"[{stage}] Worker listening on {stage_queue(stage)}")
+            ch.start_consuming()
+        except Exception:
+            logger.exception(f'[{stage}] Worker connection lost; reconnecting in 5s')
+            time.sleep(5)
+        finally:
+            try:
+                if connection and not connection.is_closed:
+                    connection.close()
+            except Exception:
+                pass
+
+
+def run_stage_pool(stage: str, count: int):
+    threads = [
+        threading.Thread(target=run_stage_worker, args=(stage,), name=f'{stage}-{i}', daemon=True)
+        for i in range(count)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_stage_process(stage: str, count: int):
+    """Entry point of a forked stage process: drop the parent's AMQP handles so they are never touched here."""
+    services.connection = None
+    services.channel = None
+    run_stage_pool(stage, count)
+
+
+def run_staged_topology():
+    """
+    Start the stages listed in CONSUMER_STAGES. Each stage gets CONSUMER_STAGE_WORKERS
+    threads; the CPU-bound sanitize stage runs SANITIZE_WORKER_PROCESSES processes instead
+    when configured, so Presidio masking isn't serialized on the GIL.
+    """
+    workers = parse_stage_workers(CONSUMER_STAGE_WORKERS)
+    stages = [s.strip() for s in CONSUMER_STAGES.split(',') if s.strip() in STAGE_HANDLERS]
+
+    # internal stage queues must exist before anyone publishes to them
+    for stage in STAGES[1:]:
+        services.channel.queue_declare(queue=stage_queue(stage), durable=True, arguments=queue_arguments())
+
+    pools = []
+    for stage in stages:
+        if stage == 'sanitize' and SANITIZE_WORKER_PROCESSES > 0:
+            ctx = multiprocessing.get_context('fork')
+            for i in range(SANITIZE_WORKER_PROCESSES):
+                p = ctx.Process(target=run_stage_process, args=(stage, workers[stage]), name=f'sanitize-proc-{i}', daemon=True)
+                p.start()
+                pools.append(p)
+        else:
+            t = threading.Thread(target=run_stage_pool, args=(stage, workers[stage]), name=f'{stage}-pool', daemon=True)
+            t.start()
+            pools.append(t)
+        logger.info(f"Stage {stage} started with {workers[stage]} worker(s)")
+
+    for pool in pools:
+        pool.join()
+
+
+# ---- dependency statistics ----
+
+def log_breaker_stats_forever():
+    def _fmt(value: Optional[float]) -> str:
+        return f"{value:.2f}s" if value is not None else "-"
+
+    while True:
+        time.sleep(CB_STATS_LOG_SECONDS)
+        for st in services.breaker_stats():
+            logger.info(
+                f"[Dependency] {st['name']}: state={st['state']} calls={st['calls']} "
+                f"errors={st['failure_rate']:.0%} slow={st['slow_call_rate']:.0%} "
+                f"p50={_fmt(st['p50'])} p95={_fmt(st['p95'])} p99={_fmt(st['p99'])}"
+            )
+        if services.sanitizer and services.sanitizer.cache_enabled:
+            st = services.sanitizer.cache_stats()
+            template = st['template']
+            logger.info(
+                f"[Sanitizer] skipped={st['skipped']} analyzed={st['analyzed']} "
+                f"cache_hit_rate={st['exact']['hit_rate']:.0%} cache_bytes={st['exact']['bytes']}"
+                + (f" template_hit_rate={template['hit_rate']:.0%}" if template else "")
+            )
+
+
 # ---- graceful shutdown ----
 
 def signal_handler(signum, frame):
     logger.info(f"Signal {signum} received - shutting down")
     try:
         if services.channel and not services.channel.is_closed:
-            services.channel.stop_consuming()
+            if BATCH_MODE:
+                services.channel.cancel()
+            else:
+                services.channel.stop_consuming()
     except Exception:
         logger.exception('Error during shutdown')
+    if services.llm_pool:
+        services.llm_pool.shutdown(wait=False)
+    if services.sanitizer_pool:
+        services.sanitizer_pool.shutdown()
     try:
         if services.connection and not services.connection.is_closed:
             services.connection.close()
@@ -659,25 +1864,132 @@ def signal_handler(signum, frame):
     sys.exit(0)
 
 
-# ---- entrypoint ----
-if __name__ == '__main__':
+# ---- consumer process ----
+
+def run_consumer():
+    """Initialize the services of this process and consume with the configured topology."""
+    services.initialize()
+    services.initialize_rabbitmq()
+    if CB_STATS_LOG_SECONDS:
+        threading.Thread(target=log_breaker_stats_forever, name='breaker-stats', daemon=True).start()
+
+    if CONSUMER_TOPOLOGY == 'staged':
+        logger.info(f"Starting staged topology; stages={CONSUMER_STAGES}; DLQ={DLQ_ENABLED}")
+        run_staged_topology()
+    elif BATCH_MODE:
+        logger.info(
+            f"Listening on {consumer_queue()} in batch mode; batch_size={CONSUMER_BATCH_SIZE}; "
+            f"batch_wait={CONSUMER_BATCH_WAIT_MS}ms; llm_concurrency={LLM_CONCURRENCY}; DLQ={DLQ_ENABLED}"
+        )
+        if sharding_enabled():
+            consume_batches_fair()
+        else:
+            consume_batches()
+    elif sharding_enabled():
+        logger.info(
+            f"Fair scheduling across {Config.APP_QUEUE_SHARDS} application shard queues; "
+            f"max_inflight={Config.SHARD_MAX_INFLIGHT}; DLQ={DLQ_ENABLED}"
+        )
+        consume_fair(services.channel, services.connection, callback)
+    else:
+        services.channel.basic_consume(queue=consumer_queue(), on_message_callback=callback, auto_ack=False)
+
+        logger.info(f"Listening on {consumer_queue()}; prefetch={PREFETCH_COUNT}; DLQ={DLQ_ENABLED}")
+        services.channel.start_consuming()
+
+
+def fatal_exit():
+    logger.exception('Fatal error in consumer')
+    try:
+        if services.connection and not services.connection.is_closed:
+            services.connection.close()
+    except Exception:
+        pass
+    sys.exit(1)
+
+
+# ---- prefork mode ----
+# The parent loads the Presidio/spaCy model once, freezes the GC so the loaded
+# objects are never touched by a collection again, and forks CONSUMER_PREFORK_WORKERS
+# consumers that share those pages copy-on-write. Everything else (Gemini, Qdrant,
+# AMQP, DB connections) is created in each worker after the fork, since those
+# clients' sockets and threads don't survive one.
+
+def prefork_worker(index: int):
+    # restarted workers are forked after the parent swapped its handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
-
     try:
-        services.initialize()
-        services.initialize_rabbitmq()
+        run_consumer()
+    except SystemExit:
+        raise
+    except Exception:
+        fatal_exit()
+
+
+def prefork_restart_delay(previous: float, uptime: float) -> float:
+    """Wait before restarting a worker that exited after `uptime` seconds; `previous` is its last wait."""
+    if uptime >= PREFORK_HEALTHY_UPTIME_SECONDS:
+        previous = 0.0
+    return decorrelated_jitter(previous, PREFORK_RESTART_DELAY_SECONDS, PREFORK_RESTART_MAX_DELAY_SECONDS)
+
+
+def run_prefork(worker_count: int):
+    services.sanitizer = LogSanitizer()
+    # run the pipeline once so lazily built parts are loaded before the fork too
+    services.sanitizer.sanitize("Sample error for John Smith at 10.0.0.1")
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Sanitizer preloaded ({gc.get_freeze_count()} objects frozen) - forking {worker_count} worker(s)")
+
+    ctx = multiprocessing.get_context('fork')
+    stopping = threading.Event()
+
+    def spawn(index: int):
+        p = ctx.Process(target=prefork_worker, args=(index,), name=f'consumer-{index}')
+        p.start()
+        return p
+
+    def stop(signum, frame):
+        logger.info(f"Signal {signum} received - stopping {worker_count} worker(s)")
+        stopping.set()
+
+    workers = [spawn(i) for i in range(worker_count)]
+    started_at = [time.monotonic()] * worker_count
+    delays = [0.0] * worker_count
+    restart_at: List[Optional[float]] = [None] * worker_count
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while not stopping.wait(PREFORK_POLL_SECONDS):
+        now = time.monotonic()
+        for i, p in enumerate(workers):
+            if p.is_alive():
+                continue
+            if restart_at[i] is None:
+                delays[i] = prefork_restart_delay(delays[i], now - started_at[i])
+                restart_at[i] = now + delays[i]
+                logger.warning(f"Worker consumer-{i} exited with code {p.exitcode} - restarting in {delays[i]:.1f}s")
+            elif now >= restart_at[i]:
+                workers[i] = spawn(i)
+                started_at[i], restart_at[i] = now, None
+
+    for p in workers:
+        if p.is_alive():
+            p.terminate()
+    for p in workers:
+        p.join(timeout=30)
 
-        services.channel.basic_consume(queue=Config.QUEUE, on_message_callback=callback, auto_ack=False)
 
-        logger.info(f"Listening on {Config.QUEUE}; prefetch={PREFETCH_COUNT}; DLQ={DLQ_ENABLED}")
-        services.channel.start_consuming()
+# ---- entrypoint ----
+if __name__ == '__main__':
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
 
+    try:
+        if CONSUMER_PREFORK_WORKERS > 0:
+            run_prefork(CONSUMER_PREFORK_WORKERS)
+        else:
+            run_consumer()
     except Exception as e:
-        logger.exception('Fatal error in consumer')
-        try:
-            if services.connection and not services.connection.is_closed:
-                services.connection.close()
-        except Exception:
-            pass
-        sys.exit(1)
+        fatal_exit()
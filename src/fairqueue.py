@@ -0,0 +1,202 @@
+"""
+fairqueue.py
+------------
+Per-application sharding of the error queue and a deficit-round-robin
+scheduler so one noisy application can't starve the others.
+
+Routing
+  Shard i is queue <QUEUE>.s<i>. The keys depend on EXCHANGE_TYPE:
+    topic   publish <ROUTING_KEY>.s<shard>.<app>, bind <ROUTING_KEY>.s<i>.*
+    direct  publish <ROUTING_KEY>.s<shard>,       bind <ROUTING_KEY>.s<i>
+  fanout and headers exchanges ignore routing keys and are rejected at startup.
+  An application maps to a shard through APP_SHARD_MAP (explicit, e.g. to give
+  a noisy or critical app its own queue) or a stable CRC32 hash.
+
+Scheduling
+  The consumer pulls from the shard queues with basic_get in deficit round
+  robin: each visit adds the shard's weight (SHARD_WEIGHTS) to its deficit and
+  every delivery costs 1. A shard with SHARD_MAX_INFLIGHT unacked deliveries
+  is skipped until some are released.
+
+Consistent hashing (CONSISTENT_HASH_EXCHANGE)
+  Alternative to sharding for cache locality across consumer replicas. The
+  extractor publishes to an x-consistent-hash exchange with the error
+  fingerprint as routing key; every replica binds its own queue with a weight,
+  so identical errors keep landing on the same warm replica and only ~1/N of
+  the keys move when a replica joins or leaves. Each replica needs a stable
+  queue name (CONSUMER_REPLICA_QUEUE) that survives restarts. Takes
+  precedence over sharding.
+"""
+
+import logging
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_int_map(spec: str) -> Dict[str, int]:
+    result: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            key, value = item.rsplit("=", 1)
+            try:
+                result[key.strip()] = int(value)
+            except ValueError:
+                logger.warning(f"Ignoring invalid entry '{item}'")
+    return result
+
+
+_app_shard_map = _parse_int_map(Config.APP_SHARD_MAP)
+
+
+CONSISTENT_HASH_EXCHANGE_TYPE = "x-consistent-hash"
+
+
+def consistent_hash_enabled() -> bool:
+    return bool(Config.CONSISTENT_HASH_EXCHANGE)
+
+
+def replica_queue() -> str:
+    """This consumer replica's queue behind the consistent-hash exchange."""
+    return Config.CONSUMER_REPLICA_QUEUE
+
+
+def check_replica_queue():
+    """
+    Refuse to join the hash ring without a stable CONSUMER_REPLICA_QUEUE: a
+    name derived from the hostname changes when a container restarts, leaving
+    the old queue bound and collecting its share of errors with no consumer.
+    """
+    if consistent_hash_enabled() and not Config.CONSUMER_REPLICA_QUEUE:
+        raise ValueError(
+            "CONSISTENT_HASH_EXCHANGE needs a stable CONSUMER_REPLICA_QUEUE per replica (e.g. <QUEUE>.<ordinal>)"
+        )
+
+
+def sharding_enabled() -> bool:
+    return Config.APP_QUEUE_SHARDS > 0 and not consistent_hash_enabled()
+
+
+def shard_for_app(app_name: str) -> int:
+    if app_name in _app_shard_map:
+        return _app_shard_map[app_name] % Config.APP_QUEUE_SHARDS
+    return zlib.crc32((app_name or "").encode("utf-8")) % Config.APP_QUEUE_SHARDS
+
+
+def shard_queue(shard: int) -> str:
+    return f"{Config.QUEUE}.s{shard}"
+
+
+# exchange types that route on the routing key, so a key can address a shard
+SHARDABLE_EXCHANGE_TYPES = ("topic", "direct")
+
+
+def _topic_exchange() -> bool:
+    return (Config.EXCHANGE_TYPE or "").lower() == "topic"
+
+
+def check_shard_exchange():
+    """Refuse to start sharding on an exchange type that can't route to shard queues."""
+    if sharding_enabled() and (Config.EXCHANGE_TYPE or "").lower() not in SHARDABLE_EXCHANGE_TYPES:
+        raise ValueError(
+            f"APP_QUEUE_SHARDS needs a topic or direct EXCHANGE_TYPE, got '{Config.EXCHANGE_TYPE}'"
+        )
+
+
+def shard_binding_key(shard: int) -> str:
+    if _topic_exchange():
+        return f"{Config.ROUTING_KEY}.s{shard}.*"
+    return f"{Config.ROUTING_KEY}.s{shard}"
+
+
+def app_routing_key(app_name: str) -> str:
+    """Routing key carrying the shard and, on a topic exchange, the (topic-safe) application name."""
+    shard_key = f"{Config.ROUTING_KEY}.s{shard_for_app(app_name)}"
+    if not _topic_exchange():
+        # direct exchanges match the whole key, which must equal the shard's binding
+        return shard_key
+    app_token = re.sub(r"[.#*\s]+", "_", app_name or "UNKNOWN_APP")
+    return f"{shard_key}.{app_token}"
+
+
+def shard_from_routing_key(routing_key: str) -> Optional[int]:
+    match = re.match(re.escape(Config.ROUTING_KEY) + r"\.s(\d+)(?:\.|$)", routing_key or "")
+    return int(match.group(1)) if match else None
+
+
+def all_shard_queues() -> List[str]:
+    return [shard_queue(i) for i in range(Config.APP_QUEUE_SHARDS)]
+
+
+class DeficitRoundRobin:
+    """Weighted, concurrency-capped fair pull across several queues via basic_get."""
+
+    def __init__(self, queues: List[str], weights: Optional[Dict[str, int]] = None, max_inflight: int = 0):
+        self.queues = queues
+        self.weights = {q: max(1, (weights or {}).get(q, 1)) for q in queues}
+        self.max_inflight = max_inflight
+        self.deficit = {q: 0 for q in queues}
+        self.inflight = {q: 0 for q in queues}
+        self._index = 0
+        self._granted = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "DeficitRoundRobin":
+        shard_weights = _parse_int_map(Config.SHARD_WEIGHTS)
+        queues = all_shard_queues()
+        weights = {shard_queue(int(k)): v for k, v in shard_weights.items() if k.isdigit()}
+        return cls(queues, weights=weights, max_inflight=Config.SHARD_MAX_INFLIGHT)
+
+    def next_delivery(self, channel) -> Optional[Tuple[str, Any, Any, bytes]]:
+        """
+        Return (queue, method, properties, body) for the next delivery in DRR
+        order, or None when every eligible queue is empty or at its cap.
+        """
+        empty_visits = 0
+        while empty_visits < len(self.queues):
+            queue = self.queues[self._index]
+
+            with self._lock:
+                capped = self.max_inflight and self.inflight[queue] >= self.max_inflight
+            if capped:
+                self._advance()
+                empty_visits += 1
+                continue
+
+            # each visit to a queue earns its weight in credit once
+            if not self._granted:
+                self.deficit[queue] += self.weights[queue]
+                self._granted = True
+            if self.deficit[queue] < 1:
+                self._advance()
+                continue
+
+            method, properties, body = channel.basic_get(queue=queue, auto_ack=False)
+            if method is None:
+                # idle queues don't bank credit
+                self.deficit[queue] = 0
+                self._advance()
+                empty_visits += 1
+                continue
+
+            self.deficit[queue] -= 1
+            with self._lock:
+                self.inflight[queue] += 1
+            return queue, method, properties, body
+        return None
+
+    def release(self, queue: str):
+        """Mark one delivery from `queue` as acked/requeued."""
+        with self._lock:
+            if self.inflight.get(queue, 0) > 0:
+                self.inflight[queue] -= 1
+
+    def _advance(self):
+        self._index = (self._index + 1) % len(self.queues)
+        self._granted = False
@@ -0,0 +1,13 @@
+import hashlib
+import re
+
+
+def error_fingerprint(application_name: str, error_code: str, description: str) -> str:
+    """
+    Stable identity of an error occurrence: same application, code and
+    (whitespace-normalized) raw description -> same fingerprint.
+    Shared by the extractor and the consumer so both sides agree on it.
+    """
+    normalized = re.sub(r"\s+", " ", description or "").strip()
+    raw = f"{application_name or ''}\x1f{error_code or ''}\x1f{normalized}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
@@ -1,11 +1,16 @@
-import json
 import logging
-import re
-from typing import Dict, Any, Optional
+import queue
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate, ChatPromptTemplate
-from src.prompt import PromptBuilder
+from src.prompt import PromptBuilder, RESPONSE_SCHEMA, ANSWER_FIELDS
+from src.jsonrepair import JSONRepairer, parse_json
 from src.config import Config
+from src.ratelimit import get_rate_limiter, estimate_tokens
+from src.tokenbudget import fit_prompt
+from src.promptcache import PromptCache
 
 logger = logging.getLogger(__name__)
 
@@ -27,54 +32,254 @@ class GeminiClient:
             top_k=40,
             max_output_tokens=8192,
             convert_system_message_to_human=True, # Sometimes needed for certain Gemini versions/LangChain adaptors
-            model_kwargs={"response_mime_type": "application/json"}
         )
+        # sent with every request: ChatGoogleGenerativeAI has no model_kwargs field to carry it
+        self.generation_config = self._generation_config()
         self.prompt_builder = PromptBuilder()
+        # built once per client and reused by every call; per-call options (timeout,
+        # cached content) go in as invoke kwargs instead of copies of the model
+        self.prompt_template = self.prompt_builder.get_prompt_template()
+        # static system prompt served from a Gemini cached content when enabled
+        self.prompt_cache: Optional[PromptCache] = None
+        self.variable_template = self.prompt_builder.get_variable_prompt_template()
+        if Config.GEMINI_PROMPT_CACHE:
+            self.prompt_cache = PromptCache(
+                self.api_key, self.model, self.prompt_builder.get_system_prompt(),
+                ttl_seconds=Config.GEMINI_PROMPT_CACHE_TTL_SECONDS
+            )
+        self.rate_limiter = get_rate_limiter("generation")
         logger.info(f"Initialized GeminiClient (LangChain) with model: {self.model}")
 
+    @staticmethod
+    def _generation_config() -> Dict[str, Any]:
+        """JSON output, constrained to the rootCause/solution1-3 schema when enabled."""
+        generation_config = {"response_mime_type": "application/json"}
+        if Config.GEMINI_RESPONSE_SCHEMA:
+            generation_config["response_schema"] = _request_schema(RESPONSE_SCHEMA)
+        return generation_config
+
     def _extract_json(self, text: str) -> Dict[str, Any]:
-        """Extract JSON from response, handling potential trailing commas"""
-        match = re.search(r'\{.*\}', text, re.DOTALL)
-        if match:
-            candidate = match.group(0).strip()
-            # Remove trailing commas like ", }" or ", ]"
-            candidate = re.sub(r",\s*([\]}])", r"\1", candidate)
-            try:
-                return json.loads(candidate)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error: {e}")
-        
-        # If we reach here, extraction failed
-        logger.error(f"Failed to extract JSON from response. Raw content:\n{text}")
-        raise ValueError("Could not extract JSON from response")
+        """
+        Parse the JSON answer, repairing trailing commas, bad escapes and a
+        truncated tail instead of failing (a failure costs a full
+        re-generation). Repairs that would drop or guess content, and answers
+        without a rootCause and solution1 instructions, are rejected.
+        """
+        try:
+            result = parse_json(text)
+        except ValueError as e:
+            logger.error(f"Failed to extract JSON from response ({e}). Raw content:\n{text}")
+            raise ValueError("Could not extract JSON from response") from e
+
+        if not isinstance(result, dict):
+            logger.error(f"JSON response is not an object. Raw content:\n{text}")
+            raise ValueError("Could not extract JSON from response")
+        # solutions cut off by truncation (or returned as bare strings) keep the expected shape
+        for field in ANSWER_FIELDS[1:]:
+            value = result.get(field)
+            if isinstance(value, str):
+                result[field] = {"instructions": value}
+            elif not isinstance(value, dict):
+                result[field] = {"instructions": ""}
+        root_cause = result.get("rootCause")
+        instructions = result["solution1"].get("instructions")
+        if not (isinstance(root_cause, str) and root_cause.strip()) or not (isinstance(instructions, str) and instructions.strip()):
+            logger.error(f"JSON response lacks rootCause or solution1.instructions. Raw content:\n{text}")
+            raise ValueError("JSON response lacks rootCause or solution1.instructions")
+        return result
 
-    def analyze_error(self, error_code: str, error_description: str, context: str = "") -> Dict[str, Any]:
+    def _select_template(self, use_cache: bool = True) -> Tuple[ChatPromptTemplate, Optional[str]]:
         """
-        Analyze error using LangChain invocation
+        Prompt template for one call and the cached content it relies on (None = full prompt).
+        With a live cached content only the per-error template is sent.
         """
-        # Get ChatPromptTemplate from builder (pre-filled with platform context from Config)
-        prompt_template = self.prompt_builder.get_prompt_template()
+        cache_name = self.prompt_cache.name() if (self.prompt_cache and use_cache) else None
+        return (self.variable_template if cache_name else self.prompt_template), cache_name
 
-        # Create chain using LCEL (LangChain Expression Language) style or simple piping
-        # chain = prompt | llm
-        chain = prompt_template | self.llm
+    def analyze_error(self, error_code: str, error_description: str, context: str = "", timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Analyze error using LangChain invocation.
+        `timeout` (seconds) caps this request below GEMINI_TIMEOUT_SECONDS.
+        """
+        template, cache_name = self._select_template()
         
         try:
             logger.info("Invoking Gemini via LangChain chain...")
-            
+
+            # Token budget: dedupe and trim the knowledge-base context and the description
+            error_description, context = fit_prompt(error_description, context)
+
             # Context handling: If None or empty, provide a fallback "None" string so template parses
             context_val = context if context else "None"
+
+            # Wait for room in the RPM/TPM budget before sending (input tokens only)
+            prompt_tokens = estimate_tokens(
+                self.prompt_builder.SYSTEM_TEMPLATE + error_code + error_description + context_val
+            )
+            self.rate_limiter.acquire(prompt_tokens)
             
-            response_msg = chain.invoke({
+            inputs = {
                 "ERROR_CODE": error_code, 
                 "ERROR_DESCRIPTION": error_description,
                 "CONTEXT": context_val
-            })
+            }
+            try:
+                content = self._generate(template, inputs, timeout, cache_name)
+            except Exception as e:
+                if not cache_name or isinstance(e, TimeoutError):
+                    raise
+                # cached content expired or was evicted provider-side: resend the full prompt once
+                logger.warning(f"Gemini call with cached content {cache_name} failed ({e}) - retrying with the full prompt")
+                self.prompt_cache.invalidate(cache_name)
+                template, _ = self._select_template(use_cache=False)
+                # a second request against the same quota
+                self.rate_limiter.acquire(prompt_tokens)
+                content = self._generate(template, inputs, timeout)
             
-            content = response_msg.content
             logger.info("Received response from Gemini (LangChain)")
             return self._extract_json(content)
             
         except Exception as e:
             logger.error(f"Gemini/LangChain request failed: {e}")
             raise
+
+    # ---- generation ----
+
+    def _generate(self, template: ChatPromptTemplate, inputs: Dict[str, str], timeout: Optional[float] = None,
+                  cache_name: Optional[str] = None) -> str:
+        """Response text of one call, blocking or streamed (GEMINI_STREAMING)."""
+        prompt = template.invoke(inputs)
+        # forwarded by ChatGoogleGenerativeAI to generate_content / stream_generate_content
+        options: Dict[str, Any] = {
+            "timeout": timeout or Config.GEMINI_TIMEOUT_SECONDS,
+            "generation_config": self.generation_config,
+        }
+        if cache_name:
+            options["cached_content"] = cache_name
+        if not Config.GEMINI_STREAMING:
+            return _text(self._invoke(prompt, options).content)
+        return self._stream(self.llm, prompt, options["timeout"], **options)
+
+    def _invoke(self, prompt: Any, options: Dict[str, Any]) -> Any:
+        """
+        Blocking call, cut off after options["timeout"] seconds. That deadline
+        also ends the request provider-side, but the adaptor retries once with
+        backoff, so the caller waits on a helper thread instead.
+        """
+        timeout = options["timeout"]
+        result: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=1)
+
+        def call():
+            try:
+                result.put(("ok", self.llm.invoke(prompt, **options)))
+            except Exception as e:
+                result.put(("error", e))
+
+        threading.Thread(target=call, name="gemini-call", daemon=True).start()
+        try:
+            kind, value = result.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Gemini call: no answer within {timeout:.1f}s")
+        if kind == "error":
+            raise value
+        return value
+
+    def _stream(self, chain, inputs: Any, total_timeout: float, **options) -> str:
+        """
+        Stream the answer and stop as soon as its JSON object is closed.
+        Chunks are read on a helper thread so the first-token and total
+        timeouts hold even while the HTTP stream is stalled.
+        """
+        chunks: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        stop = threading.Event()
+        streams = []  # the open stream, so a timeout can close it from this thread
+
+        def produce():
+            stream = None
+            try:
+                stream = iter(chain.stream(inputs, **options))
+                streams.append(stream)
+                for chunk in stream:
+                    if stop.is_set():
+                        break
+                    chunks.put(("chunk", _text(chunk.content)))
+                chunks.put(("end", None))
+            except Exception as e:
+                chunks.put(("error", e))
+            finally:
+                _close_stream(stream)
+
+        threading.Thread(target=produce, name="gemini-stream", daemon=True).start()
+        started = time.monotonic()
+        first_token_timeout = Config.GEMINI_FIRST_TOKEN_TIMEOUT_SECONDS or total_timeout
+        repairer = JSONRepairer()
+        parts = []
+        try:
+            while True:
+                elapsed = time.monotonic() - started
+                limit = min(first_token_timeout, total_timeout) if not parts else total_timeout
+                try:
+                    kind, value = chunks.get(timeout=max(limit - elapsed, 0.001))
+                except queue.Empty:
+                    what = "first token" if not parts else "complete answer"
+                    raise TimeoutError(f"Gemini stream: no {what} within {limit:.1f}s")
+                if kind == "error":
+                    raise value
+                if kind == "end":
+                    logger.warning("Gemini stream ended before the JSON object was closed - repairing")
+                    break
+                parts.append(value)
+                if repairer.feed(value):
+                    logger.debug(f"Gemini JSON complete after {time.monotonic() - started:.1f}s - closing the stream")
+                    break
+        finally:
+            stop.set()
+            # closing here cancels a transport stream even mid-read; a generator busy on
+            # the producer thread is closed by it as soon as its read returns
+            for stream in streams:
+                _close_stream(stream)
+        return "".join(parts)
+
+
+def _request_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    An OpenAPI-style schema in the field names of the v1beta Schema proto the
+    adaptor sends ("type": "object" -> "type_": "OBJECT"). propertyOrdering has
+    no proto field; Gemini orders properties by name, which already matches.
+    """
+    converted: Dict[str, Any] = {}
+    for key, value in schema.items():
+        if key == "type":
+            converted["type_"] = value.upper()
+        elif key == "format":
+            converted["format_"] = value
+        elif key == "properties":
+            converted["properties"] = {name: _request_schema(prop) for name, prop in value.items()}
+        elif key == "items":
+            converted["items"] = _request_schema(value)
+        elif key in ("description", "nullable", "enum", "required"):
+            converted[key] = value
+    return converted
+
+
+def _close_stream(stream: Any):
+    """Close a chunk iterator (and its HTTP response); a no-op while it is busy in another thread."""
+    close = getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except ValueError:
+        pass  # "generator already executing": the producer thread closes it
+    except Exception as e:
+        logger.debug(f"Closing the Gemini stream failed: {e}")
+
+
+def _text(content: Any) -> str:
+    """Message content as text (newer adaptors return a list of parts)."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in content or []
+    )
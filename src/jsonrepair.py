@@ -0,0 +1,302 @@
+"""
+jsonrepair.py
+-------------
+Tolerant, incremental parser for the JSON object returned by the LLM.
+
+JSONRepairer scans the text once, character by character, and can be fed
+chunk by chunk as a response streams in. It keeps track of strings, escapes
+and open objects/arrays so it knows the moment the top-level object closes
+(`complete`), and finish() turns whatever it has seen into valid JSON.
+
+Repairs that keep every value intact are applied silently:
+
+  - text before the first "{" (markdown fences, prose) and after the closing
+    "}" is ignored
+  - trailing commas and duplicate commas are dropped
+  - raw newlines/tabs inside strings are escaped, invalid escapes like \\' or
+    a Windows path's \\U are kept literally
+  - a quote inside a string (one not followed by , : } ] or the end) is escaped
+  - a response cut off between values gets its open objects/arrays closed
+
+Repairs that would have to guess are recorded in `lossy` instead, and
+parse_json rejects the response: a stray token, a missing value ("a":,),
+a dangling key, or a string/number cut off by truncation.
+
+    parse_json('```json\\n{"rootCause": "x", "solution1": {"instructions": "do it"}')
+    -> {'rootCause': 'x', 'solution1': {'instructions': 'do it'}}
+    parse_json('{"a":,"b":1}')
+    -> ValueError: Could not repair JSON response: missing value after ':'
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+VALID_ESCAPES = set('"\\/bfnrtu')
+HEX_DIGITS = set("0123456789abcdefABCDEF")
+LITERAL_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+-.")
+CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+WHITESPACE = set(" \t\r\n")
+# what may follow the quote that closes a string; any other quote is part of the text
+STRING_FOLLOWERS = set(",:}]")
+COMPLETE_LITERALS = ("true", "false", "null")
+
+
+class _Frame:
+    """An open object or array: its closer, what comes next, where its current key began."""
+
+    __slots__ = ("closer", "expect", "key_start")
+
+    def __init__(self, closer: str):
+        self.closer = closer
+        # object: key -> colon -> value -> comma; array: value -> comma
+        self.expect = "key" if closer == "}" else "value"
+        self.key_start = 0
+
+
+class JSONRepairer:
+    def __init__(self):
+        self.out: List[str] = []
+        self.stack: List[_Frame] = []
+        self.started = False
+        self.complete = False
+        self.in_string = False
+        self.string_is_key = False
+        self.in_literal = False
+        self.literal_start = 0
+        self.pending = ""  # an escape sequence or closing quote split across chunks
+        self.lossy: Optional[str] = None  # first repair that dropped or guessed content
+
+    # ---- feeding ----
+
+    def feed(self, chunk: str, final: bool = False) -> bool:
+        """Consume the next piece of the response; True once the top-level object is closed."""
+        text = self.pending + chunk
+        self.pending = ""
+        i = 0
+        while i < len(text) and not self.complete:
+            ch = text[i]
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self._open("}")
+                i += 1
+                continue
+            if self.in_string:
+                if ch == "\\":
+                    consumed = self._escape(text, i)
+                    if consumed == 0:
+                        if final:
+                            self._lose("escape sequence cut off")
+                            break
+                        self.pending = text[i:]
+                        return False
+                    i += consumed
+                    continue
+                if ch == '"':
+                    follower = _next_significant(text, i + 1)
+                    if follower is None and not final:
+                        self.pending = text[i:]  # closing or inner quote: decided by the next chunk
+                        return False
+                    if follower is not None and follower not in STRING_FOLLOWERS:
+                        self.out.append('\\"')
+                        i += 1
+                        continue
+                self._string_char(ch)
+            else:
+                self._structural(ch)
+            i += 1
+        return self.complete
+
+    def _string_char(self, ch: str):
+        if ch == '"':
+            self.in_string = False
+            self.out.append(ch)
+            self._after_string()
+        elif ch in CONTROL_ESCAPES:
+            self.out.append(CONTROL_ESCAPES[ch])
+        elif ord(ch) < 0x20:
+            self.out.append(f"\\u{ord(ch):04x}")
+        else:
+            self.out.append(ch)
+
+    def _escape(self, text: str, i: int) -> int:
+        """Copy the escape at text[i]; returns chars consumed (0 = need more input)."""
+        if i + 1 >= len(text):
+            return 0
+        nxt = text[i + 1]
+        if nxt == "u":
+            if i + 6 > len(text):
+                return 0
+            if all(c in HEX_DIGITS for c in text[i + 2:i + 6]):
+                self.out.append(text[i:i + 6])
+                return 6
+            self.out.append("\\\\")
+            return 1
+        if nxt in VALID_ESCAPES:
+            self.out.append(text[i:i + 2])
+            return 2
+        # invalid escape: keep the backslash as a literal character
+        self.out.append("\\\\")
+        return 1
+
+    def _structural(self, ch: str):
+        frame = self.stack[-1]
+        if self.in_literal:
+            if ch in LITERAL_CHARS:
+                self.out.append(ch)
+                return
+            self._end_literal()
+
+        if ch in WHITESPACE:
+            self.out.append(ch)
+        elif ch == '"':
+            if frame.expect == "key":
+                frame.key_start = self._trimmed_len()
+                self.string_is_key = True
+            elif frame.expect == "value":
+                self.string_is_key = False
+            else:
+                self._lose(f"string where {frame.expect!r} was expected")
+                return
+            self.in_string = True
+            self.out.append(ch)
+        elif ch in "{[":
+            if frame.expect != "value":
+                self._lose(f"{ch!r} where {frame.expect!r} was expected")
+                return
+            self.out.append(ch)
+            self._open("}" if ch == "{" else "]")
+        elif ch in "}]":
+            self._close()
+        elif ch == ":":
+            if frame.expect != "colon":
+                self._lose(f"':' where {frame.expect!r} was expected")
+                return
+            frame.expect = "value"
+            self.out.append(ch)
+        elif ch == ",":
+            if frame.expect == "comma":
+                frame.expect = "key" if frame.closer == "}" else "value"
+                self.out.append(ch)
+            elif frame.closer == "}" and frame.expect == "value":
+                self._lose("missing value after ':'")
+            # otherwise a duplicate comma: dropped
+        elif ch in LITERAL_CHARS and frame.expect == "value":
+            self.in_literal = True
+            self.literal_start = len(self.out)
+            self.out.append(ch)
+        else:
+            self._lose(f"unexpected {ch!r}")
+
+    def _end_literal(self):
+        self.in_literal = False
+        self.stack[-1].expect = "comma"
+        try:
+            json.loads("".join(self.out[self.literal_start:]))
+        except ValueError:
+            self._lose(f"invalid literal {''.join(self.out[self.literal_start:])!r}")
+
+    def _open(self, closer: str):
+        if not self.stack:
+            self.out.append("{")
+        self.stack.append(_Frame(closer))
+
+    def _after_string(self):
+        frame = self.stack[-1]
+        frame.expect = "colon" if self.string_is_key else "comma"
+
+    def _close(self):
+        frame = self.stack.pop()
+        if frame.closer == "}" and frame.expect in ("colon", "value"):
+            # key without a value: drop it
+            self._lose("key without a value")
+            del self.out[frame.key_start:]
+        self._strip_trailing_comma()
+        self.out.append(frame.closer)
+        if self.stack:
+            self.stack[-1].expect = "comma"
+        else:
+            self.complete = True
+
+    def _lose(self, reason: str):
+        if self.lossy is None:
+            self.lossy = reason
+
+    # ---- output ----
+
+    def _trimmed_len(self) -> int:
+        """Length of the output without trailing whitespace and a trailing comma."""
+        n = len(self.out)
+        while n and self.out[n - 1] in WHITESPACE:
+            n -= 1
+        if n and self.out[n - 1] == ",":
+            n -= 1
+        return n
+
+    def _strip_trailing_comma(self):
+        del self.out[self._trimmed_len():]
+
+    def finish(self) -> Optional[str]:
+        """Valid JSON for everything fed so far (truncation repaired), or None before any '{'."""
+        if not self.started:
+            return None
+        if self.pending:
+            self.feed("", final=True)
+        if not self.complete:
+            if self.in_string:
+                self._lose("string cut off")
+                self.in_string = False
+                self.out.append('"')
+                self._after_string()
+            if self.in_literal:
+                self.in_literal = False
+                literal = "".join(self.out[self.literal_start:])
+                if literal in COMPLETE_LITERALS:
+                    self.stack[-1].expect = "comma"
+                else:
+                    # cut-off true/false/null or a number that may be missing digits: drop it (and its key)
+                    self._lose(f"value {literal!r} cut off")
+                    del self.out[self.literal_start:]
+                    self.stack[-1].expect = "value"
+            while not self.complete:
+                self._close()
+        return "".join(self.out)
+
+
+def _next_significant(text: str, i: int) -> Optional[str]:
+    """First non-whitespace character at or after text[i], None at the end."""
+    while i < len(text):
+        if text[i] not in WHITESPACE:
+            return text[i]
+        i += 1
+    return None
+
+
+def repair_json(text: str) -> Optional[str]:
+    repairer = JSONRepairer()
+    repairer.feed(text)
+    return repairer.finish()
+
+
+def parse_json(text: str) -> Dict[str, Any]:
+    """
+    Parse the first JSON object in `text`, repairing it when that loses
+    nothing; ValueError when the repair would have to drop or guess content.
+    """
+    start = text.find("{")
+    if start != -1:
+        try:
+            return json.JSONDecoder().raw_decode(text, start)[0]
+        except json.JSONDecodeError:
+            pass
+    repairer = JSONRepairer()
+    repairer.feed(text)
+    repaired = repairer.finish()
+    if repaired is None:
+        raise ValueError("No JSON object in response")
+    if repairer.lossy:
+        raise ValueError(f"Could not repair JSON response: {repairer.lossy}")
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Could not repair JSON response: {e}") from e
@@ -0,0 +1,75 @@
+import logging
+import threading
+import time
+from typing import List, Optional
+
+import pika
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BacklogMonitor:
+    """
+    Decides when the consumer should shed load.
+
+    Overloaded when the intake queues hold more than `depth_threshold` ready
+    messages, or a message waited longer than `age_threshold_sec` before being
+    picked up. Queue depth is read with a passive declare and cached for
+    `check_interval_sec`, so any worker thread can ask. pika connections aren't
+    thread-safe, so each check opens its own short-lived connection in the
+    calling thread instead of sharing one. A threshold of 0 disables that trigger.
+    """
+
+    def __init__(self, queues: List[str], depth_threshold: int = 0, age_threshold_sec: int = 0, check_interval_sec: int = 10):
+        self.queues = queues
+        self.depth_threshold = depth_threshold
+        self.age_threshold_sec = age_threshold_sec
+        self.check_interval_sec = check_interval_sec
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._checked_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.depth_threshold or self.age_threshold_sec)
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval_sec:
+                return self._depth
+            self._checked_at = time.monotonic()
+            connection = None
+            try:
+                params = pika.URLParameters(Config.RABBIT_URL)
+                params.socket_timeout = 10
+                connection = pika.BlockingConnection(params)
+                ch = connection.channel()
+                self._depth = sum(
+                    ch.queue_declare(queue=queue, passive=True).method.message_count
+                    for queue in self.queues
+                )
+            except Exception as e:
+                # keep the last known depth; never let monitoring fail a message
+                logger.warning(f"Queue depth check failed: {e}")
+            finally:
+                if connection is not None and connection.is_open:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            return self._depth
+
+    def is_overloaded(self, enqueued_at: Optional[float] = None) -> bool:
+        if self.age_threshold_sec and enqueued_at:
+            age = time.time() - enqueued_at
+            if age > self.age_threshold_sec:
+                logger.warning(f"Overload: message waited {age:.0f}s (threshold={self.age_threshold_sec}s)")
+                return True
+        if self.depth_threshold:
+            depth = self.queue_depth()
+            if depth > self.depth_threshold:
+                logger.warning(f"Overload: queue depth {depth} (threshold={self.depth_threshold})")
+                return True
+        return False
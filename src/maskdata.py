@@ -1,68 +1,445 @@
-from presidio_analyzer import AnalyzerEngine, Pattern, PatternRecognizer
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from presidio_analyzer import AnalyzerEngine, BatchAnalyzerEngine, EntityRecognizer, Pattern, PatternRecognizer, RecognizerResult
 from presidio_anonymizer import AnonymizerEngine
 from presidio_anonymizer.entities import OperatorConfig
 from src.config import Config
 
+try:
+    import regex as timed_regex  # installed with presidio-analyzer; supports match timeouts
+except ImportError:
+    timed_regex = None
+
+logger = logging.getLogger(__name__)
+
+# Up to 40 chars between a keyword and the next one (or the value), crossing at most
+# two "="/":" separators so nested config still matches:
+#   {"azure": {"storage_key": "..."}}   azure:\n  storage:\n    key: ...
+KEYWORD_GAP = r"[^=:]{0,40}?(?:[=:][^=:]{0,40}?){0,2}?"
+
+#  Custom Recognizers
+CUSTOM_PATTERNS = [
+    # Cloud & API Keys
+    ("AWS_ACCESS_KEY", r"AKIA[0-9A-Z]{16}", 0.95),
+    # gaps between keyword and value are bounded (KEYWORD_GAP), so a long line without a
+    # match costs linear time instead of O(n^2) backtracking
+    ("AWS_SECRET_KEY", rf"(?i)aws_secret{KEYWORD_GAP}[=:]\s{{0,5}}['\"]?([A-Za-z0-9/+=]{{40}})['\"]?", 0.9),
+    ("AZURE_KEY", rf"(?i)(azure|az){KEYWORD_GAP}key{KEYWORD_GAP}[=:]\s{{0,5}}['\"]?([A-Za-z0-9+/=]{{44}})['\"]?", 0.9),
+    ("GCP_KEY", rf"(?i)(gcp|google){KEYWORD_GAP}key{KEYWORD_GAP}[=:]\s{{0,5}}['\"]?([A-Za-z0-9_\-]{{39}})['\"]?", 0.9),
+    
+    # Tokens
+    # only start at a token boundary, so "eyJeyJeyJ..." isn't rescanned from every offset
+    ("JWT_TOKEN", r"(?<![A-Za-z0-9_\-])eyJ[a-zA-Z0-9_\-]+\.[a-zA-Z0-9_\-]+\.[a-zA-Z0-9_\-]+", 0.95),
+    ("BEARER_TOKEN", r"Bearer\s+[A-Za-z0-9.\-_]{20,}", 0.9),
+    ("API_KEY", r"(?i)api[_\-]?key['\"]?\s*[:=]\s*['\"]?([A-Za-z0-9_\-]{16,})['\"]?", 0.85),
+    
+    # Credentials
+    ("PASSWORD", r"(?i)(password|passwd|pwd|secret)['\"]?\s*[:=]\s*['\"]([^'\"]{6,})['\"]", 0.95),
+    ("SECRET_KEY", r"(?i)(secret[_\-]?key|client[_\-]?secret)['\"]?\s*[:=]\s*['\"]?([A-Za-z0-9_\-+/=]{16,})['\"]?", 0.9),
+    
+    # Salesforce
+    ("SALESFORCE_SESSION", r"00D[A-Za-z0-9]{15,18}", 0.9),
+    ("SALESFORCE_TOKEN", rf"(?i)sfdc{KEYWORD_GAP}token{KEYWORD_GAP}[=:]\s{{0,5}}['\"]?([A-Za-z0-9!_\-.]{{15,}})['\"]?", 0.85),
+    
+    # Database
+    ("DB_CONNECTION", r"(?i)(mongodb|mysql|postgresql|sqlserver|oracle):\/\/[^\s;]+", 0.9),
+    ("DB_PASSWORD", r"(?i)(database|db)[_\-]?(password|pwd)[=:]['\"]?([^'\";\s]+)['\"]?", 0.9),
+    
+    # Private Keys
+    # the body can't run past the next "-----" marker, so unterminated blocks are scanned once
+    ("PRIVATE_KEY", r"-----BEGIN\s+(?:RSA\s+)?PRIVATE\s+KEY-----(?:(?!-----)[\s\S]){1,16384}-----END\s+(?:RSA\s+)?PRIVATE\s+KEY-----", 0.99),
+    ("SSH_KEY", r"ssh-rsa\s+[A-Za-z0-9+/=]{200,}", 0.95),
+    
+    # Certificates
+    ("CERTIFICATE", r"-----BEGIN\s+CERTIFICATE-----(?:(?!-----)[\s\S]){1,16384}-----END\s+CERTIFICATE-----", 0.95),
+    
+    # IP Addresses (private + public ranges - Presidio default misses private IPs)
+    ("IP_ADDRESS", r"\b(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)(?::\d{1,5})?\b", 0.95),
+]
+
+# Cheap triggers for Presidio's built-in pattern recognizers: every match they
+# can score above PRESIDIO_SCORE_THRESHOLD contains one of these
+BUILTIN_TRIGGERS = [
+    r"@",                                       # EMAIL_ADDRESS
+    r"://|\bwww\.",                             # URL with scheme / www
+    r"\.(?:com|net|org|edu|gov|io|co|info|biz|us|uk|in|de|eu)\b",  # bare domains
+    r"\d(?:[\s\-.()/]{0,2}\d){6,}",              # phone, SSN, card, bank, passport, ITIN
+]
+
+# spaCy NER (PERSON / LOCATION) needs a capitalized or all-caps word; parts of
+# dotted identifiers (com.foo.Bar.baz) and plain log vocabulary don't count as a
+# reason to run the NLP pipeline. A sentence-final "." or a "(" does not make a
+# word an identifier ("user Alice.", "Paris(dc1)").
+NER_TRIGGER = re.compile(r"(?<![\w.$])(?:[A-Z][a-z]+|[A-Z]{2,})(?![\w$]|\.[\w$])")
+NER_STOPWORDS = frozenset({
+    "Error", "Errors", "Exception", "Caused", "Failed", "Failure", "Fatal", "Warning", "Warn", "Info",
+    "Debug", "Trace", "Unable", "Cannot", "Could", "Invalid", "Unexpected", "Unknown", "Missing",
+    "Connection", "Timeout", "Timed", "Request", "Response", "Status", "Code", "Message", "Service",
+    "Server", "Client", "Internal", "External", "Null", "None", "True", "False", "Read", "Write",
+    "The", "An", "At", "In", "On", "For", "From", "To", "No", "Not", "Is", "Was", "Retry", "Retrying",
+    "Refused", "Reset", "Denied", "Access", "Unauthorized", "Forbidden", "Bad", "Gateway", "Database",
+    "Query", "Table", "Column", "Value", "Field", "Type", "Object", "Method", "Class", "File", "Path",
+    "Line", "Thread", "Process", "Task", "Job", "Queue", "Payload", "Header", "Body", "Token", "Key",
+})
+
+
+def _scoped(regex: str) -> str:
+    """Turn a leading inline (?i) into a scoped group so patterns can be OR-ed together."""
+    if regex.startswith("(?i)"):
+        return f"(?i:{regex[4:]})"
+    return f"(?:{regex})"
+
+
+# Presidio's PatternRecognizer matches with these flags; the prefilter must too, or it
+# skips texts ("bearer ...", lowercase keys) that the recognizers would have masked
+PRESIDIO_REGEX_FLAGS = re.IGNORECASE | re.DOTALL | re.MULTILINE
+
+# One precompiled alternation over all custom patterns and built-in triggers
+CANDIDATE_PREFILTER = re.compile("|".join(
+    [_scoped(regex) for _, regex, _ in CUSTOM_PATTERNS] + [_scoped(t) for t in BUILTIN_TRIGGERS]
+), PRESIDIO_REGEX_FLAGS)
+
+
+def has_ner_features(text: str) -> bool:
+    # all-caps words ("JOHN", "ERROR") are checked in their capitalized form
+    return any(word.capitalize() not in NER_STOPWORDS for word in NER_TRIGGER.findall(text))
+
+
+# ---- sanitization cache ----
+
+# Variable parameters of a log template: hex literals, long hex ids and digit runs
+VARIABLE_TOKEN = re.compile(r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{8,}\b|\d+")
+TOKEN = re.compile(r"\S+")
+# a template is only worth reusing when its variable windows are a small part of the text
+TEMPLATE_MAX_WINDOW_RATIO = 0.5
+# marks a template whose spans can't be split into static and variable parts
+_UNCACHEABLE = ()
+
+
+class ByteLRU:
+    """Thread-safe LRU bounded by the accounted size of its entries, not their count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: bytes, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def split_template(text: str) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """
+    Split `text` into its log template and variable windows.
+    A window is every whitespace token holding a variable plus the token before
+    it (so `key: value` and `ssn 123-45-6789` stay together); touching windows
+    are merged. Returns (template key, [(start, end)] of the windows).
+    """
+    tokens = [m.span() for m in TOKEN.finditer(text)]
+    windows: List[List[int]] = []
+    for k, (start, end) in enumerate(tokens):
+        if not VARIABLE_TOKEN.search(text, start, end):
+            continue
+        first = max(k - 1, 0)
+        if windows and windows[-1][1] >= first - 1:
+            windows[-1][1] = k
+        else:
+            windows.append([first, k])
+    spans = [(tokens[a][0], tokens[b][1]) for a, b in windows]
+
+    parts, pos = [], 0
+    for start, end in spans:
+        parts.append(text[pos:start])
+        parts.append(VARIABLE_TOKEN.sub("<*>", text[start:end]))
+        pos = end
+    parts.append(text[pos:])
+    return _digest("\x00".join(parts)), spans
+
+
+def _static_pieces(text: str, windows: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    bounds, pos = [], 0
+    for start, end in windows:
+        bounds.append((pos, start))
+        pos = end
+    bounds.append((pos, len(text)))
+    return bounds
+
+
+# ---- large inputs ----
+
+# Java "at pkg.Class.method(File.java:12)", Python 'File "x.py", line 3', .NET "at Ns.Type.Method()" frames
+STACK_FRAME = re.compile(r'^\s*(?:at\s+\S|File\s+".*",\s+line\s+\d+|\.\.\.\s+\d+\s+more)')
+FRAMES_KEPT_HEAD = 10
+FRAMES_KEPT_TAIL = 3
+
+
+def _utf8_len(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+# PEM blocks (private keys, certificates): a cut inside one leaves a key body
+# without its markers, which no recognizer matches any more
+PEM_BEGIN = re.compile(r"-----BEGIN [A-Z0-9 ]{1,64}-----", re.IGNORECASE)
+PEM_END = re.compile(r"-----END [A-Z0-9 ]{1,64}-----", re.IGNORECASE)
+
+
+def pem_blocks(text: str) -> List[Tuple[int, int]]:
+    """[start, end) of the PEM blocks in `text`; an unterminated block runs to the end."""
+    blocks = []
+    pos = 0
+    while True:
+        begin = PEM_BEGIN.search(text, pos)
+        if begin is None:
+            return blocks
+        end = PEM_END.search(text, begin.end())
+        pos = end.end() if end else len(text)
+        blocks.append((begin.start(), pos))
+
+
+def truncate_stack_frames(text: str, max_bytes: int) -> str:
+    """
+    Shrink `text` below `max_bytes`: first collapse long runs of stack frames
+    to their first and last few frames, then, if still too big, keep the head
+    and tail of the text around a truncation marker. The cuts never fall
+    inside a PEM block; a block crossing one is dropped whole.
+    """
+    if not max_bytes or _utf8_len(text) <= max_bytes:
+        return text
+
+    lines = text.split("\n")
+    out: List[str] = []
+    run: List[str] = []
+
+    def flush_run():
+        if len(run) > FRAMES_KEPT_HEAD + FRAMES_KEPT_TAIL + 1:
+            omitted = len(run) - FRAMES_KEPT_HEAD - FRAMES_KEPT_TAIL
+            out.extend(run[:FRAMES_KEPT_HEAD])
+            out.append(f"\t... {omitted} frames omitted")
+            out.extend(run[-FRAMES_KEPT_TAIL:])
+        else:
+            out.extend(run)
+        run.clear()
+
+    for line in lines:
+        if STACK_FRAME.match(line):
+            run.append(line)
+        else:
+            flush_run()
+            out.append(line)
+    flush_run()
+    text = "\n".join(out)
+
+    size = _utf8_len(text)
+    if size <= max_bytes:
+        return text
+    # approximate chars from bytes; the marker itself is small next to max_bytes
+    keep = max(int(len(text) * max_bytes / size) // 2 - 64, 0)
+    head_end, tail_start = keep, len(text) - keep
+    for start, end in pem_blocks(text):
+        if start < head_end < end:
+            head_end = start
+        if start < tail_start < end:
+            tail_start = end
+    removed = tail_start - head_end
+    return f"{text[:head_end]}\n... [{removed} chars truncated] ...\n{text[tail_start:]}"
+
+
+def chunk_spans(length: int, size: int, overlap: int, text: str = "") -> List[Tuple[int, int]]:
+    """
+    Overlapping [start, end) windows covering `length` chars. Windows end on a
+    newline in their second half when there is one, so frames aren't split.
+    """
+    overlap = min(overlap, size // 4)
+    spans = []
+    start = 0
+    while start < length:
+        end = min(start + size, length)
+        if end < length and text:
+            newline = text.rfind("\n", start + size // 2, end)
+            if newline != -1:
+                end = newline + 1
+        spans.append((start, end))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def _merge_results(results: List[RecognizerResult]) -> List[RecognizerResult]:
+    """Merge overlapping spans of the same entity found in neighbouring chunks."""
+    merged: List[RecognizerResult] = []
+    for r in sorted(results, key=lambda r: (r.entity_type, r.start, -r.end)):
+        last = merged[-1] if merged else None
+        if last is not None and last.entity_type == r.entity_type and r.start <= last.end:
+            last.end = max(last.end, r.end)
+            last.score = max(last.score, r.score)
+        else:
+            merged.append(RecognizerResult(entity_type=r.entity_type, start=r.start, end=r.end, score=r.score))
+    return merged
+
+
+# ---- per-recognizer time limit ----
+
+class RecognizerTimeout(Exception):
+    """A pattern recognizer ran past SANITIZER_RECOGNIZER_TIMEOUT_MS; the text can't be masked safely."""
+
+
+class BoundedPatternRecognizer(PatternRecognizer):
+    """
+    PatternRecognizer with a time limit per call. With the `regex` module the
+    patterns are scanned once with its match timeout and an overrun raises
+    RecognizerTimeout (the message fails instead of leaving the text partly
+    unmasked); the bounded patterns make that scan cheap. Without it, slow
+    calls are only logged.
+    """
+
+    def __init__(self, *args, timeout_ms: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeout_sec = timeout_ms / 1000.0
+
+    def analyze(self, text, entities, nlp_artifacts=None, regex_flags=None):
+        if not self.timeout_sec:
+            return super().analyze(text, entities, nlp_artifacts, regex_flags)
+        if timed_regex is not None:
+            return self._analyze_timed(text, regex_flags or self.global_regex_flags)
+        started = time.monotonic()
+        results = super().analyze(text, entities, nlp_artifacts, regex_flags)
+        elapsed = time.monotonic() - started
+        if elapsed > self.timeout_sec:
+            logger.warning(
+                f"{self.supported_entities[0]} recognizer took {elapsed * 1000:.0f}ms on {len(text)} chars "
+                f"(limit {self.timeout_sec * 1000:.0f}ms)"
+            )
+        return results
+
+    def _analyze_timed(self, text: str, flags: int) -> List[RecognizerResult]:
+        """PatternRecognizer's pattern scan, run once with the match timeout."""
+        results = []
+        try:
+            for pattern in self.patterns:
+                # same compiled-regex cache as PatternRecognizer (it also compiles with `regex`)
+                if not pattern.compiled_regex or pattern.compiled_with_flags != flags:
+                    pattern.compiled_with_flags = flags
+                    pattern.compiled_regex = timed_regex.compile(pattern.regex, flags=flags)
+                for match in pattern.compiled_regex.finditer(text, timeout=self.timeout_sec):
+                    result = self._pattern_result(pattern, match, flags)
+                    if result is not None:
+                        results.append(result)
+        except TimeoutError:
+            raise RecognizerTimeout(
+                f"{self.supported_entities[0]} recognizer exceeded {self.timeout_sec * 1000:.0f}ms on {len(text)} chars"
+            )
+        return EntityRecognizer.remove_duplicates(results)
+
+    def _pattern_result(self, pattern: Pattern, match, flags: int) -> Optional[RecognizerResult]:
+        """Result for one match, scored and validated the way PatternRecognizer does it."""
+        start, end = match.span()
+        current_match = match.group()
+        if current_match == "":
+            return None
+        validation_result = self.validate_result(current_match)
+        description = self.build_regex_explanation(
+            self.name, pattern.name, pattern.regex, pattern.score, validation_result, flags
+        )
+        result = RecognizerResult(
+            entity_type=self.supported_entities[0],
+            start=start,
+            end=end,
+            score=pattern.score,
+            analysis_explanation=description,
+            recognition_metadata={
+                RecognizerResult.RECOGNIZER_NAME_KEY: self.name,
+                RecognizerResult.RECOGNIZER_IDENTIFIER_KEY: self.id,
+            },
+        )
+        if validation_result is not None:
+            result.score = EntityRecognizer.MAX_SCORE if validation_result else EntityRecognizer.MIN_SCORE
+        if self.invalidate_result(current_match):
+            result.score = EntityRecognizer.MIN_SCORE
+        description.score = result.score
+        return result if result.score > EntityRecognizer.MIN_SCORE else None
+
+
 class LogSanitizer:
-    def __init__(self):
+    def __init__(self, ner_policy: str = None, cache_enabled: bool = None):
         # Initialize Presidio Engines
         self.analyzer = AnalyzerEngine()
         self.anonymizer = AnonymizerEngine()
-        
-        #  Add Custom Recognizers
-        custom_patterns = [
-            # Cloud & API Keys
-            ("AWS_ACCESS_KEY", r"AKIA[0-9A-Z]{16}", 0.95),
-            ("AWS_SECRET_KEY", r"(?i)aws_secret.*[=:]\s*['\"]?([A-Za-z0-9/+=]{40})['\"]?", 0.9),
-            ("AZURE_KEY", r"(?i)(azure|az).*key.*[=:]\s*['\"]?([A-Za-z0-9+/=]{44})['\"]?", 0.9),
-            ("GCP_KEY", r"(?i)(gcp|google).*key.*[=:]\s*['\"]?([A-Za-z0-9_\-]{39})['\"]?", 0.9),
-            
-            # Tokens
-            ("JWT_TOKEN", r"eyJ[a-zA-Z0-9_\-]+\.[a-zA-Z0-9_\-]+\.[a-zA-Z0-9_\-]+", 0.95),
-            ("BEARER_TOKEN", r"Bearer\s+[A-Za-z0-9.\-_]{20,}", 0.9),
-            ("API_KEY", r"(?i)api[_\-]?key['\"]?\s*[:=]\s*['\"]?([A-Za-z0-9_\-]{16,})['\"]?", 0.85),
-            
-            # Credentials
-            ("PASSWORD", r"(?i)(password|passwd|pwd|secret)['\"]?\s*[:=]\s*['\"]([^'\"]{6,})['\"]", 0.95),
-            ("SECRET_KEY", r"(?i)(secret[_\-]?key|client[_\-]?secret)['\"]?\s*[:=]\s*['\"]?([A-Za-z0-9_\-+/=]{16,})['\"]?", 0.9),
-            
-            # Salesforce
-            ("SALESFORCE_SESSION", r"00D[A-Za-z0-9]{15,18}", 0.9),
-            ("SALESFORCE_TOKEN", r"(?i)sfdc.*token.*[=:]\s*['\"]?([A-Za-z0-9!_\-.]{15,})['\"]?", 0.85),
-            
-            # Database
-            ("DB_CONNECTION", r"(?i)(mongodb|mysql|postgresql|sqlserver|oracle):\/\/[^\s;]+", 0.9),
-            ("DB_PASSWORD", r"(?i)(database|db)[_\-]?(password|pwd)[=:]['\"]?([^'\";\s]+)['\"]?", 0.9),
-            
-            # Private Keys
-            ("PRIVATE_KEY", r"-----BEGIN\s+(?:RSA\s+)?PRIVATE\s+KEY-----[\s\S]+?-----END\s+(?:RSA\s+)?PRIVATE\s+KEY-----", 0.99),
-            ("SSH_KEY", r"ssh-rsa\s+[A-Za-z0-9+/=]{200,}", 0.95),
-            
-            # Certificates
-            ("CERTIFICATE", r"-----BEGIN\s+CERTIFICATE-----[\s\S]+?-----END\s+CERTIFICATE-----", 0.95),
-            
-            # IP Addresses (private + public ranges - Presidio default misses private IPs)
-            ("IP_ADDRESS", r"\b(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)(?::\d{1,5})?\b", 0.95),
-        ]
+        # "always": full Presidio pass on every text; "auto": only when the prefilter finds candidates
+        self.ner_policy = (ner_policy or Config.SANITIZER_NER_POLICY).lower()
+        # counters shared by the consumer's worker threads
+        self.skipped = 0
+        self.analyzed = 0
+        self._counter_lock = threading.Lock()
+        # exact text -> masked text, and template -> analyzer spans of its static parts
+        self.cache_enabled = Config.SANITIZER_CACHE_ENABLED if cache_enabled is None else cache_enabled
+        self.cache = ByteLRU(Config.SANITIZER_CACHE_MAX_BYTES)
+        self.templates = ByteLRU(Config.SANITIZER_CACHE_MAX_BYTES) if Config.SANITIZER_TEMPLATE_CACHE else None
 
-        for entity, regex, score in custom_patterns:
-            self.analyzer.registry.add_recognizer(
-                PatternRecognizer(
-                    supported_entity=entity,
-                    patterns=[Pattern(name=entity.lower(), regex=regex, score=score)]
-                )
+        # kept so chunked analysis can run them over the whole text
+        self.custom_recognizers: List[BoundedPatternRecognizer] = []
+        for entity, regex, score in CUSTOM_PATTERNS:
+            recognizer = BoundedPatternRecognizer(
+                supported_entity=entity,
+                patterns=[Pattern(name=entity.lower(), regex=regex, score=score)],
+                timeout_ms=Config.SANITIZER_RECOGNIZER_TIMEOUT_MS
             )
+            self.custom_recognizers.append(recognizer)
+            self.analyzer.registry.add_recognizer(recognizer)
 
       
         # Define all entities (built-in + custom)
         # Note: IN_* entities removed - Presidio has no English recognizers for them
-        self.ALL_ENTITIES = [
-            # Built-in / Global
+        self.BUILTIN_ENTITIES = [
             "PERSON", "PHONE_NUMBER", "EMAIL_ADDRESS", "IP_ADDRESS", "LOCATION", "URL",
             "CREDIT_CARD", "US_SSN", "US_BANK_NUMBER",
             "US_DRIVER_LICENSE", "US_PASSPORT", "US_ITIN",
-
-            # Custom
+        ]
+        self.CUSTOM_ENTITIES = [
             "AWS_ACCESS_KEY", "AWS_SECRET_KEY", "AZURE_KEY", "GCP_KEY",
             "JWT_TOKEN", "BEARER_TOKEN", "API_KEY",
             "PASSWORD", "SECRET_KEY",
@@ -70,6 +447,7 @@ class LogSanitizer:
             "DB_CONNECTION", "DB_PASSWORD",
             "PRIVATE_KEY", "SSH_KEY", "CERTIFICATE"
         ]
+        self.ALL_ENTITIES = self.BUILTIN_ENTITIES + self.CUSTOM_ENTITIES
         
 
         # Define Operators
@@ -79,17 +457,265 @@ class LogSanitizer:
         }
 
 
+    def needs_analysis(self, text: str) -> bool:
+        """Tier 1: cheap check whether Presidio could find anything in `text`."""
+        if self.ner_policy == "always":
+            return True
+        return bool(CANDIDATE_PREFILTER.search(text)) or has_ner_features(text)
+
     #Method to sanitize text
     def sanitize(self, text: str) -> str:
-        results = self.analyzer.analyze(
-            text=text,
+        text = truncate_stack_frames(text, Config.SANITIZER_MAX_INPUT_BYTES) if text else text
+        if not text or not self.needs_analysis(text):
+            # nothing any recognizer could match: Presidio would return the text unchanged
+            self._count(skipped=1)
+            return text
+        cached = self._cached(text)
+        if cached is not None:
+            return cached
+        self._count(analyzed=1)
+        if self._is_large(text):
+            masked = self._sanitize_chunked(text)
+            self._remember(text, masked)
+            return masked
+        masked = self._mask_from_template(text)
+        if masked is None:
+            results = self.analyzer.analyze(
+                text=text,
+                language="en",
+                entities=self.ALL_ENTITIES,
+                score_threshold=Config.PRESIDIO_SCORE_THRESHOLD
+            )
+            self._learn_template(text, results)
+            masked = self._anonymize(text, results)
+        self._remember(text, masked)
+        return masked
+
+    def sanitize_many(self, texts: List[str], batch_size: Optional[int] = None) -> List[str]:
+        """
+        Sanitize a list of texts, running the ones that need analysis through
+        Presidio's batch analyzer so spaCy processes them with nlp.pipe.
+        Output order matches input order.
+        """
+        texts = [truncate_stack_frames(text, Config.SANITIZER_MAX_INPUT_BYTES) if text else text for text in texts]
+        output = list(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            if not text or not self.needs_analysis(text):
+                self._count(skipped=1)
+                continue
+            cached = self._cached(text)
+            if cached is not None:
+                output[i] = cached
+                continue
+            self._count(analyzed=1)
+            if self._is_large(text):
+                output[i] = self._sanitize_chunked(text)
+                self._remember(text, output[i])
+                continue
+            masked = self._mask_from_template(text)
+            if masked is not None:
+                output[i] = masked
+                self._remember(text, masked)
+            else:
+                pending.append(i)
+        if not pending:
+            return output
+
+        results = self._analyze_many([texts[i] for i in pending], batch_size)
+        for i, text_results in zip(pending, results):
+            self._learn_template(texts[i], text_results)
+            output[i] = self._anonymize(texts[i], text_results)
+            self._remember(texts[i], output[i])
+        return output
+
+    def _count(self, skipped: int = 0, analyzed: int = 0):
+        with self._counter_lock:
+            self.skipped += skipped
+            self.analyzed += analyzed
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            skipped, analyzed = self.skipped, self.analyzed
+        return {
+            "enabled": self.cache_enabled,
+            "skipped": skipped,
+            "analyzed": analyzed,
+            "exact": self.cache.stats(),
+            "template": self.templates.stats() if self.templates else None,
+        }
+
+    def _analyze_many(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[RecognizerResult]]:
+        batch_analyzer = BatchAnalyzerEngine(analyzer_engine=self.analyzer)
+        return list(batch_analyzer.analyze_iterator(
+            texts,
             language="en",
+            batch_size=batch_size or Config.SANITIZER_BATCH_SIZE,
             entities=self.ALL_ENTITIES,
             score_threshold=Config.PRESIDIO_SCORE_THRESHOLD
+        ))
+
+    # ---- chunked analysis of large inputs ----
+
+    def _is_large(self, text: str) -> bool:
+        return bool(Config.SANITIZER_CHUNK_SIZE) and len(text) > Config.SANITIZER_CHUNK_SIZE
+
+    def _custom_results(self, text: str) -> List[RecognizerResult]:
+        """Custom (secret) pattern matches over the whole of `text`, above the score threshold."""
+        results = []
+        for recognizer in self.custom_recognizers:
+            results.extend(
+                r for r in recognizer.analyze(text, recognizer.supported_entities)
+                if r.score >= Config.PRESIDIO_SCORE_THRESHOLD
+            )
+        return results
+
+    def _sanitize_chunked(self, text: str) -> str:
+        """
+        Run the custom secret patterns once over the whole text (keys and
+        certificates can be far longer than the window overlap), then analyze
+        the built-in entities in overlapping windows so spaCy never sees more
+        than SANITIZER_CHUNK_SIZE chars at once; those entities are shorter
+        than the overlap, so one straddling a boundary is whole in one of the
+        windows. The time budget is checked between windows: text that wasn't
+        analyzed in time is withheld rather than passed on unmasked.
+        """
+        budget = Config.SANITIZER_TIME_BUDGET_SECONDS
+        started = time.monotonic()
+        secrets = self._custom_results(text)
+        results: List[RecognizerResult] = list(secrets)
+        analyzed_to = 0
+        for start, end in chunk_spans(len(text), Config.SANITIZER_CHUNK_SIZE, Config.SANITIZER_CHUNK_OVERLAP, text):
+            if budget and time.monotonic() - started > budget:
+                break
+            found = self.analyzer.analyze(
+                text=text[start:end],
+                language="en",
+                entities=self.BUILTIN_ENTITIES,
+                score_threshold=Config.PRESIDIO_SCORE_THRESHOLD
+            )
+            results.extend(
+                RecognizerResult(entity_type=r.entity_type, start=start + r.start, end=start + r.end, score=r.score)
+                for r in found
+            )
+            analyzed_to = end
+
+        if analyzed_to >= len(text):
+            return self._anonymize(text, _merge_results(results))
+        # the last window's overlap tail may hold a cut-off entity, so stop before it,
+        # and before any secret the cut would split
+        safe_to = max(analyzed_to - Config.SANITIZER_CHUNK_OVERLAP, 0)
+        for r in sorted(secrets, key=lambda r: r.start, reverse=True):
+            if r.start < safe_to < r.end:
+                safe_to = r.start
+        logger.warning(
+            f"Sanitizer time budget ({budget}s) exceeded after {safe_to}/{len(text)} chars - withholding the rest"
         )
+        head = [r for r in _merge_results(results) if r.end <= safe_to]
+        return f"{self._anonymize(text[:safe_to], head)}\n[{len(text) - safe_to} chars withheld: sanitizer time budget exceeded]"
+
+    # ---- exact-text cache ----
+
+    def _cached(self, text: str) -> Optional[str]:
+        if not self.cache_enabled:
+            return None
+        return self.cache.get(_digest(text))
+
+    def _remember(self, text: str, masked: str):
+        if self.cache_enabled:
+            # digest + masked text + rough per-entry overhead
+            self.cache.put(_digest(text), masked, 16 + len(masked.encode("utf-8")) + 100)
+
+    # ---- template span cache ----
+
+    def _mask_from_template(self, text: str) -> Optional[str]:
+        """
+        Reuse the cached spans of the template's static parts and analyze only
+        its variable windows. None when the template is unknown or not reusable.
+        """
+        if not (self.cache_enabled and self.templates):
+            return None
+        key, windows = split_template(text)
+        cached_spans = self.templates.get(key)
+        if not cached_spans:
+            return None
+        pieces = _static_pieces(text, windows)
+        results = [
+            RecognizerResult(entity_type=entity, start=pieces[p][0] + start, end=pieces[p][0] + end, score=score)
+            for p, start, end, entity, score in cached_spans[1]
+        ]
+        if windows:
+            window_results = self._analyze_many([text[start:end] for start, end in windows])
+            for (offset, _), found in zip(windows, window_results):
+                for r in found:
+                    results.append(RecognizerResult(
+                        entity_type=r.entity_type, start=offset + r.start, end=offset + r.end, score=r.score
+                    ))
+        return self._anonymize(text, results)
+
+    def _learn_template(self, text: str, results: List[RecognizerResult]):
+        """Cache the spans that fall in the static parts of `text`'s template."""
+        if not (self.cache_enabled and self.templates):
+            return
+        key, windows = split_template(text)
+        if sum(end - start for start, end in windows) > TEMPLATE_MAX_WINDOW_RATIO * len(text):
+            # mostly variables: re-analyzing the windows would cost as much as the whole text
+            self.templates.put(key, _UNCACHEABLE, len(key) + 64)
+            return
+        pieces = _static_pieces(text, windows)
+        static_spans = []
+        for r in results:
+            if any(start <= r.start and r.end <= end for start, end in windows):
+                continue  # found again when the window is re-analyzed
+            piece = next((p for p, (start, end) in enumerate(pieces) if start <= r.start and r.end <= end), None)
+            if piece is None:
+                # crosses a static/variable boundary - the template can't be split safely
+                self.templates.put(key, _UNCACHEABLE, len(key) + 64)
+                return
+            static_spans.append((piece, r.start - pieces[piece][0], r.end - pieces[piece][0], r.entity_type, r.score))
+        # leading marker keeps an entry with no static spans truthy
+        self.templates.put(key, (True, tuple(static_spans)), len(key) + 64 + 80 * len(static_spans))
+
+    def _anonymize(self, text: str, results) -> str:
         anonymized_output = self.anonymizer.anonymize(
             text=text,
             analyzer_results=results,
             operators=self.operators
         )
         return anonymized_output.text
+
+
+# ---- process pool: one LogSanitizer (and spaCy model) per worker process ----
+
+_worker_sanitizer: Optional[LogSanitizer] = None
+
+
+def _init_worker():
+    global _worker_sanitizer
+    _worker_sanitizer = LogSanitizer()
+
+
+def _sanitize_chunk(texts: List[str]) -> List[str]:
+    return _worker_sanitizer.sanitize_many(texts)
+
+
+class SanitizerPool:
+    """
+    Spreads sanitize_many() over `processes` worker processes. Each worker
+    loads the Presidio/spaCy models once in its initializer; texts are sent
+    in chunks of `batch_size` so every worker still gets nlp.pipe batching.
+    """
+
+    def __init__(self, processes: int, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or Config.SANITIZER_BATCH_SIZE
+        self.executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker)
+
+    def sanitize_many(self, texts: List[str]) -> List[str]:
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        output: List[str] = []
+        for sanitized in self.executor.map(_sanitize_chunk, chunks):
+            output.extend(sanitized)
+        return output
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
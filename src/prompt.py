@@ -1,17 +1,37 @@
 from langchain_core.prompts import ChatPromptTemplate
 from src.config import Config
 
+# Structured-output schema matching OUTPUT FORMAT below (Gemini response_schema, OpenAPI subset)
+_SOLUTION_SCHEMA = {
+    "type": "object",
+    "properties": {"instructions": {"type": "string"}},
+    "required": ["instructions"],
+}
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "rootCause": {"type": "string"},
+        "solution1": _SOLUTION_SCHEMA,
+        "solution2": _SOLUTION_SCHEMA,
+        "solution3": _SOLUTION_SCHEMA,
+    },
+    "required": ["rootCause", "solution1", "solution2", "solution3"],
+    "propertyOrdering": ["rootCause", "solution1", "solution2", "solution3"],
+}
+ANSWER_FIELDS = ("rootCause", "solution1", "solution2", "solution3")
+
+
 class PromptBuilder:
     def __init__(self):
         # Base prompt template string
 
+        # Static part: identical for every error, so it can be cached provider-side
         self.SYSTEM_TEMPLATE = (
             "You are a certified {PLATFORM_NAME} integration expert with deep knowledge of its runtime, "
             "connectors, adapters, transformation language, platform services, and error-handling mechanisms.\n\n"
-            "Analzye the provided Error Code: {ERROR_CODE}, Error Description: {ERROR_DESCRIPTION} to identify the "
+            "Analyze the Error Code and Error Description provided by the user to identify the "
             "exact root cause with platform-specific accuracy.\n\n"
-            "KNOWN SOLUTIONS (Values from Knowledge Base):\n{CONTEXT}\n\n"
-            "If the Known Solutions are relevant, prioritize adapting them. SUMMARIZE and CONDENSE them to be CONCISE. DO NOT COPY VERBATIM if they are too long.\n\n"
+            "If the user provides Known Solutions and they are relevant, prioritize adapting them. SUMMARIZE and CONDENSE them to be CONCISE. DO NOT COPY VERBATIM if they are too long.\n\n"
             "Follow all CRITICAL RULES and return the response strictly in the JSON schema containing three sections "
             "— Solution 1 (Quick Fix), Solution 2 (Root Cause Fix), and Solution 3 (Preventive Actions).\n\n"
             "OUTPUT FORMAT (STRICT JSON ONLY, NO MARKDOWN):\n"
@@ -46,6 +66,32 @@ class PromptBuilder:
             "{TONE}"
         )
 
+        # Variable part: sent with every request
+        self.HUMAN_TEMPLATE = (
+            "Error Code: {ERROR_CODE}\n"
+            "Description: {ERROR_DESCRIPTION}\n\n"
+            "KNOWN SOLUTIONS (Values from Knowledge Base):\n{CONTEXT}"
+        )
+
+    def platform_values(self) -> dict:
+        return {
+            "PLATFORM_NAME": Config.APP_PLATFORM_NAME,
+            "PLATFORM_DOCS_URL": Config.APP_PLATFORM_DOCS_URL,
+            "PLATFORM_TERMS": Config.APP_PLATFORM_TERMS,
+            "TONE": Config.APP_PLATFORM_TONE,
+        }
+
+    def get_system_prompt(self) -> str:
+        """The static system prompt rendered with the platform context (what gets cached)."""
+        return self.SYSTEM_TEMPLATE.format(**self.platform_values())
+
+    def get_variable_prompt_template(self) -> ChatPromptTemplate:
+        """
+        Template of the per-error part only, for requests whose system prompt
+        comes from a provider-side cached content.
+        """
+        return ChatPromptTemplate.from_messages([("human", self.HUMAN_TEMPLATE)])
+
     def get_prompt_template(self, platform: str = None) -> ChatPromptTemplate:
         """
         Generate a LangChain ChatPromptTemplate with generic application context pre-filled
@@ -61,12 +107,7 @@ class PromptBuilder:
         # Use partial to pre-fill platform details from Config
         prompt = ChatPromptTemplate.from_messages([
             ("system", self.SYSTEM_TEMPLATE),
-            ("human", "Error Code: {ERROR_CODE}\nDescription: {ERROR_DESCRIPTION}")
+            ("human", self.HUMAN_TEMPLATE)
         ])
         
-        return prompt.partial(
-            PLATFORM_NAME=Config.APP_PLATFORM_NAME,
-            PLATFORM_DOCS_URL=Config.APP_PLATFORM_DOCS_URL,
-            PLATFORM_TERMS=Config.APP_PLATFORM_TERMS,
-            TONE=Config.APP_PLATFORM_TONE
-        )
+        return prompt.partial(**self.platform_values())
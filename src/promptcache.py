@@ -0,0 +1,101 @@
+"""
+promptcache.py
+--------------
+Provider-side cached content for the static Gemini system prompt.
+
+The system prompt (role, output format, critical rules, platform context) is
+the same for every error. PromptCache uploads it once as a Gemini cached
+content and hands out its name, so requests only carry the per-error part.
+The TTL is extended shortly before it runs out; when the cache can't be
+created (SDK missing, model without caching support, prompt below the
+model's minimum cacheable size, quota) name() returns None for a cool-down
+period and callers send the full prompt instead.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+try:
+    from google import genai
+    from google.genai import types as genai_types
+except ImportError:  # optional: without google-genai the full prompt is always sent
+    genai = None
+    genai_types = None
+
+logger = logging.getLogger(__name__)
+
+# retry creating an unavailable cache after this long
+UNAVAILABLE_COOLDOWN_SECONDS = 600
+
+
+class PromptCache:
+    def __init__(self, api_key: str, model: str, system_prompt: str, ttl_seconds: int = 3600):
+        self.model = model if model.startswith("models/") else f"models/{model}"
+        self.system_prompt = system_prompt
+        self.ttl_seconds = ttl_seconds
+        # refresh once less than a fifth of the TTL is left
+        self.refresh_margin = max(ttl_seconds // 5, 30)
+        self._client = genai.Client(api_key=api_key) if genai is not None else None
+        self._lock = threading.Lock()
+        self._name: Optional[str] = None
+        self._expires_at = 0.0
+        self._unavailable_until = 0.0
+        if self._client is None:
+            logger.warning("google-genai not installed - Gemini prompt caching disabled")
+
+    def name(self) -> Optional[str]:
+        """Name of a live cached content holding the system prompt, or None to send it inline."""
+        if self._client is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if now < self._unavailable_until:
+                return None
+            if self._name and self._expires_at - now > self.refresh_margin:
+                return self._name
+            try:
+                if self._name and self._expires_at > now:
+                    self._refresh(now)
+                else:
+                    self._create(now)
+                return self._name
+            except Exception as e:
+                logger.warning(
+                    f"Gemini prompt cache unavailable ({e}) - sending the full prompt "
+                    f"for the next {UNAVAILABLE_COOLDOWN_SECONDS}s"
+                )
+                self._name = None
+                self._unavailable_until = now + UNAVAILABLE_COOLDOWN_SECONDS
+                return None
+
+    def invalidate(self, name: str):
+        """Forget `name` (e.g. the provider reported it expired) so the next call recreates it."""
+        with self._lock:
+            if self._name == name:
+                self._name = None
+
+    def _create(self, now: float):
+        cache = self._client.caches.create(
+            model=self.model,
+            config=genai_types.CreateCachedContentConfig(
+                display_name="error-analysis-system-prompt",
+                system_instruction=self.system_prompt,
+                ttl=f"{self.ttl_seconds}s",
+            ),
+        )
+        self._name = cache.name
+        self._expires_at = now + self.ttl_seconds
+        logger.info(f"Created Gemini cached content {cache.name} (ttl {self.ttl_seconds}s)")
+
+    def _refresh(self, now: float):
+        try:
+            self._client.caches.update(
+                name=self._name,
+                config=genai_types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+            self._expires_at = now + self.ttl_seconds
+        except Exception as e:
+            logger.info(f"Refreshing Gemini cached content {self._name} failed ({e}) - creating a new one")
+            self._create(now)
@@ -0,0 +1,210 @@
+"""
+ratelimit.py
+------------
+Proactive client-side limiter for Gemini calls.
+
+Each limiter enforces two token buckets at once — requests-per-minute and
+tokens-per-minute — and blocks the caller until both have room, so bursts are
+smoothed out before the provider answers with HTTP 429.
+
+Modes (GEMINI_RATE_LIMIT_MODE):
+  - off      : no limiting (default)
+  - local    : buckets live in this process
+  - postgres : buckets live in one row per limiter in `gemini_rate_limits`,
+               updated under SELECT ... FOR UPDATE so every consumer replica
+               draws from the same quota
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from src.config import Config
+from src.structuraldb import DB
+
+logger = logging.getLogger(__name__)
+
+# A limiter state is (request_level, token_level, updated_at_epoch)
+BucketState = Tuple[float, float, float]
+
+
+class RateLimitTimeout(Exception):
+    """Raised when the required wait exceeds RATE_LIMIT_MAX_WAIT_SECONDS."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate (~4 characters per token for English/code)."""
+    return max(1, math.ceil(len(text or "") / 4))
+
+
+def _take(state: BucketState, now: float, rpm: int, tpm: int, tokens: int, requests: int = 1) -> Tuple[float, BucketState]:
+    """
+    Refill both buckets for the elapsed time and try to take `requests`
+    requests plus `tokens`. Returns (seconds to wait, new state); wait == 0
+    means granted. A budget of 0 disables that dimension.
+    """
+    req_level, tok_level, updated_at = state
+    elapsed = max(0.0, now - updated_at)
+    if rpm:
+        req_level = min(float(rpm), req_level + elapsed * rpm / 60.0)
+        requests = min(requests, rpm)
+    if tpm:
+        tok_level = min(float(tpm), tok_level + elapsed * tpm / 60.0)
+        # a single oversized request can never exceed the bucket capacity
+        tokens = min(tokens, tpm)
+
+    wait = 0.0
+    if rpm and req_level < requests:
+        wait = max(wait, (requests - req_level) * 60.0 / rpm)
+    if tpm and tok_level < tokens:
+        wait = max(wait, (tokens - tok_level) * 60.0 / tpm)
+
+    if wait == 0.0:
+        if rpm:
+            req_level -= requests
+        if tpm:
+            tok_level -= tokens
+    return wait, (req_level, tok_level, now)
+
+
+class RateLimiter:
+    """Blocking RPM + TPM limiter for one Gemini endpoint (generation or embedding)."""
+
+    def __init__(self, name: str, rpm: int = 0, tpm: int = 0, mode: str = "local", max_wait_sec: float = 60.0):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.mode = mode
+        self.max_wait_sec = max_wait_sec
+        self._lock = threading.Lock()
+        self._state: BucketState = (float(rpm), float(tpm), time.time())
+        self._table_ready = False
+        # postgres mode: one connection per limiter, reused by every acquire
+        self._db: Optional[DB] = None
+        self._db_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off" and bool(self.rpm or self.tpm)
+
+    def acquire(self, tokens: int = 1, requests: int = 1):
+        """
+        Block until `requests` requests totalling `tokens` tokens fit in both
+        budgets (a batch call counts every input against RPM).
+        """
+        if not self.enabled:
+            return
+
+        waited = 0.0
+        while True:
+            if self.mode == "postgres":
+                wait = self._try_take_shared(tokens, requests)
+            else:
+                wait = self._try_take_local(tokens, requests)
+            if wait == 0.0:
+                if waited:
+                    logger.info(f"[RateLimit] {self.name}: throttled {waited:.2f}s")
+                return
+
+            if waited + wait > self.max_wait_sec:
+                raise RateLimitTimeout(
+                    f"{self.name} rate limit wait {waited + wait:.1f}s exceeds {self.max_wait_sec}s"
+                )
+            time.sleep(wait)
+            waited += wait
+
+    # ---- local mode ----
+
+    def _try_take_local(self, tokens: int, requests: int = 1) -> float:
+        with self._lock:
+            wait, new_state = _take(self._state, time.time(), self.rpm, self.tpm, tokens, requests)
+            self._state = new_state
+            return wait
+
+    # ---- shared (Postgres) mode ----
+
+    def _ensure_table(self, db: DB):
+        if self._table_ready:
+            return
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS gemini_rate_limits (
+                name TEXT PRIMARY KEY,
+                request_level DOUBLE PRECISION NOT NULL,
+                token_level DOUBLE PRECISION NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+        """)
+        db.execute(
+            "INSERT INTO gemini_rate_limits (name, request_level, token_level, updated_at) "
+            "VALUES (%s, %s, %s, EXTRACT(EPOCH FROM clock_timestamp())) ON CONFLICT (name) DO NOTHING",
+            (self.name, float(self.rpm), float(self.tpm))
+        )
+        self._table_ready = True
+
+    def _try_take_shared(self, tokens: int, requests: int = 1) -> float:
+        with self._db_lock:
+            if self._db is None:
+                self._db = DB()
+            db = self._db
+            try:
+                self._ensure_table(db)
+                conn = db.conn
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT request_level, token_level, updated_at FROM gemini_rate_limits "
+                        "WHERE name = %s FOR UPDATE",
+                        (self.name,)
+                    )
+                    row = cur.fetchone()
+                    # the database clock is shared by every replica
+                    cur.execute("SELECT EXTRACT(EPOCH FROM clock_timestamp())")
+                    now = float(cur.fetchone()[0])
+                    wait, (req_level, tok_level, updated_at) = _take(
+                        (row[0], row[1], row[2]), now, self.rpm, self.tpm, tokens, requests
+                    )
+                    cur.execute(
+                        "UPDATE gemini_rate_limits SET request_level = %s, token_level = %s, updated_at = %s "
+                        "WHERE name = %s",
+                        (req_level, tok_level, updated_at, self.name)
+                    )
+                conn.commit()
+                return wait
+            except Exception:
+                # a broken connection is dropped; the next acquire opens a fresh one
+                try:
+                    db.conn.rollback()
+                except Exception:
+                    db.close()
+                    self._db = None
+                raise
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(kind: str) -> RateLimiter:
+    """
+    Process-wide limiter for `kind` ("generation" or "embedding"),
+    configured from GEMINI_GEN_* / GEMINI_EMBED_* budgets.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(kind)
+        if limiter is None:
+            if kind == "generation":
+                rpm, tpm = Config.GEMINI_GEN_RPM, Config.GEMINI_GEN_TPM
+            else:
+                rpm, tpm = Config.GEMINI_EMBED_RPM, Config.GEMINI_EMBED_TPM
+            limiter = RateLimiter(
+                name=f"gemini:{kind}",
+                rpm=rpm,
+                tpm=tpm,
+                mode=Config.GEMINI_RATE_LIMIT_MODE,
+                max_wait_sec=Config.RATE_LIMIT_MAX_WAIT_SECONDS
+            )
+            if limiter.enabled:
+                logger.info(f"[RateLimit] {limiter.name}: mode={limiter.mode} rpm={rpm} tpm={tpm}")
+            _limiters[kind] = limiter
+        return limiter
@@ -0,0 +1,92 @@
+"""
+retrybudget.py
+--------------
+Retry budgets and jittered backoff, so an outage doesn't multiply the load
+on the dependency that is already struggling.
+
+A RetryBudget allows retries only while they stay below `ratio` of the
+successful calls seen in the last `window_sec` seconds (plus a small floor of
+`min_retries` so low-traffic periods can still retry). When the dependency
+starts failing, successes dry up and so do retries: callers fail fast instead
+of piling 3x attempts on top of every message retry.
+
+Backoff uses decorrelated jitter: sleep = min(cap, uniform(base, previous * 3)).
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def decorrelated_jitter(previous: float, base: float, cap: float) -> float:
+    """Next backoff delay given the previous one (use `base` for the first retry)."""
+    return min(cap, random.uniform(base, max(base, previous) * 3))
+
+
+class RetryBudget:
+    """Sliding-window retry budget for one dependency."""
+
+    def __init__(self, name: str, ratio: float = 0.2, min_retries: int = 3, window_sec: float = 10.0):
+        self.name = name
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window_sec = window_sec
+        self._lock = threading.Lock()
+        self._successes: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._exhausted_logged = False
+
+    def record_success(self):
+        with self._lock:
+            self._successes.append(time.monotonic())
+
+    def try_acquire(self) -> bool:
+        """Spend one retry if the budget allows it; False means fail instead of retrying."""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            allowed = max(self.min_retries, int(len(self._successes) * self.ratio))
+            if len(self._retries) >= allowed:
+                if not self._exhausted_logged:
+                    logger.warning(
+                        f"[RetryBudget] {self.name}: exhausted ({len(self._retries)} retries vs "
+                        f"{len(self._successes)} successes in {self.window_sec:.0f}s) - failing fast"
+                    )
+                    self._exhausted_logged = True
+                return False
+            self._retries.append(now)
+            self._exhausted_logged = False
+            return True
+
+    def _prune(self, now: float):
+        cutoff = now - self.window_sec
+        while self._successes and self._successes[0] < cutoff:
+            self._successes.popleft()
+        while self._retries and self._retries[0] < cutoff:
+            self._retries.popleft()
+
+
+_budgets: Dict[str, RetryBudget] = {}
+_budgets_lock = threading.Lock()
+
+
+def get_retry_budget(name: str) -> RetryBudget:
+    """Process-wide budget for dependency `name`, configured from RETRY_BUDGET_*."""
+    with _budgets_lock:
+        budget = _budgets.get(name)
+        if budget is None:
+            budget = RetryBudget(
+                name,
+                ratio=Config.RETRY_BUDGET_RATIO,
+                min_retries=Config.RETRY_BUDGET_MIN_RETRIES,
+                window_sec=Config.RETRY_BUDGET_WINDOW_SECONDS
+            )
+            _budgets[name] = budget
+        return budget
@@ -206,8 +206,8 @@ class EmailService:
 
         return tpl
 
-    def send_email(self, html_body: str, subject: str, to_addrs: str):
-        """Send HTML Email via SMTP."""
+    def send_email(self, html_body: str, subject: str, to_addrs: str, timeout: Optional[float] = None):
+        """Send HTML Email via SMTP (`timeout` overrides SMTP_TIMEOUT)."""
         if not self.username or not self.password:
             raise RuntimeError("SMTP credentials missing in configuration")
             
@@ -218,7 +218,7 @@ class EmailService:
         msg.set_content("This is an HTML email. Your client does not support HTML.")
         msg.add_alternative(html_body, subtype="html")
 
-        with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=Config.SMTP_TIMEOUT) as s:
+        with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=timeout or Config.SMTP_TIMEOUT) as s:
             s.ehlo()
             s.starttls()
             s.ehlo()
@@ -0,0 +1,82 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import psycopg2
+
+from src.structuraldb import DB
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+    The first caller (leader) runs `fn`; callers arriving while it is in
+    flight block and receive the leader's result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run `fn` once per in-flight `key`. Returns (result, shared) - shared is True for followers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+@contextmanager
+def advisory_lock(key: str, timeout_sec: int = 120):
+    """
+    Hold a Postgres session advisory lock on `key` so only one consumer
+    process works on it at a time. If the lock can't be obtained within
+    `timeout_sec` the body runs uncoordinated rather than failing the message.
+    """
+    with DB() as db:
+        locked = False
+        try:
+            db.execute("SET lock_timeout = %s", (str(int(timeout_sec * 1000)),))
+            db.execute("SELECT pg_advisory_lock(hashtext(%s))", (key,), fetch=True)
+            locked = True
+        except psycopg2.errors.LockNotAvailable:
+            logger.warning(f"Advisory lock wait exceeded {timeout_sec}s for {key[:12]} - continuing without it")
+
+        try:
+            yield locked
+        finally:
+            if locked:
+                try:
+                    db.execute("SELECT pg_advisory_unlock(hashtext(%s))", (key,), fetch=True)
+                except Exception:
+                    # closing the session releases the lock anyway
+                    logger.warning("Failed to release advisory lock explicitly")
@@ -0,0 +1,89 @@
+"""
+tokenbudget.py
+--------------
+Keeps the variable parts of the LLM prompt inside a token budget.
+
+Before a Gemini call the knowledge-base context and the error description are
+deduplicated and trimmed so their estimated size (estimate_tokens, counted
+locally) stays under LLM_CONTEXT_TOKEN_BUDGET / LLM_DESCRIPTION_TOKEN_BUDGET:
+
+  - context: identical solution blocks are dropped, then whole blocks are kept
+    in relevance order until the budget is spent
+  - description: runs of repeated lines (retry loops, recursive frames) are
+    collapsed, then the middle is cut so the head (exception + first frames)
+    and the tail (root "Caused by") both survive
+"""
+
+import re
+from typing import List, Tuple
+
+from src.config import Config
+from src.ratelimit import estimate_tokens
+
+# "Solution 2:" headers written by extract_solutions_from_points
+SOLUTION_HEADER = re.compile(r"^Solution \d+:\n", re.MULTILINE)
+CHARS_PER_TOKEN = 4
+
+
+def dedupe_context(context: str) -> List[str]:
+    """Split the context into its solution blocks, dropping repeated ones."""
+    blocks, seen = [], set()
+    for block in re.split(r"\n\s*\n", context or ""):
+        body = SOLUTION_HEADER.sub("", block.strip()).strip()
+        key = " ".join(body.split())
+        if body and key not in seen:
+            seen.add(key)
+            blocks.append(body)
+    return blocks
+
+
+def trim_context(context: str, max_tokens: int) -> str:
+    """Deduplicated context, renumbered, with whole blocks kept up to `max_tokens`."""
+    blocks = dedupe_context(context)
+    kept, used = [], 0
+    for body in blocks:
+        block = f"Solution {len(kept) + 1}:\n{body}"
+        cost = estimate_tokens(block)
+        if max_tokens and used + cost > max_tokens:
+            if not kept:
+                # the best match alone is over budget: keep its beginning
+                kept.append(block[:max_tokens * CHARS_PER_TOKEN])
+            break
+        kept.append(block)
+        used += cost
+    return "\n\n".join(kept)
+
+
+def collapse_repeated_lines(text: str) -> str:
+    """Replace runs of identical lines by one copy and a repeat count."""
+    out: List[str] = []
+    previous, count = None, 0
+    for line in (text or "").split("\n"):
+        if line == previous:
+            count += 1
+            continue
+        if count > 1:
+            out.append(f"    [previous line repeated {count - 1} more times]")
+        out.append(line)
+        previous, count = line, 1
+    if count > 1:
+        out.append(f"    [previous line repeated {count - 1} more times]")
+    return "\n".join(out)
+
+
+def trim_description(description: str, max_tokens: int) -> str:
+    """Collapse repeated lines, then keep the head (2/3) and tail (1/3) within `max_tokens`."""
+    text = collapse_repeated_lines(description)
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    head, tail = max_chars * 2 // 3, max_chars // 3
+    return f"{text[:head]}\n... [{len(text) - head - tail} chars omitted] ...\n{text[len(text) - tail:]}"
+
+
+def fit_prompt(description: str, context: str) -> Tuple[str, str]:
+    """(description, context) trimmed to the configured budgets."""
+    return (
+        trim_description(description, Config.LLM_DESCRIPTION_TOKEN_BUDGET),
+        trim_context(context, Config.LLM_CONTEXT_TOKEN_BUDGET),
+    )
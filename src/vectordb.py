@@ -1,4 +1,5 @@
 import logging
+import math
 from typing import List, Dict, Any, Optional
 from langchain_qdrant import QdrantVectorStore
 from qdrant_client import QdrantClient, models
@@ -27,7 +28,9 @@ class QdrantStore:
         if not self.url:
             logger.warning("Qdrant URL not provided. Vector DB operations may fail.")
             
-        self.client = QdrantClient(url=self.url, api_key=self.api_key, prefer_grpc=prefer_grpc)
+        self.client = QdrantClient(
+            url=self.url, api_key=self.api_key, prefer_grpc=prefer_grpc, timeout=Config.QDRANT_TIMEOUT_SECONDS
+        )
         
         # Initialize LangChain VectorStore
         self.vector_store = QdrantVectorStore(
@@ -85,7 +88,8 @@ class QdrantStore:
         limit: int,
         query_filter: Optional[models.Filter] = None,
         score_threshold: float = 0.85,
-        text_query: Optional[str] = None 
+        text_query: Optional[str] = None,
+        timeout: Optional[float] = None
     ):
         """Search using Hybrid Approach (LangChain Vector + Qdrant Client Data)"""
         
@@ -104,7 +108,8 @@ class QdrantStore:
             query=query_vector,
             limit=limit,
             query_filter=query_filter,
-            with_payload=True
+            with_payload=True,
+            timeout=math.ceil(timeout) if timeout else None
         )
         
         # Format results
@@ -117,6 +122,35 @@ class QdrantStore:
         
         return formatted_results
 
+    def search_batch(
+        self,
+        collection: str,
+        vectors: List[List[float]],
+        limit: int,
+        query_filters: Optional[List[Optional[models.Filter]]] = None,
+        score_threshold: float = 0.85,
+        timeout: Optional[float] = None
+    ) -> List[list]:
+        """
+        Run one search per vector in a single Qdrant round trip.
+        Returns a list of point lists, aligned with `vectors`.
+        """
+        if not vectors:
+            return []
+        filters = query_filters or [None] * len(vectors)
+        requests = [
+            models.QueryRequest(query=vector, filter=query_filter, limit=limit, with_payload=True)
+            for vector, query_filter in zip(vectors, filters)
+        ]
+        responses = self.client.query_batch_points(
+            collection_name=collection, requests=requests, timeout=math.ceil(timeout) if timeout else None
+        )
+
+        return [
+            [point for point in response.points if point.score >= score_threshold]
+            for response in responses
+        ]
+
     @staticmethod
     def extract_solutions(results) -> str:
         solutions = []
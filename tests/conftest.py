@@ -0,0 +1,97 @@
+import importlib.util
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+class FakeChannel:
+    """Records what the consumer does with a pika channel."""
+
+    def __init__(self):
+        self.published = []
+        self.declared = {}
+        self.acked = []
+        self.nacked = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append(SimpleNamespace(exchange=exchange, routing_key=routing_key, body=body, properties=properties))
+
+    def queue_declare(self, queue, durable=False, arguments=None, passive=False):
+        self.declared[queue] = arguments
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacked.append((delivery_tag, requeue))
+
+
+@pytest.fixture
+def channel():
+    return FakeChannel()
+
+
+@pytest.fixture(scope="session")
+def consumer():
+    """src/error-solution-create.py (not importable by name because of the dashes)."""
+    spec = importlib.util.spec_from_file_location("error_solution_create", os.path.join(ROOT, "src", "error-solution-create.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def extractor():
+    """src/error-extract-app.py (not importable by name because of the dashes)."""
+    spec = importlib.util.spec_from_file_location("error_extract_app", os.path.join(ROOT, "src", "error-extract-app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def make_delivery():
+    """(method, properties) of a delivery taken from `queue`."""
+    import pika
+
+    def _make(tag: int, queue: str = "elk_errors_queue", headers=None, **props):
+        method = SimpleNamespace(delivery_tag=tag, exchange="", routing_key=queue, redelivered=False)
+        return method, pika.BasicProperties(headers=dict(headers or {}), **props)
+
+    return _make
+
+
+@pytest.fixture(scope="session")
+def nlp_engine(tmp_path_factory):
+    """spaCy engine for Presidio: en_core_web_lg when installed, else a blank pipeline (patterns only, no NER)."""
+    spacy = pytest.importorskip("spacy")
+    nlp_engine_module = pytest.importorskip("presidio_analyzer.nlp_engine")
+    if spacy.util.is_package("en_core_web_lg"):
+        model = "en_core_web_lg"
+    else:
+        model = str(tmp_path_factory.mktemp("spacy-blank"))
+        spacy.blank("en").to_disk(model)
+    engine = nlp_engine_module.SpacyNlpEngine(models=[{"lang_code": "en", "model_name": model}])
+    engine.load()
+    return engine
+
+
+@pytest.fixture
+def make_sanitizer(nlp_engine, monkeypatch):
+    """LogSanitizer factory sharing the session's spaCy pipeline; caches off unless asked for."""
+    from presidio_analyzer import AnalyzerEngine
+    from src import maskdata
+
+    monkeypatch.setattr(maskdata, "AnalyzerEngine", lambda: AnalyzerEngine(nlp_engine=nlp_engine))
+
+    def _make(**kwargs):
+        kwargs.setdefault("cache_enabled", False)
+        return maskdata.LogSanitizer(**kwargs)
+
+    return _make
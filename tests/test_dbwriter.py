@@ -0,0 +1,150 @@
+import threading
+
+import pytest
+
+from src import dbwriter
+from src.dbwriter import BatchWriter, BatchWriteTimeout
+
+SQL = "INSERT INTO t (a, sessionid) VALUES %s RETURNING id, sessionid AS batch_key"
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, cursor_factory=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeDatabase:
+    """execute_values stand-in: a row whose value is "poison" fails its whole statement."""
+
+    def __init__(self, gate=None):
+        self.conn = FakeConnection()
+        self.statements = []
+        self.gate = gate  # Event a statement waits on, like a slow commit
+
+    def connect(self):
+        return self
+
+    def close(self):
+        self.conn.closed = 1
+
+    def execute_values(self, cur, sql, rows, page_size=None, fetch=False):
+        self.statements.append(list(rows))
+        if self.gate is not None:
+            self.gate.wait(5)
+        if any(row[0] == "poison" for row in rows):
+            raise ValueError("invalid input syntax")
+        # RETURNING order is not the VALUES order
+        return [{"id": 100 + int(key[1:]), "batch_key": key} for _, key in reversed(rows)]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(dbwriter, "DB", lambda: db)
+    monkeypatch.setattr(dbwriter, "execute_values", db.execute_values)
+    return db
+
+
+def write_concurrently(writer, rows):
+    results = {}
+
+    def write(row):
+        try:
+            results[row[1]] = writer.write(row, timeout_sec=5)
+        except Exception as e:
+            results[row[1]] = e
+
+    threads = [threading.Thread(target=write, args=(row,)) for row in rows]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_rows_share_one_statement_and_get_their_own_id(database):
+    writer = BatchWriter("test", SQL, key_index=1, max_rows=10, flush_interval_ms=200)
+
+    results = write_concurrently(writer, [("v", f"s{i}") for i in range(5)])
+
+    assert results == {f"s{i}": 100 + i for i in range(5)}
+    assert len(database.statements) == 1
+    assert database.conn.commits == 1
+
+
+def test_a_poison_row_only_fails_its_own_caller(database):
+    writer = BatchWriter("test", SQL, key_index=1, max_rows=10, flush_interval_ms=200)
+
+    results = write_concurrently(writer, [("v", "s1"), ("poison", "s2"), ("v", "s3")])
+
+    assert results["s1"] == 101 and results["s3"] == 103
+    assert isinstance(results["s2"], ValueError)
+    assert len(database.statements[0]) == 3  # the batch, then one statement per row
+    assert [len(rows) for rows in database.statements[1:]] == [1, 1, 1]
+
+
+def test_connection_failure_reaches_every_caller(monkeypatch):
+    def refuse():
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(dbwriter, "DB", refuse)
+    writer = BatchWriter("test", SQL, key_index=1, max_rows=10, flush_interval_ms=100)
+
+    results = write_concurrently(writer, [("v", "s1"), ("v", "s2")])
+
+    assert all(isinstance(error, ConnectionError) for error in results.values())
+
+
+def test_timeout_in_flight_is_not_safe_to_resend(database):
+    database.gate = threading.Event()
+    writer = BatchWriter("test", SQL, key_index=1, max_rows=1, flush_interval_ms=1)
+
+    with pytest.raises(BatchWriteTimeout):
+        writer.write(("v", "s1"), timeout_sec=0.2)
+    database.gate.set()
+
+
+def test_timeout_before_sending_drops_the_row(database):
+    database.gate = threading.Event()
+    writer = BatchWriter("test", SQL, key_index=1, max_rows=1, flush_interval_ms=1)
+    blocker = threading.Thread(target=lambda: writer.write(("v", "s1"), timeout_sec=5))
+    blocker.start()  # occupies the writer thread
+
+    with pytest.raises(TimeoutError) as raised:
+        writer.write(("v", "s2"), timeout_sec=0.2)
+    database.gate.set()
+    blocker.join()
+
+    assert not isinstance(raised.value, BatchWriteTimeout)
+    assert [rows[0][1] for rows in database.statements] == ["s1"]
+
+
+def test_consumer_does_not_resend_an_unconfirmed_batch(consumer):
+    class Writer:
+        calls = 0
+
+        def write(self, params):
+            Writer.calls += 1
+            raise BatchWriteTimeout("sent but not committed")
+
+    with pytest.raises(BatchWriteTimeout):
+        consumer.services.db_write_batched(Writer(), ("v", "s1"))
+
+    assert Writer.calls == 1
@@ -0,0 +1,154 @@
+import gzip
+import json
+
+import pytest
+
+from src import envelope
+from src.config import Config
+
+PAYLOAD = {"applicationName": "orders", "code": "E42", "description": "Connection refused " * 50, "timestamp": 0}
+
+
+class FakeBlobDB:
+    """message_blobs table behind the `with DB() as db: db.execute(...)` API."""
+
+    def __init__(self):
+        self.rows = {}
+        self.expired = set()
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None, fetch=False):
+        if sql.startswith("INSERT"):
+            self.rows[params[0]] = params[1]
+        elif sql.startswith("SELECT"):
+            return [{"body": self.rows[params[0]]}] if params[0] in self.rows else []
+        elif sql.startswith("DELETE"):
+            removed = [{"id": blob_id} for blob_id in self.expired if blob_id in self.rows]
+            for row in removed:
+                del self.rows[row["id"]]
+            return removed
+
+
+@pytest.fixture
+def blobs(monkeypatch):
+    db = FakeBlobDB()
+    monkeypatch.setattr(envelope, "DB", db)
+    monkeypatch.setattr(envelope, "_blob_table_ready", True)
+    return db
+
+
+@pytest.fixture
+def inline(monkeypatch):
+    monkeypatch.setattr(Config, "CLAIM_CHECK_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESSION", "none")
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESS_MIN_BYTES", 4096)
+
+
+def test_plain_round_trip(inline):
+    body, content_encoding, headers = envelope.encode(PAYLOAD)
+
+    assert content_encoding is None
+    assert headers == {envelope.ENVELOPE_HEADER: envelope.ENVELOPE_VERSION}
+    assert body == json.dumps(PAYLOAD, separators=(",", ":")).encode()
+    assert envelope.decode(body) == PAYLOAD
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compressed_round_trip(inline, monkeypatch, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESSION", codec)
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESS_MIN_BYTES", 100)
+
+    body, content_encoding, _ = envelope.encode(PAYLOAD)
+
+    assert content_encoding == codec
+    assert len(body) < len(json.dumps(PAYLOAD))
+    assert envelope.decode(body, content_encoding) == PAYLOAD
+
+
+def test_small_bodies_stay_uncompressed(inline, monkeypatch):
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESSION", "gzip")
+
+    _, content_encoding, _ = envelope.encode({"code": "E1", "description": "short"})
+
+    assert content_encoding is None
+
+
+def test_zstd_falls_back_to_gzip_when_not_installed(monkeypatch):
+    monkeypatch.setattr(envelope, "zstandard", None)
+
+    body, content_encoding = envelope.compress(b"payload", "zstd")
+
+    assert content_encoding == "gzip"
+    assert gzip.decompress(body) == b"payload"
+    with pytest.raises(ValueError):
+        envelope.decompress(b"payload", "zstd")
+
+
+def test_legacy_messages_decode_unchanged():
+    assert envelope.decode(json.dumps(PAYLOAD, indent=2).encode()) == PAYLOAD
+
+
+def test_unknown_content_encoding_is_rejected():
+    with pytest.raises(ValueError):
+        envelope.decode(b"{}", "br")
+
+
+def test_large_description_travels_as_a_claim_check(inline, blobs, monkeypatch):
+    monkeypatch.setattr(Config, "CLAIM_CHECK_THRESHOLD_BYTES", 100)
+
+    body, content_encoding, _ = envelope.encode(PAYLOAD)
+    payload = envelope.decode(body, content_encoding)
+
+    assert payload["description"] == "" and payload["descriptionRef"] in blobs.rows
+    assert envelope.resolve_claim_check(payload) == PAYLOAD
+
+
+def test_claim_check_leaves_the_input_untouched(inline, blobs, monkeypatch):
+    monkeypatch.setattr(Config, "CLAIM_CHECK_THRESHOLD_BYTES", 100)
+    original = dict(PAYLOAD)
+
+    envelope.check_in(original)
+
+    assert original == PAYLOAD
+
+
+def test_missing_blob_raises(blobs):
+    with pytest.raises(LookupError):
+        envelope.resolve_claim_check({"description": "", "descriptionRef": "gone"})
+
+
+def test_purge_removes_expired_blobs(blobs):
+    kept, expired = envelope.store_blob("new"), envelope.store_blob("old")
+    blobs.expired.add(expired)
+
+    assert envelope.purge_expired_blobs(72) == 1
+    assert envelope.load_blob(kept) == "new"
+    with pytest.raises(LookupError):
+        envelope.load_blob(expired)
+
+
+def test_consumer_decodes_by_the_delivery_content_encoding(consumer, channel, make_delivery, inline, monkeypatch):
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESSION", "gzip")
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESS_MIN_BYTES", 1)
+    body, content_encoding, headers = envelope.encode(PAYLOAD)
+    _, props = make_delivery(1, headers=headers, content_encoding=content_encoding)
+
+    assert consumer.decode_message(channel, 1, body, props) == PAYLOAD
+    assert channel.acked == []
+
+
+def test_consumer_drops_an_undecodable_delivery(consumer, channel, make_delivery):
+    _, props = make_delivery(1, content_encoding="gzip")
+
+    assert consumer.decode_message(channel, 1, json.dumps(PAYLOAD).encode(), props) is None
+    assert channel.acked == [1]
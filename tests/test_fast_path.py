@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from src.prompt import ANSWER_FIELDS
+
+
+@pytest.fixture
+def message(consumer, monkeypatch):
+    consumer.store_incoming_payload_and_set_uuid(
+        {"applicationName": "orders", "code": "E42", "description": "boom", "timestamp": 0},
+        masked_description="boom"
+    )
+    monkeypatch.setattr(consumer.services, "call_llm", lambda *a, **k: {"rootCause": "llm"})
+    return consumer.services
+
+
+def verified_hit(score=0.99):
+    return SimpleNamespace(score=score, payload={"solution": "restart the pool", "error_code": "E42"})
+
+
+def test_fast_path_is_off_by_default(consumer):
+    env = {k: v for k, v in os.environ.items() if k != "LLM_SKIP_SCORE_THRESHOLD"}
+    out = subprocess.run(
+        [sys.executable, "-c", "from src.config import Config; print(Config.LLM_SKIP_SCORE_THRESHOLD)"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env,
+        capture_output=True, text=True, check=True
+    )
+    assert float(out.stdout.strip().splitlines()[-1]) == 0
+
+
+def test_threshold_zero_always_calls_the_llm(consumer, message, monkeypatch):
+    monkeypatch.setattr(consumer, "LLM_SKIP_SCORE_THRESHOLD", 0)
+    llmresponse, _ = consumer.generate_solution([verified_hit()])
+    assert llmresponse == {"rootCause": "llm"}
+    assert not message.fast_path
+
+
+def test_fast_path_answer_has_the_llm_schema(consumer, message, monkeypatch):
+    monkeypatch.setattr(consumer, "LLM_SKIP_SCORE_THRESHOLD", 0.97)
+    llmresponse, solutions = consumer.generate_solution([verified_hit()])
+
+    assert list(llmresponse) == list(ANSWER_FIELDS)
+    assert llmresponse["solution1"] == {"instructions": "restart the pool"}
+    assert all(isinstance(llmresponse[field], dict) for field in ANSWER_FIELDS[1:])
+    assert message.fast_path
+    assert "restart the pool" in solutions
+
+
+def test_enrichment_follows_the_message_flag(consumer, message, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(consumer, "LLM_FAST_PATH_ENRICH", True)
+    monkeypatch.setattr(message, "enrich_pool", SimpleNamespace(submit=submitted.append))
+
+    consumer.schedule_enrichment(1, {"rootCause": "llm"}, None)
+    assert submitted == []
+    message.fast_path = True
+    consumer.schedule_enrichment(1, {"rootCause": "x"}, None)
+    assert len(submitted) == 1
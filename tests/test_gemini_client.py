@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+from google.ai.generativelanguage_v1beta.types import Candidate, Content, GenerateContentResponse, Part
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from src.config import Config
+from src.geminicall import GeminiClient
+
+ANSWER = '{"rootCause": "Pool exhausted", "solution1": {"instructions": "Raise maxPoolSize"}}'
+
+
+class FakeGenerativeService:
+    """Stands in for the generativelanguage client behind ChatGoogleGenerativeAI and records each request."""
+
+    def __init__(self, text=ANSWER, hang=None):
+        self.text = text
+        self.hang = hang  # Event the call blocks on, like a stalled HTTP request
+        self.requests = []
+        self.options = []
+
+    def _response(self):
+        return GenerateContentResponse(candidates=[Candidate(
+            content=Content(parts=[Part(text=self.text)], role="model"),
+            finish_reason=Candidate.FinishReason.STOP,
+        )])
+
+    def generate_content(self, request, **options):
+        self.requests.append(request)
+        self.options.append(options)
+        if self.hang is not None:
+            self.hang.wait(10)
+        return self._response()
+
+    def stream_generate_content(self, request, **options):
+        self.requests.append(request)
+        self.options.append(options)
+        return iter([self._response()])
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    monkeypatch.setattr(Config, "GEMINI_PROMPT_CACHE", False)
+    monkeypatch.setattr(Config, "GEMINI_STREAMING", False)
+    client = GeminiClient(api_key="test-key", model="gemini-2.0-flash")
+    client.llm.client = FakeGenerativeService()
+    return client
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_per_call_timeout_reaches_the_request_without_copying_the_model(gemini, monkeypatch, streaming):
+    monkeypatch.setattr(Config, "GEMINI_STREAMING", streaming)
+    monkeypatch.setattr(ChatGoogleGenerativeAI, "model_copy", lambda *a, **k: pytest.fail("model copied per call"))
+
+    first = gemini.analyze_error("E1", "pool exhausted", timeout=90.0)
+    second = gemini.analyze_error("E1", "pool exhausted", timeout=45.0)
+
+    assert first["rootCause"] == second["rootCause"] == "Pool exhausted"
+    assert [o["timeout"] for o in gemini.llm.client.options] == [90.0, 45.0]
+
+
+def test_templates_are_built_once(gemini):
+    assert gemini._select_template()[0] is gemini._select_template()[0] is gemini.prompt_template
+
+
+def test_cached_content_is_passed_per_call(gemini):
+    gemini.prompt_cache = type("Cache", (), {"name": lambda self: "cachedContents/abc"})()
+
+    gemini.analyze_error("E1", "pool exhausted", timeout=30.0)
+
+    request = gemini.llm.client.requests[-1]
+    assert request.cached_content == "cachedContents/abc"
+    assert not request.system_instruction.parts  # the static system prompt comes from the cache
+
+
+def test_full_prompt_fallback_waits_for_the_rate_limiter(gemini):
+    class Cache:
+        invalidated = []
+
+        def name(self):
+            return None if self.invalidated else "cachedContents/gone"
+
+        def invalidate(self, name):
+            self.invalidated.append(name)
+
+    class Service(FakeGenerativeService):
+        def generate_content(self, request, **options):
+            if request.cached_content:
+                self.requests.append(request)
+                raise RuntimeError("404 cachedContents/gone not found")
+            return super().generate_content(request, **options)
+
+    acquired = []
+    gemini.prompt_cache = Cache()
+    gemini.rate_limiter = type("Limiter", (), {"acquire": lambda self, tokens: acquired.append(tokens)})()
+    gemini.llm.client = Service()
+
+    assert gemini.analyze_error("E1", "pool exhausted", timeout=30.0)["rootCause"] == "Pool exhausted"
+    assert len(gemini.llm.client.requests) == 2
+    assert len(acquired) == 2
+
+
+def test_hanging_call_is_cut_off_at_the_timeout(gemini):
+    hang = threading.Event()
+    gemini.llm.client = FakeGenerativeService(hang=hang)
+    started = time.monotonic()
+
+    with pytest.raises(TimeoutError):
+        gemini.analyze_error("E1", "pool exhausted", timeout=0.3)
+    hang.set()
+
+    assert time.monotonic() - started < 2
+    assert gemini.llm.client.options[0]["timeout"] == 0.3
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_request_carries_the_json_response_schema(gemini, monkeypatch, streaming):
+    monkeypatch.setattr(Config, "GEMINI_STREAMING", streaming)
+
+    gemini.analyze_error("E1", "pool exhausted", timeout=30.0)
+
+    config = gemini.llm.client.requests[-1].generation_config
+    assert config.response_mime_type == "application/json"
+    assert config.response_schema.type_.name == "OBJECT"
+    assert list(config.response_schema.required) == ["rootCause", "solution1", "solution2", "solution3"]
+    solution = config.response_schema.properties["solution1"]
+    assert solution.properties["instructions"].type_.name == "STRING"
+    assert list(solution.required) == ["instructions"]
+    assert config.temperature == 0.0
+
+
+def test_schema_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(Config, "GEMINI_RESPONSE_SCHEMA", False)
+
+    assert GeminiClient._generation_config() == {"response_mime_type": "application/json"}
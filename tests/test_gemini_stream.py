@@ -0,0 +1,105 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.config import Config
+from src.geminicall import GeminiClient
+
+
+class FakeChain:
+    """chain.stream() as a generator that records when it gets closed."""
+
+    def __init__(self, chunks, delay=0.0, stall=None):
+        self.chunks = chunks
+        self.delay = delay
+        self.stall = stall  # Event the generator blocks on before its first chunk
+        self.closed = threading.Event()
+
+    def stream(self, inputs, **options):
+        try:
+            if self.stall is not None:
+                self.stall.wait(5)
+            for text in self.chunks:
+                time.sleep(self.delay)
+                yield SimpleNamespace(content=text)
+        finally:
+            self.closed.set()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(Config, "GEMINI_FIRST_TOKEN_TIMEOUT_SECONDS", 0.2)
+    return object.__new__(GeminiClient)
+
+
+def stream_threads():
+    return [t for t in threading.enumerate() if t.name == "gemini-stream"]
+
+
+def wait_for(condition, seconds=2.0):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_total_timeout_closes_the_stream(client):
+    chain = FakeChain(['{"rootCause": "', "x"] + ["y"] * 1000, delay=0.05)
+
+    with pytest.raises(TimeoutError):
+        client._stream(chain, {}, total_timeout=0.3)
+
+    assert wait_for(chain.closed.is_set)
+    assert wait_for(lambda: not stream_threads())
+
+
+def test_first_token_timeout_closes_the_stream_once_the_read_returns(client):
+    stall = threading.Event()
+    chain = FakeChain(['{"rootCause": "x"}'] + ["more"] * 1000, stall=stall)
+
+    with pytest.raises(TimeoutError):
+        client._stream(chain, {}, total_timeout=5)
+    stall.set()  # the stalled HTTP read finally returns
+
+    assert wait_for(chain.closed.is_set)
+    assert wait_for(lambda: not stream_threads())
+
+
+def test_complete_answer_closes_the_stream(client):
+    chain = FakeChain(['{"rootCause": "x", ', '"solution1": {"instructions": "y"}}'] + ["trailing"] * 1000, delay=0.01)
+
+    text = client._stream(chain, {}, total_timeout=5)
+
+    assert text.endswith("}}")
+    assert wait_for(chain.closed.is_set)
+    assert wait_for(lambda: not stream_threads())
+
+
+class BlockingStream:
+    """A transport-level stream (like a gRPC call) whose close() cancels a read blocked in another thread."""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.cancelled.wait(10)
+        raise StopIteration
+
+    def close(self):
+        self.cancelled.set()
+
+
+def test_timeout_cancels_a_read_blocked_on_the_producer_thread(client):
+    stream = BlockingStream()
+    chain = SimpleNamespace(stream=lambda inputs, **options: stream)
+
+    with pytest.raises(TimeoutError):
+        client._stream(chain, {}, total_timeout=5)
+
+    assert stream.cancelled.is_set()
+    assert wait_for(lambda: not stream_threads())
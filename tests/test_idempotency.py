@@ -0,0 +1,93 @@
+import pytest
+
+
+class FakeDB:
+    def __init__(self, claim_row=None):
+        self.claim_row = claim_row
+        self.calls = []
+
+    def __call__(self, sql, params=(), fetch=False):
+        self.calls.append((" ".join(sql.split()), params))
+        if sql.lstrip().startswith("INSERT"):
+            return [self.claim_row]
+        return []
+
+
+@pytest.fixture
+def message(consumer, monkeypatch):
+    monkeypatch.setattr(consumer, "IDEMPOTENCY_ENABLED", True)
+    consumer.store_incoming_payload_and_set_uuid(
+        {"applicationName": "orders", "code": "E42", "description": "boom", "timestamp": 0},
+        masked_description="boom"
+    )
+    return consumer.services
+
+
+def claim(consumer, message, monkeypatch, **row):
+    db = FakeDB(dict({"id": 5, "sessionid_status": "processing", "inserted": False, "claimed": False}, **row))
+    monkeypatch.setattr(message, "db_execute", db)
+    return consumer.claim_message(), db
+
+
+def test_claim_sql_binds_every_parameter(consumer, message, monkeypatch):
+    _, db = claim(consumer, message, monkeypatch, inserted=True, claimed=True)
+    sql, params = db.calls[0]
+    assert sql.count("%s") == len(params)
+    assert params[-2:] == (consumer.IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS,) * 2
+    assert "sessionid_status = 'failed'" in sql
+
+
+def test_new_claim_proceeds(consumer, message, monkeypatch):
+    owned, _ = claim(consumer, message, monkeypatch, inserted=True, claimed=True)
+    assert owned and message.claimed_id == 5
+
+
+def test_abandoned_claim_is_taken_over(consumer, message, monkeypatch):
+    owned, _ = claim(consumer, message, monkeypatch, claimed=True)
+    assert owned and message.claimed_id == 5
+
+
+def test_live_claim_makes_a_duplicate(consumer, message, monkeypatch):
+    owned, _ = claim(consumer, message, monkeypatch)
+    assert not owned and message.claimed_id is None
+
+
+def test_failed_message_releases_its_claim(consumer, message, monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(message, "db_execute", db)
+
+    def claim_it():
+        message.claimed_id = 5
+        return True
+
+    def boom():
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(consumer, "claim_message", claim_it)
+    monkeypatch.setattr(consumer, "find_verified_solution", boom)
+    with pytest.raises(RuntimeError):
+        consumer.main(vector_points=[])
+
+    sql, params = db.calls[-1]
+    assert sql.startswith("UPDATE errorsolutiontable SET sessionid_status = 'failed'")
+    assert "sessionid_status = 'processing'" in sql and params == (5,)
+    assert message.claimed_id is None
+
+
+def test_release_failure_is_not_fatal(consumer, message, monkeypatch):
+    def down(*a, **k):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(message, "db_execute", down)
+    message.claimed_id = 5
+    consumer.release_claim()
+    assert message.claimed_id is None
+
+
+def test_verified_solution_skips_claims_and_is_ordered(consumer, message, monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(message, "db_execute", db)
+    assert consumer.find_verified_solution() is None
+    sql, _ = db.calls[0]
+    assert "NOT IN ('processing', 'failed')" in sql
+    assert "ORDER BY ops_solution IS NULL" in sql and sql.index("ORDER BY") < sql.index("LIMIT 1")
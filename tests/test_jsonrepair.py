@@ -0,0 +1,71 @@
+import pytest
+
+from src.geminicall import GeminiClient
+from src.jsonrepair import JSONRepairer, parse_json
+
+ANSWER = '{"rootCause": "Pool exhausted", "solution1": {"instructions": "Raise maxPoolSize"}}'
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("```json\n" + ANSWER + "\n```", {"rootCause": "Pool exhausted", "solution1": {"instructions": "Raise maxPoolSize"}}),
+    ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+    ('{"a": 1,, "b": 2}', {"a": 1, "b": 2}),
+    ('{"a": "line\nbreak", "path": "C:\\Users\\x"}', {"a": "line\nbreak", "path": "C:\\Users\\x"}),
+    ('{"a": "He said "hi" there"}', {"a": 'He said "hi" there'}),
+    ('{"a": "url "http://x"", "b": 1}', {"a": 'url "http://x"', "b": 1}),
+    ('{"a": {"b": true', {"a": {"b": True}}),
+    ('{"a": "done", "b": [1, 2]', {"a": "done", "b": [1, 2]}),
+])
+def test_lossless_repairs(text, expected):
+    assert parse_json(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    '{"a":,"b":1}',          # used to become {'a': 'b'}
+    '{"a": tru',             # used to become {}
+    '{"a": 12',              # digits may be missing
+    '{"a": "cut off mid',    # string truncated
+    '{"a": "x", "b":',       # dangling key
+    '{"a": "x" "b": "y"}',   # missing comma
+    '{"a": @}',
+])
+def test_repairs_that_guess_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse_json(text)
+
+
+def test_streamed_chunks_match_a_single_feed():
+    text = '{"rootCause": "He said "hi"", "solution1": {"instructions": "a\\u0041\\tb"}}'
+    whole = JSONRepairer()
+    whole.feed(text)
+    expected = whole.finish()
+
+    for cut in range(1, len(text)):
+        repairer = JSONRepairer()
+        repairer.feed(text[:cut])
+        repairer.feed(text[cut:])
+        assert repairer.finish() == expected, cut
+        assert repairer.lossy is None
+
+
+@pytest.mark.parametrize("text", [
+    '{}',
+    '{"rootCause": "x"}',
+    '{"rootCause": "", "solution1": {"instructions": "do it"}}',
+    '{"rootCause": "x", "solution1": {"instructions": "  "}}',
+    '{"solution1": {"instructions": "do it"}}',
+])
+def test_answers_without_required_fields_are_rejected(text):
+    client = object.__new__(GeminiClient)
+    with pytest.raises(ValueError):
+        client._extract_json(text)
+
+
+def test_answer_gets_missing_solutions_filled():
+    client = object.__new__(GeminiClient)
+
+    result = client._extract_json('{"rootCause": "x", "solution1": "do it"}')
+
+    assert result["solution1"] == {"instructions": "do it"}
+    assert result["solution2"] == {"instructions": ""}
+    assert result["solution3"] == {"instructions": ""}
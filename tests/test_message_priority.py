@@ -0,0 +1,41 @@
+import pytest
+
+from src.config import Config
+
+
+@pytest.fixture
+def priorities(extractor, monkeypatch):
+    monkeypatch.setattr(Config, "QUEUE_MAX_PRIORITY", 10)
+    monkeypatch.setattr(Config, "HIGH_PRIORITY_THRESHOLD", 50)
+    monkeypatch.setattr(extractor, "_app_priority_weights", {"orders-api": 3, "noisy": -5})
+    return extractor.compute_message_priority
+
+
+def test_priority_is_off_without_a_priority_queue(extractor, monkeypatch):
+    monkeypatch.setattr(Config, "QUEUE_MAX_PRIORITY", 0)
+
+    assert extractor.compute_message_priority("orders-api", 100) is None
+
+
+def test_priority_grows_with_the_log_of_the_batch_count(priorities):
+    assert [priorities("billing", n) for n in (0, 1, 2, 3, 4, 16)] == [1, 1, 2, 2, 3, 5]
+
+
+def test_application_weight_is_added(priorities):
+    assert priorities("orders-api", 4) == priorities("billing", 4) + 3
+
+
+def test_priority_stays_between_one_and_below_the_max(priorities):
+    # 0 is kept for low-priority re-analysis, the max for escalations
+    assert priorities("noisy", 1) == 1
+    assert priorities("orders-api", 49) == 9
+
+
+def test_escalations_get_the_max_priority(priorities):
+    assert priorities("noisy", 50) == 10
+
+
+def test_parse_app_priority_weights_skips_bad_entries(extractor):
+    weights = extractor.parse_app_priority_weights("orders-api=3, billing = 2,broken=x,nothing")
+
+    assert weights == {"orders-api": 3, "billing": 2}
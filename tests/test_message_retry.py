@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+from src.retrybudget import RetryBudget
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(consumer, monkeypatch):
+    def _fail(seconds):
+        raise AssertionError(f"consumer slept {seconds}s on the connection thread")
+
+    monkeypatch.setattr(consumer.time, "sleep", _fail)
+    monkeypatch.setattr(consumer, "message_retry_budget", RetryBudget("message", min_retries=100))
+    consumer._declared_delay_queues.clear()
+
+
+def body(code="E1"):
+    return json.dumps({"applicationName": "orders", "code": code, "description": "boom", "timestamp": "t"}).encode()
+
+
+def test_retry_delay_tier_rounds_up(consumer):
+    assert consumer.retry_delay_tier(0.2) == 1
+    assert consumer.retry_delay_tier(10) == 10
+    assert consumer.retry_delay_tier(10.5) == 15
+    assert consumer.retry_delay_tier(10_000) == consumer.RETRY_DELAY_TIERS_SECONDS[-1]
+
+
+def test_retry_goes_through_a_delay_queue(consumer, channel, make_delivery):
+    method, props = make_delivery(7, priority=5, content_encoding="gzip")
+    consumer.handle_retry(channel, method, props, b"payload", 0, RuntimeError("down"))
+
+    (msg,) = channel.published
+    delay = msg.properties.headers["x-retry-delay"]
+    assert msg.exchange == ""
+    assert msg.routing_key == f"elk_errors_queue.delay.{delay}s"
+    assert delay in consumer.RETRY_DELAY_TIERS_SECONDS
+    assert msg.properties.headers["x-retry-count"] == 1
+    assert msg.properties.priority == 5
+    assert msg.properties.content_encoding == "gzip"
+    assert channel.declared[msg.routing_key] == {
+        "x-message-ttl": delay * 1000,
+        "x-dead-letter-exchange": "",
+        "x-dead-letter-routing-key": "elk_errors_queue",
+    }
+    assert channel.acked == [7]
+
+
+def test_delay_queue_is_declared_once(consumer, channel, make_delivery, monkeypatch):
+    monkeypatch.setattr(consumer, "decorrelated_jitter", lambda previous, base, cap: 10)
+    for tag in (1, 2, 3):
+        method, props = make_delivery(tag)
+        consumer.handle_retry(channel, method, props, b"payload", 0, RuntimeError("down"))
+    assert list(channel.declared) == ["elk_errors_queue.delay.10s"]
+    assert len(channel.published) == 3
+
+
+def test_circuit_open_batch_is_delayed_without_blocking(consumer, channel, make_delivery, monkeypatch):
+    monkeypatch.setattr(consumer, "any_circuit_open", lambda: True)
+    deliveries = [(*make_delivery(tag), body()) for tag in (1, 2, 3)]
+    consumer.process_batch(channel, deliveries)
+
+    assert sorted(channel.acked) == [1, 2, 3]
+    assert all(".delay." in msg.routing_key for msg in channel.published)
+    assert len(channel.published) == 3
+
+
+@pytest.fixture
+def dlq(consumer, monkeypatch):
+    monkeypatch.setattr(consumer, "DLQ_ENABLED", True)
+    monkeypatch.setattr(consumer, "DLX_EXCHANGE", "dlx")
+    monkeypatch.setattr(consumer, "DLQ_ROUTING_KEY", "dead")
+
+
+def test_outage_parks_without_spending_retries(consumer, channel, make_delivery, monkeypatch, dlq):
+    monkeypatch.setattr(consumer, "any_circuit_open", lambda: True)
+    method, props = make_delivery(1, headers={"x-retry-count": consumer.MAX_RETRIES_PER_MESSAGE})
+    consumer.handle_retry(channel, method, props, b"payload", consumer.MAX_RETRIES_PER_MESSAGE, RuntimeError("down"))
+
+    (msg,) = channel.published
+    park_for = consumer.retry_delay_tier(consumer.MESSAGE_RETRY_BACKOFF_CAP_SECONDS)
+    assert msg.routing_key == f"elk_errors_queue.delay.{park_for}s"
+    assert msg.properties.headers["x-retry-count"] == consumer.MAX_RETRIES_PER_MESSAGE
+    assert channel.acked == [1]
+
+
+def test_spent_retry_budget_parks_instead_of_dead_lettering(consumer, channel, make_delivery, monkeypatch, dlq):
+    monkeypatch.setattr(consumer, "message_retry_budget", RetryBudget("message", min_retries=0))
+    method, props = make_delivery(1)
+    consumer.handle_retry(channel, method, props, b"payload", 0, RuntimeError("down"))
+
+    (msg,) = channel.published
+    assert msg.exchange == "" and ".delay." in msg.routing_key
+    assert msg.properties.headers["x-retry-count"] == 0
+
+
+def test_max_retries_still_dead_letter(consumer, channel, make_delivery, dlq):
+    method, props = make_delivery(1)
+    consumer.handle_retry(channel, method, props, b"payload", consumer.MAX_RETRIES_PER_MESSAGE, RuntimeError("bad"))
+
+    (msg,) = channel.published
+    assert (msg.exchange, msg.routing_key) == ("dlx", "dead")
+    assert channel.acked == [1]
+
+
+def test_expired_deadline_dead_letters_even_during_an_outage(consumer, channel, make_delivery, monkeypatch, dlq):
+    monkeypatch.setattr(consumer, "any_circuit_open", lambda: True)
+    method, props = make_delivery(1)
+    consumer.handle_retry(channel, method, props, b"payload", 0, RuntimeError("down"), deadline_at=1.0)
+
+    (msg,) = channel.published
+    assert msg.exchange == "dlx"
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+
+class FakeProcess:
+    """A forked worker that dies after its planned lifetime (None = runs until terminated)."""
+
+    def __init__(self, clock, lifetime):
+        self.clock = clock
+        self.lifetime = lifetime
+        self.started_at = None
+        self.terminated = False
+        self.exitcode = None
+
+    def start(self):
+        self.started_at = self.clock.now
+
+    def is_alive(self):
+        if self.terminated:
+            return False
+        if self.lifetime is not None and self.clock.now - self.started_at >= self.lifetime:
+            self.exitcode = 1
+            return False
+        return True
+
+    def terminate(self):
+        self.terminated = True
+
+    def join(self, timeout=None):
+        pass
+
+
+@pytest.fixture
+def supervisor(consumer, monkeypatch):
+    """run_prefork with a fake clock, fork context and sanitizer; runs until `seconds` have passed."""
+    clock = Clock()
+    monkeypatch.setattr(consumer, "LogSanitizer", lambda: SimpleNamespace(sanitize=lambda text: text))
+    monkeypatch.setattr(consumer, "gc", SimpleNamespace(collect=lambda: 0, freeze=lambda: None, get_freeze_count=lambda: 0))
+    monkeypatch.setattr(consumer.signal, "signal", lambda signum, handler: None)
+    monkeypatch.setattr(consumer.time, "monotonic", lambda: clock.now)
+    monkeypatch.setattr(consumer, "decorrelated_jitter", lambda previous, base, cap: min(cap, max(base, previous) * 2))
+
+    def run(lifetimes, seconds):
+        spawned = []
+
+        def process(target, args, name):
+            index = args[0]
+            plan = lifetimes[index]
+            p = FakeProcess(clock, plan.pop(0) if plan else None)
+            spawned.append((clock.now, index, p))
+            return p
+
+        class Event:
+            def wait(self, timeout):
+                clock.now += timeout
+                return clock.now > seconds
+
+        monkeypatch.setattr(consumer.multiprocessing, "get_context", lambda method: SimpleNamespace(Process=process))
+        monkeypatch.setattr(consumer.threading, "Event", Event)
+        consumer.run_prefork(len(lifetimes))
+        return spawned
+
+    return run
+
+
+def test_crash_looping_worker_backs_off(supervisor):
+    spawned = supervisor([[None], [0, 0, 0, 0, 0]], seconds=120)
+
+    restarts = [at for at, index, _ in spawned if index == 1][1:]
+    # noticed on the next 1s poll, then restarted 4s, 8s, 16s, 32s later (not every 2s)
+    assert restarts == [5, 14, 31, 64]
+
+
+def test_healthy_worker_is_never_restarted(supervisor):
+    spawned = supervisor([[None], [None]], seconds=30)
+
+    assert len(spawned) == 2
+    assert all(p.terminated for _, _, p in spawned)  # stopped on shutdown
+
+
+def test_worker_that_ran_long_enough_restarts_quickly_again(consumer, supervisor):
+    # crashes fast a few times, then runs well past the healthy uptime before crashing again
+    spawned = supervisor([[1, 1, 1, consumer.PREFORK_HEALTHY_UPTIME_SECONDS + 5, None]], seconds=400)
+
+    starts = [at for at, _, _ in spawned]
+    # the crash at 96s after 65s up waits 4s again instead of the next 32s step
+    assert starts == [0, 5, 14, 31, 100]
+
+
+def test_restart_delay_is_capped(consumer):
+    assert consumer.prefork_restart_delay(10_000, uptime=0) <= consumer.PREFORK_RESTART_MAX_DELAY_SECONDS
+    assert consumer.prefork_restart_delay(10_000, uptime=consumer.PREFORK_HEALTHY_UPTIME_SECONDS) <= consumer.PREFORK_RESTART_DELAY_SECONDS * 3
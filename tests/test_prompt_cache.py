@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.genai")
+
+from src import promptcache
+from src.promptcache import PromptCache, UNAVAILABLE_COOLDOWN_SECONDS
+
+
+class FakeCaches:
+    """client.caches of google-genai: records create/update calls, can be told to fail."""
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.fail_create = None
+        self.fail_update = None
+
+    def create(self, model, config):
+        if self.fail_create:
+            raise self.fail_create
+        self.created.append((model, config))
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    def update(self, name, config):
+        if self.fail_update:
+            raise self.fail_update
+        self.updated.append((name, config))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(promptcache.time, "monotonic", lambda: clock.now)
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    cache = PromptCache("test-key", "gemini-2.0-flash", "You analyze integration errors.", ttl_seconds=600)
+    cache._client = SimpleNamespace(caches=FakeCaches())
+    return cache
+
+
+def test_first_call_creates_the_cached_content(cache):
+    assert cache.name() == "cachedContents/1"
+
+    (model, config), = cache._client.caches.created
+    assert model == "models/gemini-2.0-flash"
+    assert config.system_instruction == "You analyze integration errors."
+    assert config.ttl == "600s"
+
+
+def test_live_cache_is_reused(cache, clock):
+    cache.name()
+    clock.now += 400  # 200s left, above the 120s refresh margin
+
+    assert cache.name() == "cachedContents/1"
+    assert len(cache._client.caches.created) == 1 and cache._client.caches.updated == []
+
+
+def test_ttl_is_extended_shortly_before_expiry(cache, clock):
+    cache.name()
+    clock.now += 500  # 100s left
+
+    assert cache.name() == "cachedContents/1"
+    assert [name for name, _ in cache._client.caches.updated] == ["cachedContents/1"]
+    clock.now += 400  # 500s after the refresh: still live
+    assert cache.name() == "cachedContents/1"
+    assert len(cache._client.caches.created) == 1
+
+
+def test_failed_refresh_creates_a_new_cache(cache, clock):
+    cache.name()
+    clock.now += 500
+    cache._client.caches.fail_update = RuntimeError("404 not found")
+
+    assert cache.name() == "cachedContents/2"
+
+
+def test_expired_cache_is_recreated(cache, clock):
+    cache.name()
+    clock.now += 700
+
+    assert cache.name() == "cachedContents/2"
+    assert cache._client.caches.updated == []
+
+
+def test_unavailable_cache_falls_back_for_a_cool_down(cache, clock):
+    cache._client.caches.fail_create = RuntimeError("400 cached content is too small")
+
+    assert cache.name() is None
+    cache._client.caches.fail_create = None
+    clock.now += UNAVAILABLE_COOLDOWN_SECONDS - 1
+    assert cache.name() is None
+    clock.now += 1
+    assert cache.name() == "cachedContents/1"
+
+
+def test_invalidated_name_is_recreated(cache):
+    cache.invalidate(cache.name())
+
+    assert cache.name() == "cachedContents/2"
+
+
+def test_invalidating_a_stale_name_keeps_the_current_one(cache):
+    current = cache.name()
+    cache.invalidate("cachedContents/old")
+
+    assert cache.name() == current
+
+
+def test_without_the_sdk_the_full_prompt_is_sent(monkeypatch):
+    monkeypatch.setattr(promptcache, "genai", None)
+
+    assert PromptCache("test-key", "gemini-2.0-flash", "prompt").name() is None
@@ -0,0 +1,199 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src import ratelimit
+from src.embeddingmodel import GoogleGenAIEmbeddings
+from src.ratelimit import RateLimiter, RateLimitTimeout, _take
+
+
+class Clock:
+    """time.time / time.sleep stand-in: sleeping advances the clock instead of blocking."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "time", clock.time)
+    monkeypatch.setattr(ratelimit.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_take_grants_while_both_buckets_have_room():
+    wait, state = _take((60.0, 1000.0, 0.0), now=0.0, rpm=60, tpm=1000, tokens=400)
+
+    assert wait == 0.0
+    assert state == (59.0, 600.0, 0.0)
+
+
+def test_take_waits_for_the_scarcer_bucket():
+    # one request left but only 100 of 400 tokens: 300 tokens refill in 18s at 1000/min
+    wait, state = _take((1.0, 100.0, 0.0), now=0.0, rpm=60, tpm=1000, tokens=400)
+
+    assert wait == pytest.approx(18.0)
+    assert state == (1.0, 100.0, 0.0)  # nothing taken
+
+
+def test_take_refills_for_the_elapsed_time():
+    wait, state = _take((0.0, 0.0, 0.0), now=30.0, rpm=60, tpm=1000, tokens=400)
+
+    assert wait == 0.0
+    assert state == (29.0, 100.0, 30.0)
+
+
+def test_take_counts_every_request_of_a_batch():
+    wait, _ = _take((10.0, 0.0, 0.0), now=0.0, rpm=60, tpm=0, tokens=1, requests=20)
+
+    assert wait == pytest.approx(10.0)
+
+
+def test_oversized_requests_are_capped_at_the_bucket_capacity():
+    wait, state = _take((60.0, 1000.0, 0.0), now=0.0, rpm=60, tpm=1000, tokens=5000, requests=100)
+
+    assert wait == 0.0
+    assert state == (0.0, 0.0, 0.0)
+
+
+def test_local_limiter_spaces_out_a_burst(clock):
+    limiter = RateLimiter("test", rpm=2, mode="local")
+
+    for _ in range(3):
+        limiter.acquire()
+
+    assert clock.sleeps == [pytest.approx(30.0)]
+
+
+def test_off_mode_never_waits(clock):
+    limiter = RateLimiter("test", rpm=1, mode="off")
+
+    for _ in range(5):
+        limiter.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_wait_beyond_the_maximum_raises(clock):
+    limiter = RateLimiter("test", rpm=1, mode="local", max_wait_sec=10)
+    limiter.acquire()
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+
+class FakeRateLimitDB:
+    """One gemini_rate_limits row behind the DB / connection / cursor API the shared mode uses."""
+
+    def __init__(self, clock, row):
+        self.clock = clock
+        self.row = row
+        self.broken = False
+        self.closed = False
+        self.conn = self
+
+    def execute(self, sql, params=None):
+        pass  # table bootstrap
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        if self.broken:
+            raise ConnectionError("server closed the connection")
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.db.broken:
+            raise ConnectionError("server closed the connection")
+        if sql.startswith("SELECT request_level"):
+            self.result = self.db.row
+        elif sql.startswith("SELECT EXTRACT"):
+            self.result = (self.db.clock.now,)
+        else:
+            self.db.row = params[:3]
+
+    def fetchone(self):
+        return self.result
+
+
+@pytest.fixture
+def shared_db(monkeypatch, clock):
+    databases = []
+
+    def open_db():
+        # a new connection sees the row the previous one left behind
+        db = FakeRateLimitDB(clock, databases[-1].row if databases else (2.0, 0.0, clock.now))
+        databases.append(db)
+        return db
+
+    monkeypatch.setattr(ratelimit, "DB", open_db)
+    return databases
+
+
+def test_shared_limiter_reuses_one_connection(shared_db, clock):
+    limiter = RateLimiter("gemini:test", rpm=2, mode="postgres")
+
+    for _ in range(4):
+        limiter.acquire()
+
+    assert len(shared_db) == 1
+    assert clock.sleeps  # the third request had to wait for the shared bucket
+    assert shared_db[0].row[0] == pytest.approx(0.0)
+
+
+def test_shared_limiter_reconnects_after_a_broken_connection(shared_db, clock):
+    limiter = RateLimiter("gemini:test", rpm=60, mode="postgres")
+    limiter.acquire()
+    shared_db[0].broken = True
+
+    with pytest.raises(ConnectionError):
+        limiter.acquire()
+    limiter.acquire()
+
+    assert shared_db[0].closed
+    assert len(shared_db) == 2
+
+
+def test_embedding_batch_counts_each_input_against_rpm():
+    calls = []
+    embeddings = object.__new__(GoogleGenAIEmbeddings)
+    embeddings.model = "text-embedding-004"
+    embeddings.output_dimensionality = 768
+    embeddings.rate_limiter = SimpleNamespace(acquire=lambda tokens, requests=1: calls.append(requests))
+    embeddings.client = SimpleNamespace(models=SimpleNamespace(
+        embed_content=lambda model, contents, config: SimpleNamespace(
+            embeddings=[SimpleNamespace(values=[0.0]) for _ in contents]
+        )
+    ))
+
+    embeddings.embed_documents(["text"] * 150)
+
+    assert calls == [100, 50]
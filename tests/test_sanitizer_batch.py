@@ -0,0 +1,95 @@
+import os
+import threading
+
+import pytest
+
+from src import maskdata
+from src.config import Config
+
+TEXTS = [
+    "NullPointerException at OrderService.java:42",
+    "login failed for john.doe@example.com from 10.1.2.3",
+    "",
+    "password='hunter2!' rejected by auth",
+    "NullPointerException at OrderService.java:42",
+    "Timeout calling https://billing.internal/api/v2/charge",
+]
+
+
+@pytest.fixture
+def sanitizer(make_sanitizer, monkeypatch):
+    monkeypatch.setattr(Config, "SANITIZER_MAX_INPUT_BYTES", 0)
+    return make_sanitizer()
+
+
+def test_batch_matches_one_by_one_in_input_order(sanitizer, make_sanitizer):
+    one_by_one = make_sanitizer()
+
+    assert sanitizer.sanitize_many(TEXTS, batch_size=2) == [one_by_one.sanitize(text) for text in TEXTS]
+
+
+def test_batch_masks_what_it_analyzes(sanitizer):
+    masked = sanitizer.sanitize_many(TEXTS)
+
+    assert "john.doe@example.com" not in masked[1] and "<EMAIL_ADDRESS>" in masked[1]
+    assert "hunter2" not in masked[3]
+    assert masked[0] == TEXTS[0] and masked[2] == ""
+
+
+def test_batch_sends_only_uncached_candidates_to_presidio(make_sanitizer, monkeypatch):
+    monkeypatch.setattr(Config, "SANITIZER_MAX_INPUT_BYTES", 0)
+    sanitizer = make_sanitizer(cache_enabled=True, ner_policy="auto")
+    batches = []
+    analyze_many = sanitizer._analyze_many
+    monkeypatch.setattr(sanitizer, "_analyze_many", lambda texts, batch_size=None: batches.append(texts) or analyze_many(texts, batch_size))
+
+    sanitizer.sanitize_many(TEXTS)
+    sanitizer.sanitize_many(TEXTS)
+
+    assert len(batches) == 1
+    assert TEXTS[1] in batches[0] and TEXTS[3] in batches[0]
+    assert "" not in batches[0]
+
+
+def test_counters_add_up_across_threads(sanitizer):
+    texts = ["OrderService failed with code 42"] * 50
+
+    threads = [threading.Thread(target=sanitizer.sanitize_many, args=(texts,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = sanitizer.cache_stats()
+    assert stats["skipped"] + stats["analyzed"] == 400
+
+
+class UpperSanitizer:
+    """Stands in for LogSanitizer in pool workers: no model load, tags each text with the worker pid."""
+
+    def sanitize_many(self, texts):
+        return [f"{text.upper()}@{os.getpid()}" for text in texts]
+
+
+def test_pool_keeps_input_order_across_workers(monkeypatch):
+    # workers fork with the patched class, so none of them loads Presidio
+    monkeypatch.setattr(maskdata, "LogSanitizer", UpperSanitizer)
+    pool = maskdata.SanitizerPool(processes=2, batch_size=3)
+    texts = [f"error {i}" for i in range(10)]
+    try:
+        output = pool.sanitize_many(texts)
+    finally:
+        pool.shutdown()
+
+    assert [text.split("@")[0] for text in output] == [text.upper() for text in texts]
+    assert all(int(text.split("@")[1]) != os.getpid() for text in output)
+
+
+def test_pool_sends_batch_sized_chunks(monkeypatch):
+    chunks = []
+    pool = maskdata.SanitizerPool.__new__(maskdata.SanitizerPool)
+    pool.batch_size = 4
+    pool.executor = type("Executor", (), {"map": lambda self, fn, items: [chunks.append(c) or c for c in items]})()
+
+    assert pool.sanitize_many(list("abcdefghij")) == list("abcdefghij")
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
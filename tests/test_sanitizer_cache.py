@@ -0,0 +1,103 @@
+import pytest
+
+from src.config import Config
+from src.maskdata import ByteLRU, split_template
+
+
+def test_lru_evicts_least_recently_used_by_bytes():
+    lru = ByteLRU(max_bytes=100)
+    lru.put(b"a", "A", 40)
+    lru.put(b"b", "B", 40)
+    lru.get(b"a")
+    lru.put(b"c", "C", 40)
+
+    assert lru.get(b"b") is None
+    assert lru.get(b"a") == "A" and lru.get(b"c") == "C"
+    assert lru.stats()["bytes"] == 80
+
+
+def test_lru_skips_entries_larger_than_the_bound():
+    lru = ByteLRU(max_bytes=100)
+    lru.put(b"a", "A", 40)
+    lru.put(b"huge", "H", 101)
+
+    assert lru.get(b"huge") is None
+    assert lru.get(b"a") == "A"
+
+
+def test_lru_replacing_a_key_reaccounts_its_size():
+    lru = ByteLRU(max_bytes=100)
+    lru.put(b"a", "A", 40)
+    lru.put(b"a", "A2", 10)
+
+    assert lru.stats()["bytes"] == 10 and lru.stats()["entries"] == 1
+
+
+def test_lru_hit_rate():
+    lru = ByteLRU(max_bytes=100)
+    lru.put(b"a", "A", 1)
+    lru.get(b"a")
+    lru.get(b"missing")
+
+    assert lru.stats()["hit_rate"] == 0.5
+
+
+def test_messages_differing_only_in_variables_share_a_template():
+    first, first_windows = split_template("Order 1234 failed for user=alice on node 10.0.0.7")
+    second, _ = split_template("Order 98765 failed for user=alice on node 10.0.0.9")
+    other, _ = split_template("Payment 1234 failed for user=alice on node 10.0.0.7")
+
+    assert first == second != other
+    assert first_windows  # the ids and the address are re-analyzed
+
+
+@pytest.fixture
+def cached_sanitizer(make_sanitizer, monkeypatch):
+    monkeypatch.setattr(Config, "SANITIZER_MAX_INPUT_BYTES", 0)
+    monkeypatch.setattr(Config, "SANITIZER_TEMPLATE_CACHE", True)
+    return make_sanitizer(cache_enabled=True)
+
+
+def count_analyzer_calls(sanitizer, monkeypatch):
+    calls = []
+    analyze, analyze_many = sanitizer.analyzer.analyze, sanitizer._analyze_many
+    monkeypatch.setattr(sanitizer.analyzer, "analyze", lambda **kwargs: calls.append(kwargs["text"]) or analyze(**kwargs))
+    monkeypatch.setattr(sanitizer, "_analyze_many", lambda texts, batch_size=None: calls.extend(texts) or analyze_many(texts, batch_size))
+    return calls
+
+
+def test_exact_repeat_is_served_from_the_cache(cached_sanitizer, monkeypatch):
+    calls = count_analyzer_calls(cached_sanitizer, monkeypatch)
+    text = "login failed for john.doe@example.com"
+
+    first = cached_sanitizer.sanitize(text)
+    second = cached_sanitizer.sanitize(text)
+
+    assert first == second and "<EMAIL_ADDRESS>" in first
+    assert calls == [text]
+    assert cached_sanitizer.cache_stats()["exact"]["hits"] == 1
+
+
+def test_template_hit_only_analyzes_the_variable_windows(cached_sanitizer, make_sanitizer, monkeypatch):
+    template = "Authentication for admin@example.com failed after {} attempts from 10.0.0.{}"
+    cached_sanitizer.sanitize(template.format(3, 7))
+    calls = count_analyzer_calls(cached_sanitizer, monkeypatch)
+    text = template.format(5, 9)
+
+    masked = cached_sanitizer.sanitize(text)
+
+    assert masked == make_sanitizer().sanitize(text)
+    assert calls and all(len(window) < len(text) / 2 for window in calls)
+    assert cached_sanitizer.cache_stats()["template"]["hits"] == 1
+
+
+def test_cache_switch_off_analyzes_every_time(make_sanitizer, monkeypatch):
+    sanitizer = make_sanitizer(cache_enabled=False)
+    calls = count_analyzer_calls(sanitizer, monkeypatch)
+    text = "login failed for john.doe@example.com"
+
+    sanitizer.sanitize(text)
+    sanitizer.sanitize(text)
+
+    assert calls == [text, text]
+    assert sanitizer.cache_stats()["exact"]["entries"] == 0
@@ -0,0 +1,49 @@
+import contextlib
+import json
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def message(consumer, monkeypatch):
+    consumer.services.incoming_payload = {"applicationName": "orders", "code": "E42", "description": "boom"}
+    consumer.services.error_ts_str = "2026-01-01 00:00:00"
+    monkeypatch.setattr(consumer, "SINGLE_FLIGHT_CROSS_PROCESS", True)
+    monkeypatch.setattr(consumer, "advisory_lock", lambda *a, **k: contextlib.nullcontext())
+    monkeypatch.setattr(consumer, "db_insert", lambda llmresponse: 99)
+    yield consumer.services
+    consumer.services.incoming_payload = None
+
+
+def test_recent_solution_window_is_a_bound_parameter(consumer, message, monkeypatch):
+    calls = []
+
+    def db_execute(sql, params=(), fetch=False):
+        calls.append((sql, params))
+        return [{"llm_solution": json.dumps({"rootCause": "x"})}]
+
+    monkeypatch.setattr(message, "db_execute", db_execute)
+    assert consumer.find_recent_llm_solution() == {"rootCause": "x"}
+    sql, params = calls[0]
+    assert "%s * INTERVAL '1 minute'" in sql
+    assert "'%s" not in sql
+    assert sql.count("%s") == len(params)
+
+
+def test_reused_answer_carries_the_confirmed_solutions(consumer, message, monkeypatch):
+    reused = {"rootCause": "x", "solution1": {"instructions": "y"}}
+    points = [SimpleNamespace(score=0.9, payload={"solution": "restart the pool"})]
+    monkeypatch.setattr(consumer, "find_recent_llm_solution", lambda: reused)
+    monkeypatch.setattr(consumer, "generate_solution", lambda vector_points=None: pytest.fail("regenerated"))
+
+    llmresponse, solutions, new_id = consumer.generate_and_store(points)
+
+    assert llmresponse is reused and new_id == 99
+    assert solutions == consumer.extract_solutions_from_points(points)
+
+
+def test_reused_answer_without_vector_match_has_no_confirmed_solutions(consumer, message, monkeypatch):
+    monkeypatch.setattr(consumer, "find_recent_llm_solution", lambda: {"rootCause": "x"})
+    _, solutions, _ = consumer.generate_and_store([SimpleNamespace(score=0.5, payload={"solution": "s"})])
+    assert solutions is None
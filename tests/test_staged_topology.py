@@ -0,0 +1,125 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src import envelope
+from src.config import Config
+
+
+def body(description="Connection to db-1 refused"):
+    return json.dumps({"applicationName": "orders", "code": "E42", "description": description, "timestamp": 0}).encode()
+
+
+class Masker:
+    def sanitize(self, text):
+        return text.replace("db-1", "<HOST>")
+
+
+@pytest.fixture
+def pipeline(consumer, monkeypatch):
+    """Stage handlers with their side effects recorded instead of calling Qdrant, Gemini, Postgres or SMTP."""
+    calls = {"generated": [], "inserted": [], "emailed": []}
+    monkeypatch.setattr(consumer.services, "sanitizer", Masker())
+    monkeypatch.setattr(consumer, "any_circuit_open", lambda: False)
+    monkeypatch.setattr(consumer, "SINGLE_FLIGHT_ENABLED", False)
+    monkeypatch.setattr(consumer, "claim_message", lambda: True)
+    monkeypatch.setattr(consumer, "find_verified_solution", lambda: None)
+    monkeypatch.setattr(consumer, "search_vectors", lambda: [])
+
+    def generate(points):
+        calls["generated"].append((consumer.services.incoming_payload["description"], consumer.services.masked_errordescription))
+        return {"rootCause": "db down"}, None
+
+    monkeypatch.setattr(consumer, "generate_solution", generate)
+    monkeypatch.setattr(consumer, "db_insert", lambda llmresponse: calls["inserted"].append(llmresponse) or 7)
+    monkeypatch.setattr(consumer, "schedule_enrichment", lambda *a: None)
+    monkeypatch.setattr(consumer, "send_formatted_email", lambda payload, template: calls["emailed"].append(template))
+    monkeypatch.setattr(consumer, "build_email_payload", lambda llmresponse, new_id, solutions: {"id": new_id})
+    return calls
+
+
+def run_stages(consumer, channel, make_delivery):
+    """Feed each published hand-off to the stage reading its queue until the message finishes."""
+    queues = {consumer.stage_queue(stage): stage for stage in consumer.STAGES}
+    method, props = make_delivery(1)
+    consumer.stage_callback("sanitize", channel, method, props, body())
+    seen = 0
+    while seen < len(channel.published):
+        msg = channel.published[seen]
+        seen += 1
+        if msg.routing_key in queues:
+            method, _ = make_delivery(seen + 1, queue=msg.routing_key)
+            consumer.stage_callback(queues[msg.routing_key], channel, method, msg.properties, msg.body)
+    return [msg for msg in channel.published if msg.routing_key in queues]
+
+
+def test_message_flows_through_every_stage(consumer, channel, make_delivery, pipeline):
+    handoffs = run_stages(consumer, channel, make_delivery)
+
+    assert [msg.routing_key.rsplit(".", 1)[-1] for msg in handoffs] == ["retrieve", "generate", "persist", "notify"]
+    assert pipeline["generated"] == [("Connection to db-1 refused", "Connection to <HOST> refused")]
+    assert pipeline["inserted"] == [{"rootCause": "db down"}]
+    assert pipeline["emailed"] == ["email-main-ui.html"]
+    assert len(channel.acked) == 5
+
+
+def test_handoffs_use_the_compressed_envelope(consumer, channel, make_delivery, pipeline, monkeypatch):
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESSION", "gzip")
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESS_MIN_BYTES", 1)
+
+    handoffs = run_stages(consumer, channel, make_delivery)
+
+    assert all(msg.properties.content_encoding == "gzip" for msg in handoffs)
+    assert all(msg.properties.headers[envelope.ENVELOPE_HEADER] == envelope.ENVELOPE_VERSION for msg in handoffs)
+    assert all(b"db-1" not in msg.body for msg in handoffs)
+    assert pipeline["emailed"] == ["email-main-ui.html"]
+
+
+def test_large_descriptions_travel_as_claim_checks(consumer, channel, make_delivery, pipeline, monkeypatch):
+    blobs = {}
+
+    def store(text):
+        blobs[f"blob-{len(blobs)}"] = text
+        return f"blob-{len(blobs) - 1}"
+
+    monkeypatch.setattr(Config, "CLAIM_CHECK_THRESHOLD_BYTES", 10)
+    monkeypatch.setattr(envelope, "store_blob", store)
+    monkeypatch.setattr(envelope, "load_blob", blobs.__getitem__)
+
+    handoffs = run_stages(consumer, channel, make_delivery)
+
+    assert all(b"refused" not in msg.body for msg in handoffs)
+    assert len(blobs) == 2  # raw and masked description, parked once and not again on later hops
+    assert pipeline["generated"] == [("Connection to db-1 refused", "Connection to <HOST> refused")]
+
+
+def test_degraded_requeue_carries_its_own_encoding(consumer, channel, make_delivery, pipeline, monkeypatch):
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESSION", "gzip")
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESS_MIN_BYTES", 1)
+    monkeypatch.setattr(consumer, "OVERLOAD_REQUEUE_FULL_ANALYSIS", True)
+    monkeypatch.setattr(consumer, "backlog_monitor", SimpleNamespace(enabled=True, is_overloaded=lambda enqueued_at: True))
+    monkeypatch.setattr(consumer, "find_degraded_solution", lambda points: ({"rootCause": "cached"}, None))
+
+    run_stages(consumer, channel, make_delivery)
+
+    (requeued,) = [msg for msg in channel.published if msg.routing_key == consumer.consumer_queue()]
+    payload = envelope.decode(requeued.body, requeued.properties.content_encoding)
+    assert payload["description"] == "Connection to db-1 refused"
+    assert requeued.properties.headers["x-full-analysis"] is True
+
+
+def test_parse_stage_workers(consumer):
+    workers = consumer.parse_stage_workers("sanitize=2, generate=8,bogus=3,persist")
+
+    assert workers == {"sanitize": 2, "retrieve": 1, "generate": 8, "persist": 1, "notify": 1}
+
+
+def test_delay_queues_are_declared_on_every_new_channel(consumer):
+    from conftest import FakeChannel
+
+    first, second = FakeChannel(), FakeChannel()
+    for ch in (first, first, second):
+        consumer.delay_queue(ch, "elk_errors_queue", 10)
+
+    assert list(first.declared) == list(second.declared) == ["elk_errors_queue.delay.10s"]